@@ -0,0 +1,31 @@
+import argparse
+import importlib
+
+from benchmarks import suite
+from benchmarks.common import WORKLOADS
+
+parser = argparse.ArgumentParser(
+    prog="python -m benchmarks",
+    description="Runs the benchmark suite, or the given benchmark modules.",
+)
+parser.add_argument("modules", nargs="*", help="e.g. get_branch serialization")
+parser.add_argument(
+    "--sizes",
+    type=lambda value: [int(size) for size in value.split(",")],
+    default=suite.SIZES,
+    help="amendments per contract, comma separated (suite only)",
+)
+parser.add_argument(
+    "--workloads",
+    type=lambda value: value.split(","),
+    default=list(WORKLOADS),
+    help="any of %s, comma separated (suite only)" % ", ".join(WORKLOADS),
+)
+parser.add_argument("--output", help="write suite results as JSON to this file")
+args = parser.parse_args()
+
+if args.modules:
+    for name in args.modules:
+        importlib.import_module("benchmarks.%s" % name).main()
+else:
+    suite.main(args.sizes, args.workloads, args.output)
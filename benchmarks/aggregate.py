@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+from benchmarks.common import build_contract, measure, report, timestamps
+from pcontract.data import Contract
+
+
+def walk(contract: Contract, start: datetime, days: int) -> float:
+    # Sums the field day by day, as callers used to.
+    return sum(
+        contract.resolve(branch).get("eggs_per_day", 0)
+        for branch in contract.get_branches(
+            at=[start + timedelta(days=n) for n in range(days)]
+        )
+        if branch is not None
+    )
+
+
+def cold(contract: Contract, start: datetime, end: datetime) -> None:
+    # First query, the cache is built along.
+    contract._series.clear()
+    contract.aggregate("eggs_per_day", start_at=start, end_at=end)
+
+
+def main() -> None:
+    rows = []
+    queries = 100
+    for amendments in (1_000, 10_000, 100_000):
+        contract = build_contract(amendments)
+        windows = [
+            (at, at + timedelta(days=120))
+            for at in timestamps(contract, queries, seed=1)
+        ]
+
+        first = measure(lambda: cold(contract, *windows[0]), repeat=1)
+        walked = measure(lambda: walk(contract, windows[0][0], 120))
+        aggregated = measure(
+            lambda: [
+                contract.aggregate("eggs_per_day", start_at=start, end_at=end)
+                for start, end in windows
+            ]
+        )
+        rows.append((len(contract._active), walked, first, aggregated / queries))
+
+    report(
+        "Aggregating over a 120 days window, seconds",
+        rows,
+        ("active", "walk days", "first query", "aggregate"),
+    )
+
+    # After a branch, only the part of the cache past it is rebuilt.
+    rows = []
+    for amendments in (1_000, 10_000, 100_000):
+        contract = build_contract(amendments)
+        start, end = timestamps(contract, 2, seed=2)
+        start, end = min(start, end), max(start, end)
+        contract.aggregate("eggs_per_day", start_at=start, end_at=end)
+
+        def amend() -> None:
+            for n, at in enumerate(timestamps(contract, 20, seed=3)):
+                contract.branch(
+                    {"eggs_per_day": n}, start_at=at, end_at=at + timedelta(days=1)
+                )
+                contract.aggregate("eggs_per_day", start_at=start, end_at=end)
+
+        rows.append((len(contract._active), measure(amend, repeat=1) / 20))
+
+    report(
+        "Branch followed by an aggregate, seconds",
+        rows,
+        ("active", "per branch"),
+    )
+
+
+if __name__ == "__main__":
+    main()
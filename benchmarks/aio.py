@@ -0,0 +1,121 @@
+import asyncio
+import os
+import tempfile
+from typing import Any, AsyncIterator, Callable
+
+import mongomock
+
+from benchmarks.common import build_contract, measure, report
+from pcontract.backends.file import afile, file
+from pcontract.backends.mongo import amongo
+from pcontract.serialization import to_json
+
+LATENCY = 0.002
+
+
+class Cursor:
+    def __init__(self, cursor: Any) -> None:
+        self.cursor = cursor
+
+    def batch_size(self, size: int) -> "Cursor":
+        self.cursor.batch_size(size)
+        return self
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        await asyncio.sleep(LATENCY)
+        for document in self.cursor:
+            yield document
+
+
+class Collection:
+    # mongomock collection answering after a network round trip.
+    def __init__(self, collection: Any) -> None:
+        self.collection = collection
+
+    def find(self, *args: Any, **kwargs: Any) -> Cursor:
+        return Cursor(self.collection.find(*args, **kwargs))
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        method = getattr(self.collection, name)
+
+        async def call(*args: Any, **kwargs: Any) -> Any:
+            await asyncio.sleep(LATENCY)
+            return method(*args, **kwargs)
+
+        return call
+
+
+def main() -> None:
+    rows = []
+    for count in (10, 100, 1_000):
+        collection = Collection(mongomock.MongoClient().db.contracts)
+        contracts = [build_contract(10, seed=seed) for seed in range(count)]
+        uuids = [contract.uuid for contract in contracts]
+        backend = amongo(collection)
+        asyncio.run(backend.commit_many(contracts))
+
+        async def sequential() -> None:
+            for uid in uuids:
+                await backend.load(uid)
+
+        async def concurrent() -> None:
+            await asyncio.gather(*(backend.load(uid) for uid in uuids))
+
+        async def many() -> None:
+            async for _ in backend.load_many(uuids):
+                pass
+
+        rows.append(
+            (
+                count,
+                measure(lambda: asyncio.run(sequential()), repeat=1),
+                measure(lambda: asyncio.run(concurrent()), repeat=1),
+                measure(lambda: asyncio.run(many()), repeat=1),
+            )
+        )
+
+    report(
+        "Loading contracts from MongoDB, %gms round trips, seconds" % (LATENCY * 1000),
+        rows,
+        ("contracts", "sequential", "gather", "load_many"),
+    )
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for count in (10, 100, 1_000):
+            filenames = []
+            for seed in range(count):
+                contract = build_contract(100, seed=seed)
+                filenames.append(os.path.join(directory, contract.uuid))
+                with open(filenames[-1], "w") as f:
+                    f.write(to_json(contract))
+
+            def blocking() -> None:
+                for filename in filenames:
+                    with file(filename):
+                        pass
+
+            async def open_file(filename: str) -> None:
+                async with afile(filename):
+                    pass
+
+            async def concurrent() -> None:
+                await asyncio.gather(*(open_file(name) for name in filenames))
+
+            rows.append(
+                (
+                    count,
+                    measure(blocking, repeat=1),
+                    measure(lambda: asyncio.run(concurrent()), repeat=1),
+                )
+            )
+
+    report(
+        "Loading and writing back contract files, seconds",
+        rows,
+        ("contracts", "file", "afile gather"),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import os
+import tempfile
+
+from benchmarks.common import build_contract, measure, report, timestamps
+from pcontract.backends.file import FileBackend
+from pcontract.binary import from_bytes, mapped, to_bytes
+from pcontract.serialization import from_json, to_json
+
+
+def main() -> None:
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for amendments in (1_000, 10_000, 100_000):
+            contract = build_contract(amendments)
+            (at,) = timestamps(contract, 1)
+
+            json_file = os.path.join(directory, "contract.json")
+            binary_file = os.path.join(directory, "contract.bin")
+            with open(json_file, "w") as f:
+                f.write(to_json(contract))
+            with open(binary_file, "wb") as f:
+                f.write(to_bytes(contract))
+
+            def json_lookup() -> None:
+                with open(json_file) as f:
+                    from_json(f.read()).get_branch(at=at)
+
+            def binary_lookup() -> None:
+                with open(binary_file, "rb") as f:
+                    from_bytes(f.read()).get_branch(at=at)
+
+            def backend_lookup() -> None:
+                backend = FileBackend(binary_file, "binary")
+                backend.load()
+                assert backend._contract
+                backend._contract.get_branch(at=at)
+
+            def mapped_lookup() -> None:
+                with mapped(binary_file) as view:
+                    view.get_branch(at=at)
+
+            rows.append(
+                (
+                    len(contract),
+                    measure(json_lookup, repeat=1),
+                    measure(binary_lookup, repeat=1),
+                    measure(backend_lookup, repeat=1),
+                    measure(mapped_lookup),
+                    os.path.getsize(json_file) // 1024,
+                    os.path.getsize(binary_file) // 1024,
+                )
+            )
+
+    report(
+        "Opening a contract file and finding one branch, seconds",
+        rows,
+        (
+            "branches",
+            "json",
+            "binary",
+            "backend",
+            "mapped",
+            "json KiB",
+            "binary KiB",
+        ),
+    )
+
+
+if __name__ == "__main__":
+    main()
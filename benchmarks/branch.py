@@ -0,0 +1,18 @@
+from benchmarks.common import build_contract, measure, report
+
+
+def main() -> None:
+    rows = []
+    for amendments in (1_000, 10_000, 100_000):
+        elapsed = measure(lambda: build_contract(amendments), repeat=1)
+        rows.append((amendments, elapsed, elapsed / amendments))
+
+    report(
+        "Building a contract from amendments, seconds",
+        rows,
+        ("amendments", "total", "per branch()"),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import random
+from datetime import datetime, timedelta
+from typing import Any
+
+from benchmarks.common import START, measure, report
+from pcontract.data import Contract
+
+
+Feed = list[tuple[dict[str, Any], datetime, datetime]]
+
+
+def amendments(count: int, *, seed: int = 0) -> Feed:
+    # A feed of consecutive, non overlapping amendments.
+    rnd = random.Random(seed)
+    feed: Feed = []
+    cursor = START
+    for n in range(count):
+        start_at = cursor + timedelta(hours=rnd.randint(0, 48))
+        end_at = start_at + timedelta(hours=rnd.randint(1, 96))
+        feed.append(({"eggs_per_day": n}, start_at, end_at))
+        cursor = end_at
+    return feed
+
+
+def fresh() -> Contract:
+    return Contract.init(
+        start_at=START,
+        end_at=START + timedelta(days=365 * 1000),
+        data={"eggs_per_day": 10},
+    )
+
+
+def one_by_one(feed: Feed) -> Contract:
+    contract = fresh()
+    for data, start_at, end_at in feed:
+        contract.branch(data, start_at=start_at, end_at=end_at)
+    return contract
+
+
+def batched(feed: Feed) -> Contract:
+    contract = fresh()
+    contract.branch_many(feed)
+    return contract
+
+
+def main() -> None:
+    rows = []
+    for count in (1_000, 10_000, 50_000):
+        feed = amendments(count)
+        sequential = measure(lambda: one_by_one(feed), repeat=1)
+        batch = measure(lambda: batched(feed), repeat=1)
+        rows.append(
+            (count, sequential, batch, len(one_by_one(feed)), len(batched(feed)))
+        )
+
+    report(
+        "Applying an amendment feed, seconds",
+        rows,
+        ("amendments", "branch()", "branch_many()", "branches", "branches (many)"),
+    )
+
+
+if __name__ == "__main__":
+    main()
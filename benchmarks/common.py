@@ -0,0 +1,119 @@
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Type
+
+from pcontract.data import Branch, Contract, utc
+
+START = datetime(2022, 1, 1, tzinfo=utc)
+
+
+def build_contract(
+    amendments: int, *, seed: int = 0, klass: Type[Branch] = Branch
+) -> Contract:
+    # Transient amendments scattered over a contract that is
+    # occasionally extended, every amendment replaces some history.
+    rnd = random.Random(seed)
+    contract = Contract.init(
+        start_at=START,
+        end_at=START + timedelta(days=365),
+        data={"eggs_per_day": 10},
+    )
+    contract.klass = klass
+    end = START + timedelta(days=365)
+
+    for n in range(amendments):
+        if rnd.random() < 0.1:
+            start_at, end_at = end, end + timedelta(days=rnd.randint(1, 30))
+            end = end_at
+        else:
+            offset = rnd.random() * (end - START).total_seconds()
+            start_at = START + timedelta(seconds=offset)
+            end_at = min(end, start_at + timedelta(days=rnd.randint(1, 30)))
+        contract.branch({"eggs_per_day": n}, start_at=start_at, end_at=end_at)
+    return contract
+
+
+def build_append_only(
+    amendments: int, *, seed: int = 0, klass: Type[Branch] = Branch
+) -> Contract:
+    # Every amendment takes over from some point of the last branch to the
+    # end, moving the end of the contract forward.
+    rnd = random.Random(seed)
+    contract = Contract.init(
+        start_at=START,
+        end_at=START + timedelta(days=1),
+        data={"eggs_per_day": 10},
+    )
+    contract.klass = klass
+
+    for n in range(amendments):
+        last = contract.get_branch(at=contract._max_end - timedelta(microseconds=1))
+        assert last is not None
+        start_at = last.start_at + (last.end_at - last.start_at) * rnd.random()  # type: ignore[operator]
+        contract.branch(
+            {"eggs_per_day": n},
+            start_at=start_at,
+            end_at=contract._max_end + timedelta(hours=rnd.randint(1, 48)),
+        )
+    return contract
+
+
+def build_nested(
+    amendments: int, *, seed: int = 0, klass: Type[Branch] = Branch
+) -> Contract:
+    # Transient amendments nested into the previous ones, each covering
+    # part of the one before, down to a few levels before starting over
+    # somewhere else.
+    rnd = random.Random(seed)
+    end = START + timedelta(days=365)
+    contract = Contract.init(start_at=START, end_at=end, data={"eggs_per_day": 10})
+    contract.klass = klass
+    start_at, end_at = START, end
+
+    for n in range(amendments):
+        if n % 8 == 0:
+            start_at = START + timedelta(seconds=rnd.random() * 364 * 86400)
+            end_at = min(end, start_at + timedelta(days=rnd.randint(8, 60)))
+
+        span = end_at - start_at
+        start_at += span * rnd.random() / 4
+        end_at -= span * rnd.random() / 4
+        contract.branch({"eggs_per_day": n}, start_at=start_at, end_at=end_at)
+    return contract
+
+
+WORKLOADS: dict[str, Callable[..., Contract]] = {
+    "random": build_contract,
+    "append": build_append_only,
+    "nested": build_nested,
+}
+
+
+def timestamps(contract: Contract, count: int, *, seed: int = 0) -> list[datetime]:
+    rnd = random.Random(seed)
+    start = contract[0].start_at
+    total = (max(b.end_at for b in contract.items) - start).total_seconds()
+    return [start + timedelta(seconds=rnd.random() * total) for _ in range(count)]
+
+
+def measure(fn: Callable[[], Any], *, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        began = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - began)
+    return best
+
+
+def report(title: str, rows: list[tuple[Any, ...]], header: tuple[str, ...]) -> None:
+    print(title)
+    print("  ".join("%14s" % column for column in header))
+    for row in rows:
+        print(
+            "  ".join(
+                "%14.4g" % value if isinstance(value, float) else "%14s" % value
+                for value in row
+            )
+        )
+    print()
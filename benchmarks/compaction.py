@@ -0,0 +1,82 @@
+from benchmarks.common import build_contract, measure, report, timestamps
+from benchmarks.memory import traced
+from pcontract.data import Contract
+from pcontract.portfolio import active_span
+from pcontract.serialization import from_json, to_json
+
+
+def compacted(amendments: int) -> Contract:
+    contract = build_contract(amendments)
+    contract.compact()
+    return contract
+
+
+def main() -> None:
+    rows = []
+    for amendments in (1_000, 10_000, 100_000):
+        before, contract = traced(lambda: build_contract(amendments))
+        after, compact = traced(lambda: compacted(amendments))
+        mb = 1024 * 1024
+        rows.append((len(contract), len(compact), before / mb, after / mb))
+
+    report(
+        "Branches kept and memory held, MiB (tracemalloc)",
+        rows,
+        ("branches", "compacted", "before", "after"),
+    )
+
+    rows = []
+    for amendments in (1_000, 10_000, 100_000):
+        contract = build_contract(amendments)
+        snapshot = to_json(contract)
+        compact = from_json(snapshot)
+        elapsed = measure(compact.compact, repeat=1)
+        rows.append(
+            (
+                len(contract),
+                elapsed,
+                len(snapshot) / 1024,
+                len(to_json(compact)) / 1024,
+            )
+        )
+
+    report(
+        "Compacting, seconds, and size of the JSON snapshot, KiB",
+        rows,
+        ("branches", "compact()", "before", "after"),
+    )
+
+    rows = []
+    for amendments in (1_000, 10_000, 100_000):
+        contract = build_contract(amendments)
+        compact = compacted(amendments)
+        points = timestamps(contract, 1_000)
+        rows.append(
+            (
+                len(contract),
+                measure(lambda: active_span(contract)),
+                measure(lambda: active_span(compact)),
+                measure(lambda: contract.get_branches(at=points, resolve=True)),
+                measure(lambda: compact.get_branches(at=points, resolve=True)),
+                measure(lambda: to_json(contract), repeat=1),
+                measure(lambda: to_json(compact), repeat=1),
+            )
+        )
+
+    report(
+        "Scans over history, seconds",
+        rows,
+        (
+            "branches",
+            "span",
+            "span compacted",
+            "resolve",
+            "resolve compact",
+            "to_json",
+            "to_json compact",
+        ),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import uuid
+from datetime import datetime, timedelta
+from typing import Any
+
+from benchmarks.common import START, build_contract, measure, report
+from pcontract.data import Branch, new_uuid, utc
+
+
+class InitBranch(Branch):
+    # Goes through __init__ for every branch, as all branches used to.
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+
+
+def main() -> None:
+    count = 100_000
+    end = START + timedelta(days=1)
+    now = datetime.now(tz=utc)
+
+    rows = [
+        ("uuid4().hex", measure(lambda: [uuid.uuid4().hex for _ in range(count)])),
+        ("new_uuid()", measure(lambda: [new_uuid() for _ in range(count)])),
+        (
+            "Branch()",
+            measure(
+                lambda: [
+                    Branch(data={}, start_at=START, end_at=end) for _ in range(count)
+                ]
+            ),
+        ),
+        (
+            "Branch.create()",
+            measure(
+                lambda: [
+                    Branch.create(data={}, start_at=START, end_at=end, now=now)
+                    for _ in range(count)
+                ]
+            ),
+        ),
+    ]
+    rows = [(name, elapsed / count) for name, elapsed in rows]
+    report("Creating branches, seconds each", rows, ("", "per call"))
+
+    rows = []
+    for amendments in (1_000, 10_000):
+        slow = measure(lambda: build_contract(amendments, klass=InitBranch), repeat=1)
+        fast = measure(lambda: build_contract(amendments), repeat=1)
+        rows.append((amendments, slow / amendments, fast / amendments))
+
+    report(
+        "Branching with splits, seconds per branch()",
+        rows,
+        ("amendments", "__init__", "create"),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import os
+import tempfile
+from datetime import timedelta
+
+from benchmarks.common import START, build_contract, measure, report
+from pcontract.backends.file import FileBackend, file
+from pcontract.serialization import to_json
+
+
+def amend(backend: FileBackend, count: int) -> None:
+    # Every amendment is persisted before the next one, as if each was
+    # made in its own context.
+    for n in range(count):
+        backend.branch(
+            start_at=START + timedelta(days=n % 300, hours=n % 24),
+            end_at=START + timedelta(days=n % 300 + 1),
+            data={"eggs_per_day": n},
+        )
+        backend.__exit__(None, None, None)  # type: ignore[arg-type]
+
+
+def coalesce(backend: FileBackend, count: int) -> None:
+    # Amendments queued by the backend, written once.
+    for n in range(count):
+        backend.branch(
+            start_at=START + timedelta(days=n % 300, hours=n % 24),
+            end_at=START + timedelta(days=n % 300 + 1),
+            data={"eggs_per_day": n},
+        )
+    backend.commit()
+
+
+def main() -> None:
+    rows = []
+    amendments = 20
+    with tempfile.TemporaryDirectory() as directory:
+        for size in (1_000, 10_000, 100_000):
+            contract = build_contract(size)
+            filename = os.path.join(directory, contract.uuid)
+            snapshot = to_json(contract)
+
+            timings = []
+            for method in ("json", "journal"):
+                with open(filename, "w") as f:
+                    f.write(snapshot)
+
+                with file(filename, method=method) as backend:  # type: ignore
+                    elapsed = measure(lambda: amend(backend, amendments), repeat=1)
+                timings.append(elapsed / amendments)
+
+            with open(filename, "w") as f:
+                f.write(snapshot)
+            with file(filename, coalesce=True) as backend:
+                elapsed = measure(lambda: coalesce(backend, amendments), repeat=1)
+            timings.append(elapsed / amendments)
+            rows.append((len(contract), *timings))
+
+    report(
+        "Persisting an amendment to a contract file, seconds per amendment",
+        rows,
+        ("branches", "json rewrite", "journal", "coalesced"),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+from benchmarks.common import build_contract, measure, report
+
+
+def main() -> None:
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        png = os.path.join(directory, "chart.png")
+        svg = os.path.join(directory, "chart.svg")
+        for amendments in (1_000, 10_000, 100_000):
+            contract = build_contract(amendments)
+            rows.append(
+                (
+                    len(contract),
+                    measure(lambda: contract.gantt(png), repeat=1),
+                    measure(lambda: contract.gantt(png, active_only=True), repeat=1),
+                    measure(lambda: contract.gantt(png, limit=1_000), repeat=1),
+                    measure(lambda: contract.gantt(svg, limit=1_000), repeat=1),
+                )
+            )
+
+    report(
+        "Rendering Gantt charts to files, seconds",
+        rows,
+        ("branches", "png", "png active", "png 1k bars", "svg 1k bars"),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+from datetime import datetime
+from typing import cast
+
+from benchmarks.common import build_contract, measure, report, timestamps
+from pcontract.data import Branch, Contract
+
+
+def linear_get_branch(contract: Contract, at: datetime) -> Branch | None:
+    # The full scan Contract.get_branch used to perform.
+    candidates = [
+        b
+        for b in contract.items
+        if not b.replaced_by and b.start_at <= at < cast(datetime, b.end_at)
+    ]
+    return candidates[0] if candidates else None
+
+
+def main() -> None:
+    rows = []
+    for amendments in (1_000, 10_000, 100_000):
+        contract = build_contract(amendments)
+        points = timestamps(contract, 1_000)
+        sample = points[:100]
+
+        indexed = measure(lambda: [contract.get_branch(at=at) for at in points])
+        linear = measure(
+            lambda: [linear_get_branch(contract, at) for at in sample], repeat=1
+        )
+        rows.append((len(contract), indexed / len(points), linear / len(sample)))
+
+    report(
+        "Contract.get_branch, seconds per lookup",
+        rows,
+        ("branches", "indexed", "linear scan"),
+    )
+
+
+if __name__ == "__main__":
+    main()
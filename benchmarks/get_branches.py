@@ -0,0 +1,44 @@
+import importlib.util
+
+from benchmarks.common import build_contract, measure, report, timestamps
+
+
+def main() -> None:
+    has_numpy = importlib.util.find_spec("numpy") is not None
+    rows = []
+
+    for amendments in (1_000, 10_000, 100_000):
+        contract = build_contract(amendments)
+        points = timestamps(contract, 1_000_000)
+
+        single = measure(
+            lambda: [contract.get_branch(at=at) for at in points], repeat=1
+        )
+        batch = measure(lambda: contract.get_branches(at=points), repeat=1)
+        resolved = measure(
+            lambda: contract.get_branches(at=points, resolve=True), repeat=1
+        )
+        row = (len(contract), single, batch, resolved)
+
+        if has_numpy:
+            import numpy
+
+            array = numpy.array(
+                [at.replace(tzinfo=None) for at in points], dtype="datetime64[us]"
+            )
+            row += (
+                measure(lambda: contract.get_branches(at=array)),
+                measure(lambda: contract.get_branches(at=array, resolve=True)),
+            )
+        rows.append(row)
+
+    report(
+        "Resolving 1M timestamps, seconds",
+        rows,
+        ("branches", "get_branch()", "get_branches()", "resolved")
+        + (("numpy", "numpy resolved") if has_numpy else ()),
+    )
+
+
+if __name__ == "__main__":
+    main()
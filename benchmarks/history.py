@@ -0,0 +1,61 @@
+from datetime import datetime
+
+from benchmarks.common import build_contract, measure, report, timestamps
+from benchmarks.memory import traced
+from pcontract.data import Branch, Contract
+from pcontract.history import History
+
+
+def replay(contract: Contract, at: datetime, known_at: datetime) -> Branch | None:
+    # Scans the whole history, as audits used to.
+    created = {branch.uuid: branch.created_at for branch in contract.items}
+    for branch in contract.items:
+        if branch.created_at > known_at:
+            continue
+
+        replaced_at = min((created[uid] for uid in branch.replaced_by), default=None)
+        if replaced_at is not None and replaced_at <= known_at:
+            continue
+
+        if branch.start_at <= at < branch.end_at:  # type: ignore[operator]
+            return branch
+    return None
+
+
+def main() -> None:
+    rows = []
+    queries = 100
+    for amendments in (1_000, 10_000, 100_000):
+        contract = build_contract(amendments)
+        created = sorted({branch.created_at for branch in contract.items})
+        points = timestamps(contract, queries)
+        known = [created[n * len(created) // queries] for n in range(queries)]
+        pairs = list(zip(points, known))
+
+        build = measure(lambda: History(contract), repeat=1)
+        memory, _ = traced(contract.history)
+        scanned = measure(lambda: [replay(contract, *pair) for pair in pairs[:10]])
+        indexed = measure(
+            lambda: [contract.get_branch(at=at, known_at=s) for at, s in pairs]
+        )
+        snapshot = measure(lambda: [contract.as_of(s) for s in known])
+        rows.append(
+            (
+                len(contract),
+                build,
+                memory / 1024 / 1024,
+                scanned / 10,
+                indexed / queries,
+                snapshot / queries,
+            )
+        )
+
+    report(
+        "As-of lookups, seconds",
+        rows,
+        ("branches", "index build", "index MiB", "replay", "indexed", "as_of()"),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import gc
+import tracemalloc
+from typing import Any, Callable, Type, cast
+
+from benchmarks.common import build_contract, report
+from pcontract.data import Branch, Contract
+
+# Branch with an instance __dict__, as it used to be before __slots__. A
+# subclass would still store its attributes in the slots of Branch, so the
+# methods are copied onto a class with no slots in its MRO instead.
+DictBranch = cast(
+    Type[Branch],
+    type(
+        "DictBranch",
+        (),
+        {
+            name: value
+            for name, value in vars(Branch).items()
+            if name not in ("__module__", "__slots__", *Branch.__slots__)
+        },
+    ),
+)
+
+
+def traced(fn: Callable[[], Any]) -> tuple[int, Any]:
+    gc.collect()
+    tracemalloc.start()
+    result = fn()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, result
+
+
+def packed(amendments: int) -> Contract:
+    contract = build_contract(amendments)
+    contract.pack()
+    return contract
+
+
+def main() -> None:
+    rows = []
+    for amendments in (1_000, 10_000, 100_000):
+        dicts, _ = traced(lambda: build_contract(amendments, klass=DictBranch))
+        slots, contract = traced(lambda: build_contract(amendments))
+        columns, _ = traced(lambda: packed(amendments))
+        mb = 1024 * 1024
+        rows.append((len(contract), dicts / mb, slots / mb, columns / mb))
+
+    report(
+        "Memory held by a contract, MiB (tracemalloc)",
+        rows,
+        ("branches", "__dict__", "__slots__", "packed"),
+    )
+
+
+if __name__ == "__main__":
+    main()
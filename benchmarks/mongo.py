@@ -0,0 +1,134 @@
+import json
+from datetime import timedelta
+
+import bson
+import mongomock
+
+from benchmarks.common import START, build_contract, measure, report, timestamps
+from pcontract.backends.mongo import MongoBackend, mongo
+from pcontract.serialization import to_json
+
+
+def amend(backend: MongoBackend, count: int) -> None:
+    for n in range(count):
+        backend.branch(
+            start_at=START + timedelta(days=n % 300, hours=n % 24),
+            end_at=START + timedelta(days=n % 300 + 1),
+            data={"eggs_per_day": n},
+        )
+        backend.commit()
+
+
+def main() -> None:
+    # mongomock runs in process, so timings only show the client side cost;
+    # the size of the update sent is what saturates the write bandwidth.
+    rows = []
+    amendments = 20
+    for size in (1_000, 10_000):
+        contract = build_contract(size)
+        collection = mongomock.MongoClient().db.contracts
+        collection.insert_one(json.loads(to_json(contract)))
+
+        def replace() -> None:
+            assert backend._contract
+            document = json.loads(to_json(backend._contract))
+            collection.replace_one({"uuid": contract.uuid}, document)
+
+        backend = mongo(collection)
+        backend.set_contract(contract.uuid)
+        backend.commit = replace  # type: ignore[method-assign]
+        full = measure(lambda: amend(backend, amendments), repeat=1)
+
+        backend = mongo(collection)
+        backend.set_contract(contract.uuid)
+        delta = measure(lambda: amend(backend, amendments), repeat=1)
+
+        assert backend._contract
+        document = json.loads(to_json(backend._contract))
+        rows.append(
+            (
+                len(contract),
+                full / amendments,
+                delta / amendments,
+                len(bson.encode(document)),
+            )
+        )
+
+    report(
+        "Committing an amendment to MongoDB (mongomock), seconds per amendment",
+        rows,
+        ("branches", "replace_one", "delta", "document size"),
+    )
+
+    # Round trips are what matter against a real server, here only the
+    # per call overhead of the client shows.
+    rows = []
+    for count in (100, 1_000, 2_000):
+        collection = mongomock.MongoClient().db.contracts
+        contracts = [build_contract(10, seed=seed) for seed in range(count)]
+        uuids = [contract.uuid for contract in contracts]
+
+        backend = mongo(collection)
+        inserted = measure(lambda: backend.commit_many(contracts), repeat=1)
+
+        def one_by_one() -> None:
+            for uid in uuids:
+                backend.set_contract(uid)
+
+        rows.append(
+            (
+                count,
+                inserted,
+                measure(one_by_one, repeat=1),
+                measure(lambda: list(backend.load_many(uuids)), repeat=1),
+            )
+        )
+
+    report(
+        "Storing and loading many contracts (mongomock), seconds",
+        rows,
+        ("contracts", "commit_many", "set_contract", "load_many"),
+    )
+
+    # Effective data at a date, pulling the contract document against
+    # querying the timeline collection. mongomock scans collections rather
+    # than using indexes, a server answers from the index alone.
+    rows = []
+    queries = 100
+    for size in (100, 1_000, 10_000):
+        database = mongomock.MongoClient().db
+        backend = mongo(database.contracts, database.timeline)
+        backend.ensure_indexes()
+        contract = build_contract(size)
+        backend.commit_many([contract])
+        points = timestamps(contract, queries)
+
+        def pull() -> None:
+            for at in points:
+                backend.set_contract(contract.uuid)
+                assert backend._contract
+                branch = backend._contract.get_branch(at=at)
+                if branch is not None:
+                    backend._contract.resolve(branch)
+
+        def query() -> None:
+            for at in points:
+                backend.get_data(contract.uuid, at=at)
+
+        rows.append(
+            (
+                len(contract),
+                measure(pull, repeat=1) / queries,
+                measure(query, repeat=1) / queries,
+            )
+        )
+
+    report(
+        "Effective data at a date (mongomock), seconds per query",
+        rows,
+        ("branches", "find_one", "timeline"),
+    )
+
+
+if __name__ == "__main__":
+    main()
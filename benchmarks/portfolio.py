@@ -0,0 +1,109 @@
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+from benchmarks.common import START, build_contract, measure, report, timestamps
+from pcontract import portfolio
+from pcontract.backends.file import FileBackend
+from pcontract.data import Contract
+from pcontract.serialization import to_json
+
+
+def sequential(filenames: list[str], job: portfolio.EffectiveData) -> None:
+    for filename in filenames:
+        backend = FileBackend(filename)
+        backend.load()
+        assert backend._contract
+        job(backend._contract)
+
+
+def scan(contracts: list[Contract], points: list[datetime], threshold: int) -> int:
+    # What finding contracts takes without an index.
+    found = 0
+    for at in points:
+        for contract in contracts:
+            branch = contract.get_branch(at=at)
+            if branch is not None:
+                found += contract.resolve(branch)["eggs_per_day"] > threshold
+    return found
+
+
+def amend(contracts: list[Contract], count: int) -> None:
+    rnd = random.Random(0)
+    for n in range(count):
+        start_at = START + timedelta(days=rnd.randint(0, 364))
+        rnd.choice(contracts).branch(
+            {"eggs_per_day": n}, start_at=start_at, end_at=start_at + timedelta(days=7)
+        )
+
+
+def main() -> None:
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for count in (50, 200):
+            filenames = []
+            for seed in range(count):
+                contract = build_contract(1_000, seed=seed)
+                filenames.append(os.path.join(directory, contract.uuid))
+                with open(filenames[-1], "w") as f:
+                    f.write(to_json(contract))
+
+            job = portfolio.EffectiveData(timestamps(contract, 1_000))
+            rows.append(
+                (
+                    count,
+                    measure(lambda: sequential(filenames, job), repeat=1),
+                    measure(lambda: list(portfolio.evaluate(filenames, job)), repeat=1),
+                )
+            )
+
+    report(
+        "Effective data of contract files at 1000 dates, seconds (%d cores)"
+        % (os.cpu_count() or 1),
+        rows,
+        ("contracts", "sequential", "process pool"),
+    )
+
+    # Each contract has a hundred amendments, with eggs_per_day from 0 to
+    # 99, so that about 1% of the active branches match.
+    rows = []
+    for count in (100, 1_000, 10_000):
+        contracts = [build_contract(100, seed=seed) for seed in range(count)]
+        points = timestamps(contracts[0], 100)
+        where = {"eggs_per_day": (">", 98)}
+        index = portfolio.Portfolio(contracts, keys=["eggs_per_day"])
+        rows.append(
+            (
+                count,
+                measure(
+                    lambda: portfolio.Portfolio(contracts, keys=["eggs_per_day"]),
+                    repeat=1,
+                ),
+                measure(lambda: scan(contracts, points, 98), repeat=1),
+                measure(lambda: [index.find(at=at, where=where) for at in points]),
+                measure(lambda: [index.find(at=at) for at in points]),
+                measure(lambda: amend(contracts, 1_000), repeat=1),
+            )
+        )
+        for contract in index:
+            contract.unwatch(index._update)
+        rows[-1] += (measure(lambda: amend(contracts, 1_000), repeat=1),)
+
+    report(
+        "Contracts active at 100 dates with eggs_per_day > 98, seconds",
+        rows,
+        (
+            "contracts",
+            "index",
+            "scan",
+            "find",
+            "find all",
+            "1000 branch",
+            "unindexed",
+        ),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+from json import JSONDecoder
+from typing import Any, Callable
+
+from benchmarks.common import build_contract, measure, report
+from pcontract import serialization
+from pcontract.serialization import Encoder, from_json, object_hook, to_json
+
+
+def without_orjson(fn: Callable[[], Any]) -> Callable[[], Any]:
+    def run() -> Any:
+        orjson, serialization.orjson = serialization.orjson, None
+        try:
+            return fn()
+        finally:
+            serialization.orjson = orjson
+
+    return run
+
+
+def main() -> None:
+    rows = []
+    for amendments in (1_000, 10_000, 100_000):
+        contract = build_contract(amendments)
+        legacy = Encoder().encode(contract)
+        iso, micros = to_json(contract), to_json(contract, dates="int")
+        decoder = JSONDecoder(object_hook=object_hook)
+
+        rows.append(
+            (
+                len(contract),
+                measure(lambda: Encoder().encode(contract)),
+                measure(without_orjson(lambda: to_json(contract))),
+                measure(lambda: to_json(contract)),
+                measure(lambda: to_json(contract, dates="int")),
+                measure(lambda: decoder.decode(legacy)),
+                measure(without_orjson(lambda: from_json(iso))),
+                measure(lambda: from_json(iso)),
+                measure(lambda: from_json(micros)),
+            )
+        )
+
+    report(
+        "Serializing contracts, seconds (orjson is used when installed)",
+        rows,
+        (
+            "branches",
+            "Encoder",
+            "to_json json",
+            "to_json",
+            "to_json int",
+            "object_hook",
+            "from_json json",
+            "from_json",
+            "from_json int",
+        ),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import io
+import random
+from datetime import timedelta
+from typing import Any
+
+from benchmarks.common import START, measure, report
+from benchmarks.memory import traced
+from pcontract.data import Contract
+from pcontract.serialization import dump, to_json
+from pcontract.store import DataStore
+
+# Amendments pick their terms from a catalogue of plans, as customers of a
+# same provider do.
+PLANS = [
+    {
+        "plan": "plan-%d" % n,
+        "eggs_per_day": 5 * (n % 6 + 1),
+        "price": {"amount": 120 + 15 * n, "currency": "EUR"},
+        "delivery": ["monday", "thursday"] if n % 2 else ["friday"],
+        "options": {"organic": n % 3 == 0, "boxes": n % 4 + 1},
+    }
+    for n in range(20)
+]
+
+
+def build_portfolio(
+    contracts: int, amendments: int, *, seed: int = 0
+) -> list[Contract]:
+    # Payloads are decoded afresh for each amendment, like the ones of an
+    # API request, so that equal payloads don't share memory to begin with.
+    rnd = random.Random(seed)
+    portfolio = []
+    for _ in range(contracts):
+        end = START + timedelta(days=365)
+        contract = Contract.init(start_at=START, end_at=end, data=dict(PLANS[0]))
+        for _ in range(amendments):
+            offset = rnd.random() * (end - START).total_seconds()
+            start_at = START + timedelta(seconds=offset)
+            contract.branch(
+                decoded(rnd.choice(PLANS)),
+                start_at=start_at,
+                end_at=min(end, start_at + timedelta(days=rnd.randint(1, 30))),
+            )
+        portfolio.append(contract)
+    return portfolio
+
+
+def decoded(plan: dict[str, Any]) -> dict[str, Any]:
+    return {
+        **plan,
+        "price": dict(plan["price"]),
+        "delivery": list(plan["delivery"]),
+        "options": dict(plan["options"]),
+    }
+
+
+def interned(contracts: int, amendments: int) -> list[Contract]:
+    portfolio = build_portfolio(contracts, amendments)
+    store = DataStore()
+    for contract in portfolio:
+        contract.intern(store)
+    return portfolio
+
+
+def dumped(portfolio: list[Contract], dedupe: bool) -> int:
+    buffer = io.StringIO()
+    dump(portfolio, buffer, dedupe=dedupe)
+    return len(buffer.getvalue())
+
+
+def main() -> None:
+    sizes = [(100, 100), (100, 1_000), (1_000, 100)]
+
+    rows = []
+    for contracts, amendments in sizes:
+        before, portfolio = traced(lambda: build_portfolio(contracts, amendments))
+        after, _ = traced(lambda: interned(contracts, amendments))
+        mb = 1024 * 1024
+        branches = sum(len(contract) for contract in portfolio)
+        rows.append((contracts, branches, before / mb, after / mb))
+
+    report(
+        "Memory held by a portfolio, MiB (tracemalloc)",
+        rows,
+        ("contracts", "branches", "copies", "interned"),
+    )
+
+    rows = []
+    for contracts, amendments in sizes:
+        portfolio = build_portfolio(contracts, amendments)
+        kb = 1024
+        rows.append(
+            (
+                contracts,
+                sum(len(to_json(contract)) for contract in portfolio) / kb,
+                sum(len(to_json(contract, dedupe=True)) for contract in portfolio) / kb,
+                dumped(portfolio, False) / kb,
+                dumped(portfolio, True) / kb,
+            )
+        )
+
+    report(
+        "Size of JSON files and of an NDJSON dump, KiB",
+        rows,
+        ("contracts", "files", "files dedupe", "dump", "dump dedupe"),
+    )
+
+    rows = []
+    for contracts, amendments in sizes:
+        portfolio = build_portfolio(contracts, amendments)
+        rows.append(
+            (
+                contracts,
+                measure(lambda: dumped(portfolio, False), repeat=1),
+                measure(lambda: dumped(portfolio, True), repeat=1),
+                measure(
+                    lambda: [contract.intern(DataStore()) for contract in portfolio],
+                    repeat=1,
+                ),
+            )
+        )
+
+    report(
+        "Dumping and interning, seconds",
+        rows,
+        ("contracts", "dump", "dump dedupe", "intern()"),
+    )
+
+
+if __name__ == "__main__":
+    main()
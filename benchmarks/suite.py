@@ -0,0 +1,125 @@
+import json
+import random
+from datetime import timedelta
+from typing import Any, Iterable
+
+from benchmarks.common import WORKLOADS, measure, report, timestamps
+from pcontract.data import Contract
+from pcontract.probe import Recorder
+from pcontract.serialization import from_json, to_json
+
+SIZES = (1_000, 10_000, 100_000)
+
+
+def amend(contract: Contract, count: int, *, seed: int = 0) -> None:
+    rnd = random.Random(seed)
+    for n, at in enumerate(timestamps(contract, count, seed=seed)):
+        contract.branch(
+            {"eggs_per_day": n},
+            start_at=at,
+            end_at=at + timedelta(hours=rnd.randint(1, 240)),
+        )
+
+
+def run(workload: str, amendments: int) -> dict[str, Any]:
+    build = WORKLOADS[workload]
+    elapsed = measure(lambda: build(amendments), repeat=1)
+    contract = build(amendments)
+    points = timestamps(contract, 1_000, seed=1)
+    snapshot = to_json(contract)
+    result: dict[str, Any] = {
+        "workload": workload,
+        "amendments": amendments,
+        "branches": len(contract),
+        "active": len(contract._active),
+        "build": elapsed / amendments,
+        "to_json": measure(lambda: to_json(contract), repeat=1),
+        "from_json": measure(lambda: from_json(snapshot), repeat=1),
+    }
+
+    # Operations on an instrumented contract, counters included.
+    recorder = Recorder()
+    contract.instrument(recorder)
+    amend(contract, 100)
+    for at in points:
+        contract.get_branch(at=at)
+    contract.get_branches(at=points, resolve=True)
+    contract.instrument(None)
+    result["operations"] = recorder.stats()
+    return result
+
+
+def main(
+    sizes: Iterable[int] = SIZES,
+    workloads: Iterable[str] = tuple(WORKLOADS),
+    output: str | None = None,
+) -> None:
+    results = [
+        run(workload, amendments) for workload in workloads for amendments in sizes
+    ]
+
+    report(
+        "Building contracts and serializing them, seconds",
+        [
+            (
+                r["workload"],
+                r["amendments"],
+                r["branches"],
+                r["active"],
+                r["build"],
+                r["to_json"],
+                r["from_json"],
+            )
+            for r in results
+        ],
+        (
+            "workload",
+            "amendments",
+            "branches",
+            "active",
+            "per branch()",
+            "to_json",
+            "from_json",
+        ),
+    )
+
+    rows = []
+    for r in results:
+        branch, get_branch, get_branches = (
+            r["operations"][name] for name in ("branch", "get_branch", "get_branches")
+        )
+        rows.append(
+            (
+                r["workload"],
+                r["branches"],
+                branch["mean_seconds"],
+                branch["scanned"] / branch["count"],
+                branch["splits"] / branch["count"],
+                get_branch["mean_seconds"],
+                get_branches["seconds"],
+                get_branches["hops"],
+            )
+        )
+
+    report(
+        "Instrumented operations, seconds and counts per call",
+        rows,
+        (
+            "workload",
+            "branches",
+            "branch()",
+            "scanned",
+            "splits",
+            "get_branch()",
+            "get_branches()",
+            "ref hops",
+        ),
+    )
+
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
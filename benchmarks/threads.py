@@ -0,0 +1,70 @@
+import threading
+import time
+from datetime import timedelta
+
+from benchmarks.common import START, build_contract, measure, report, timestamps
+from pcontract.data import Contract
+
+
+def amend(contract: Contract, count: int) -> None:
+    for n in range(count):
+        contract.branch(
+            {"eggs_per_day": n},
+            start_at=START + timedelta(days=n % 300, hours=n % 24),
+            end_at=START + timedelta(days=n % 300 + 1),
+        )
+
+
+def lookups(contract: Contract, readers: int, duration: float) -> int:
+    # Lookups made by all readers meanwhile a writer keeps amending.
+    points = timestamps(contract, 1_000)
+    counts = [0] * readers
+    done = threading.Event()
+
+    def read(reader: int) -> None:
+        while not done.is_set():
+            for at in points:
+                contract.get_branch(at=at)
+            counts[reader] += len(points)
+
+    def write() -> None:
+        while not done.is_set():
+            amend(contract, 10)
+            time.sleep(0.001)
+
+    threads = [threading.Thread(target=read, args=(n,)) for n in range(readers)]
+    threads.append(threading.Thread(target=write))
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    done.set()
+    for thread in threads:
+        thread.join()
+    return sum(counts)
+
+
+def main() -> None:
+    rows = []
+    amendments = 100
+    for size in (1_000, 10_000, 100_000):
+        contract = build_contract(size)
+        shared = build_contract(size).share()
+        rows.append(
+            (
+                len(contract),
+                measure(lambda: amend(contract, amendments), repeat=1) / amendments,
+                measure(lambda: amend(shared, amendments), repeat=1) / amendments,
+                lookups(shared, 4, 1.0),
+            )
+        )
+
+    report(
+        "Shared contracts, seconds per amendment and lookups per second"
+        " by 4 readers alongside a writer",
+        rows,
+        ("branches", "branch", "shared branch", "lookups"),
+    )
+
+
+if __name__ == "__main__":
+    main()
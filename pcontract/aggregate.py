@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import bisect
+import itertools
+import math
+from datetime import datetime, timedelta
+from numbers import Real
+from typing import TYPE_CHECKING, Any, Callable, Iterable, NamedTuple, cast
+
+if TYPE_CHECKING:
+    from pcontract.data import Branch
+
+# Extremes are kept per block of branches, and over runs of blocks.
+BLOCK = 32
+
+
+class Aggregate(NamedTuple):
+    # Sum of the field per unit of time, extremes and time weighted
+    # average over the part of the window with a value.
+    total: float
+    minimum: float | None
+    maximum: float | None
+    average: float | None
+    covered: timedelta
+
+
+def sparse(
+    levels: list[list[float]], values: list[float], keep: int, pick: Any
+) -> None:
+    # Level k holds the extremes of 2 ** k values from each position,
+    # entries depending on values past `keep` are recomputed.
+    levels[0] = values
+    level = 1
+    while (1 << level) <= len(values):
+        if level == len(levels):
+            levels.append([])
+
+        half = 1 << (level - 1)
+        below, current = levels[level - 1], levels[level]
+        start = max(0, keep - (1 << level) + 1)
+        del current[start:]
+        current.extend(map(pick, below[start:-half], below[start + half :]))
+        level += 1
+    del levels[level:]
+
+
+class Series:
+    # Values of a numeric data field along the active branches, kept in
+    # step with them on writes. Prefix sums of value * seconds and the
+    # tables of extremes are brought up to date from the first position
+    # that changed on the next query.
+    __slots__ = (
+        "field",
+        "lows",
+        "highs",
+        "weights",
+        "seconds",
+        "sums",
+        "covered",
+        "blows",
+        "bhighs",
+        "_valid",
+    )
+
+    def __init__(
+        self,
+        field: str,
+        active: list[Branch],
+        resolve: Callable[[Branch], dict[str, Any]],
+    ) -> None:
+        self.field = field
+        self.lows: list[float] = []
+        self.highs: list[float] = []
+        self.weights: list[float] = []
+        self.seconds: list[float] = []
+        self.sums: list[float] = [0.0]
+        self.covered: list[float] = [0.0]
+        self.blows: list[list[float]] = [[]]
+        self.bhighs: list[list[float]] = [[]]
+        self._valid = 0
+        self.splice(0, 0, active, resolve)
+
+    def splice(
+        self,
+        lo: int,
+        hi: int,
+        branches: Iterable[Branch],
+        resolve: Callable[[Branch], dict[str, Any]],
+    ) -> None:
+        # Active branches [lo, hi) were replaced with the given ones.
+        # Branches whose value isn't a number don't count.
+        lows, highs, weights, seconds = [], [], [], []
+        for branch in branches:
+            value = resolve(branch).get(self.field)
+            span = branch.span.total_seconds()
+            if isinstance(value, Real) and not isinstance(value, bool):
+                number = float(value)
+                lows.append(number)
+                highs.append(number)
+                weights.append(number * span)
+                seconds.append(span)
+            else:
+                lows.append(math.inf)
+                highs.append(-math.inf)
+                weights.append(0.0)
+                seconds.append(0.0)
+
+        self.lows[lo:hi] = lows
+        self.highs[lo:hi] = highs
+        self.weights[lo:hi] = weights
+        self.seconds[lo:hi] = seconds
+        self._valid = min(self._valid, lo)
+
+    def _refresh(self) -> None:
+        valid = self._valid
+        if valid == len(self.weights) == len(self.sums) - 1:
+            return
+
+        for sums, values in ((self.sums, self.weights), (self.covered, self.seconds)):
+            del sums[valid + 1 :]
+            sums.extend(
+                itertools.islice(
+                    itertools.accumulate(values[valid:], initial=sums[valid]), 1, None
+                )
+            )
+
+        block = valid // BLOCK
+        for levels, values, pick in (
+            (self.blows, self.lows, min),
+            (self.bhighs, self.highs, max),
+        ):
+            blocks = levels[0][:block]
+            blocks.extend(
+                pick(values[n : n + BLOCK])
+                for n in range(block * BLOCK, len(values), BLOCK)
+            )
+            sparse(levels, blocks, block, pick)
+        self._valid = len(self.weights)
+
+    def _extreme(self, lo: int, hi: int, values: list[float], pick: Any) -> float:
+        first, last = -(-lo // BLOCK), hi // BLOCK
+        if first >= last:
+            return cast(float, pick(values[lo:hi]))
+
+        levels = self.blows if pick is min else self.bhighs
+        level = (last - first).bit_length() - 1
+        return cast(
+            float,
+            pick(
+                levels[level][first],
+                levels[level][last - (1 << level)],
+                *values[lo : first * BLOCK],
+                *values[last * BLOCK : hi],
+            ),
+        )
+
+    def query(
+        self,
+        active: list[Branch],
+        starts: list[datetime],
+        start_at: datetime,
+        end_at: datetime,
+        per: timedelta,
+    ) -> Aggregate:
+        self._refresh()
+
+        # Branches [lo, hi) overlap the window, only the first and last
+        # ones may stick out of it.
+        lo = max(0, bisect.bisect_right(starts, start_at) - 1)
+        if lo < len(active) and cast(datetime, active[lo].end_at) <= start_at:
+            lo += 1
+        hi = bisect.bisect_left(starts, end_at)
+
+        if lo >= hi:
+            return Aggregate(0.0, None, None, None, timedelta())
+
+        total = self.sums[hi] - self.sums[lo]
+        seconds = self.covered[hi] - self.covered[lo]
+        for index, outside in (
+            (lo, start_at - active[lo].start_at),
+            (hi - 1, cast(datetime, active[hi - 1].end_at) - end_at),
+        ):
+            if self.seconds[index] and outside > timedelta():
+                total -= self.lows[index] * outside.total_seconds()
+                seconds -= outside.total_seconds()
+
+        low = self._extreme(lo, hi, self.lows, min)
+        high = self._extreme(lo, hi, self.highs, max)
+        return Aggregate(
+            total / per.total_seconds(),
+            None if low == math.inf else low,
+            None if high == -math.inf else high,
+            total / seconds if seconds else None,
+            timedelta(seconds=seconds),
+        )
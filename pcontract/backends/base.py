@@ -1,8 +1,12 @@
-from typing import Any, TYPE_CHECKING
+from abc import ABC, abstractmethod
+from types import TracebackType
+from typing import Any, TYPE_CHECKING, TypeVar
 
 if TYPE_CHECKING:
     from pcontract.data import Contract
 
+T = TypeVar("T", bound="AsyncBackend")
+
 
 class Backend:
     def __init__(self, *args: Any, **kwargs: Any) -> None:
@@ -30,3 +34,22 @@ class Backend:
     def gantt(self) -> None:
         assert self._contract
         self._contract.gantt()
+
+
+class AsyncBackend(Backend, ABC):
+    # Amendments only touch the contract in memory and stay synchronous,
+    # storage is accessed through coroutines.
+    async def __aenter__(self: T) -> T:
+        return self
+
+    async def __aexit__(
+        self,
+        exctype: type[BaseException] | None,
+        excinst: BaseException | None,
+        exctb: TracebackType | None,
+    ) -> None:
+        if exctype is None and self._contract is not None:
+            await self.commit()
+
+    @abstractmethod
+    async def commit(self) -> None: ...
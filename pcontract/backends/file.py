@@ -1,19 +1,93 @@
+import asyncio
+import contextlib
+import os
 import pickle
+import threading
+from concurrent.futures import Executor
 from pathlib import Path
 from types import TracebackType
-from typing import Literal, TypeVar, Any
+from typing import IO, Any, Callable, Iterator, Literal, TypeVar
 
-from pcontract.backends.base import Backend
-from pcontract.serialization import from_json, to_json
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore[assignment]
+
+from pcontract.backends.base import AsyncBackend, Backend
+from pcontract.binary import mapped, to_bytes
+from pcontract.serialization import branch_to_dict, dumps, from_json, to_json
 
 T = TypeVar("T", bound="FileBackend")
+A = TypeVar("A", bound="AsyncFileBackend")
+R = TypeVar("R")
+
+# Version of the files a contract is loaded from, as found by stat.
+Stamp = tuple[tuple[int, int, int] | None, ...]
+
+
+class PathLock:
+    # Lock of a contract file within the process, re-entrant so that
+    # backends nested on the same file in a thread don't wait for each
+    # other. The first holder takes the advisory lock keeping other
+    # processes out, the last one releases it.
+    __slots__ = ("lock", "users", "depth", "file")
+
+    def __init__(self) -> None:
+        self.lock = threading.RLock()
+        self.users = 0
+        self.depth = 0
+        self.file: IO[bytes] | None = None
+
+
+locks: dict[str, PathLock] = {}
+locks_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def locked(filename: str | Path) -> Iterator[None]:
+    # Writers hold an exclusive advisory lock on a file next to the
+    # contract file, which itself gets replaced on each write.
+    key = os.path.abspath(filename)
+    with locks_lock:
+        entry = locks.get(key)
+        if entry is None:
+            entry = locks[key] = PathLock()
+        entry.users += 1
+
+    try:
+        with entry.lock:
+            if entry.depth == 0 and fcntl is not None:
+                f = open("%s.lock" % filename, "ab")
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                except BaseException:
+                    f.close()
+                    raise
+                entry.file = f
+
+            entry.depth += 1
+            try:
+                yield
+            finally:
+                entry.depth -= 1
+                if entry.depth == 0 and entry.file is not None:
+                    entry.file.close()
+                    entry.file = None
+    finally:
+        with locks_lock:
+            entry.users -= 1
+            if entry.users == 0:
+                del locks[key]
 
 
 class FileBackend(Backend):
     def __init__(
         self,
         filename: str | Path | None = None,
-        method: Literal["json", "pickle"] = "json",
+        method: Literal["json", "pickle", "journal", "binary"] = "json",
+        compact_every: int = 1000,
+        coalesce: bool = False,
+        dedupe: bool = False,
     ) -> None:
         super().__init__()
 
@@ -22,21 +96,93 @@ class FileBackend(Backend):
 
         self._filename: str | Path | None = filename
         self._method = method
+        self._compact_every = compact_every
+        self._records = 0
+        # When coalescing, the file is not locked while amendments are
+        # made. They are queued and applied on top of the latest version
+        # of the file on commit, which then writes the file only once.
+        self._coalesce = coalesce
+        # JSON files may write each distinct payload once, see to_dict.
+        self._dedupe = dedupe
+        self._queue: list[tuple[tuple[Any, ...], dict[str, Any]]] = []
+        # Sessions lock the file from their first amendment until exit.
+        self._session = contextlib.ExitStack()
+        self._entered = False
+        self._held = False
+        self._stamp: Stamp | None = None
 
     def init(self, *args: Any, **kwargs: Any) -> None:
         super().init(*args, **kwargs)
         assert self._contract is not None
         self._filename = self._contract.uuid
+        self._stamp = self._stat()
+
+    def branch(self, *args: Any, **kwargs: Any) -> None:
+        if self._entered and not self._coalesce:
+            self._hold()
+        super().branch(*args, **kwargs)
+        if self._coalesce:
+            self._queue.append((args, kwargs))
+        elif self._method == "journal":
+            self._journal()
+
+    @property
+    def _journal_filename(self) -> Path:
+        assert self._filename
+        return Path("%s.journal" % self._filename)
+
+    def _locked(self) -> contextlib.AbstractContextManager[None]:
+        assert self._filename
+        return locked(self._filename)
+
+    def _stat(self) -> Stamp | None:
+        # Writers replace the contract file and append to the journal.
+        if self._filename is None:
+            return None
+
+        stamps: list[tuple[int, int, int] | None] = []
+        for path in (self._filename, self._journal_filename):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                stamps.append(None)
+            else:
+                stamps.append((st.st_ino, st.st_mtime_ns, st.st_size))
+        return tuple(stamps)
+
+    def _hold(self) -> None:
+        # Unless coalescing, the first amendment of a session locks the
+        # file until exit, so that concurrent users don't overwrite each
+        # other's amendments. Sessions that only read don't wait for each
+        # other. The contract is reloaded if written meanwhile.
+        if self._held or self._filename is None:
+            return
+
+        self._session.enter_context(self._locked())
+        self._held = True
+        if self._stat() != self._stamp:
+            self.load()
 
     def __enter__(self: T) -> T:
+        self.load()
+        self._entered = True
+        return self
+
+    def load(self) -> None:
+        self._stamp = self._stat()
         if self._filename is not None:
-            if self._method == "json":
-                with open(self._filename, "r") as f:
-                    self._contract = from_json(f.read())
-            else:
+            if self._method == "pickle":
                 with open(self._filename, "rb") as f:
                     self._contract = pickle.load(f)
-        return self
+            elif self._method == "binary":
+                # The contract reads replaced branches from the map.
+                self._contract = mapped(self._filename).load()
+            else:
+                with open(self._filename, "r") as f:
+                    self._contract = from_json(f.read())
+
+            if self._method == "journal":
+                self._replay()
 
     def __exit__(
         self,
@@ -44,22 +190,229 @@ class FileBackend(Backend):
         excinst: BaseException | None,
         exctb: TracebackType | None,
     ) -> None:
-        contract = self._contract
-        if contract is None:
+        # Sessions that changed nothing don't write, nor wait for writers.
+        with self._session:
+            self._entered = self._held = False
+            stamp = self._stamp
+            if (
+                self._coalesce
+                or self._contract is None
+                or self._contract.changed
+                or stamp is None
+                or stamp[0] is None
+            ):
+                self.commit()
+
+    def commit(self) -> None:
+        if self._contract is None:
             return
 
-        assert self._filename
-        mode: str = "w" if self._method == "json" else "wb"
+        with self._locked():
+            assert self._filename
+            queue, self._queue = self._queue, []
+            exists = Path(self._filename).exists()
+            if self._coalesce and exists and not (queue or self._contract.changed):
+                # Nothing to write, the version loaded may be outdated.
+                return
 
-        with open(self._filename, mode) as f:
+            if queue and exists:
+                # Others may have written the file meanwhile.
+                self.load()
+                assert self._contract is not None
+                for args, kwargs in queue:
+                    self._contract.branch(*args, **kwargs)
+
+            if self._method == "journal":
+                self._journal()
+                return
+
+            contract = self._contract
             if self._method == "json":
-                f.write(to_json(contract))
+                self._replace(to_json(contract, dedupe=self._dedupe).encode())
+            elif self._method == "binary":
+                self._replace(to_bytes(contract))
             else:
-                pickle.dump(contract, f)
+                self._replace(pickle.dumps(contract))
+
+    def _replace(self, content: bytes) -> None:
+        # Readers see either the previous or the new version of the file,
+        # never a partially written one.
+        assert self._filename
+        temporary = Path("%s.tmp" % self._filename)
+        with open(temporary, "wb") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self._filename)
+
+    def _replay(self) -> None:
+        # Changes recorded after the snapshot was taken are collected and
+        # applied at once, records hold the full replaced_by lists so that
+        # later records override earlier ones. Records hold the number of
+        # branches they follow, records left over from a snapshot taken
+        # after compaction don't match and are ignored.
+        assert self._contract is not None
+        size = len(self._contract.items)
+        added: list[Any] = []
+        replaced: dict[int, list[str]] = {}
+        self._records = 0
+
+        if self._journal_filename.exists():
+            with open(self._journal_filename, "r") as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        break  # Partially written record.
+
+                    record = from_json(line)
+                    if record.get("size", size) != size:
+                        break
+
+                    size += len(record["items"])
+                    added.extend(record["items"])
+                    replaced.update(
+                        (int(index), replaced_by)
+                        for index, replaced_by in record["replaced_by"].items()
+                    )
+                    self._records += 1
+
+        self._contract.apply_changes(added, replaced)
+
+    def _journal(self) -> None:
+        with self._locked():
+            self._append_journal()
+
+    def _append_journal(self) -> None:
+        contract = self._contract
+        assert contract is not None and self._filename
+
+        if not Path(self._filename).exists() or contract.compacted:
+            # Positions of branches change when history is compacted, so
+            # the journal no longer applies.
+            self._compact()
+            return
+
+        added, replaced = contract.pop_changes()
+        if not (added or replaced):
+            return
+
+        # Records are encoded like snapshots, so that replay reads them back
+        # the same.
+        record = dumps(
+            {
+                "size": len(contract.items) - len(added),
+                "items": [branch_to_dict(branch) for branch in added],
+                "replaced_by": {
+                    str(index): branch.replaced_by for index, branch in replaced.items()
+                },
+            }
+        )
+        try:
+            with open(self._journal_filename, "a") as f:
+                f.write(record + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            # Changes are recorded once written, to be retried otherwise.
+            contract.restore_changes()
+            raise
+
+        self._records += 1
+        if self._records >= self._compact_every:
+            self._compact()
+
+    def _compact(self) -> None:
+        # Write a new snapshot, then drop the records it includes. Replay
+        # skips branches that are already present, so a crash in between
+        # is harmless.
+        contract = self._contract
+        assert contract is not None and self._filename
+        contract.pop_changes()
+        try:
+            self._replace(to_json(contract, dedupe=self._dedupe).encode())
+        except BaseException:
+            contract.restore_changes()
+            raise
+
+        with open(self._journal_filename, "w"):
+            pass
+        self._records = 0
+
+
+class AsyncFileBackend(AsyncBackend):
+    # Runs a coalescing FileBackend in a thread pool, the default executor
+    # of the loop unless one is given. Amendments are applied on commit to
+    # the latest version of the file, under its lock, so that concurrent
+    # users don't lose each other's. In journal mode, changes are journaled
+    # on commit rather than on each amendment.
+    def __init__(
+        self,
+        filename: str | Path | None = None,
+        method: Literal["json", "pickle", "journal", "binary"] = "json",
+        compact_every: int = 1000,
+        executor: Executor | None = None,
+        dedupe: bool = False,
+    ) -> None:
+        super().__init__()
+        self._backend = FileBackend(
+            filename, method, compact_every, coalesce=True, dedupe=dedupe
+        )
+        self._executor = executor
+
+    def init(self, *args: Any, **kwargs: Any) -> None:
+        self._backend.init(*args, **kwargs)
+        self._contract = self._backend._contract
+
+    def branch(self, *args: Any, **kwargs: Any) -> None:
+        self._backend.branch(*args, **kwargs)
+
+    async def _run(self, fn: Callable[[], R]) -> R:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn)
+
+    async def __aenter__(self: A) -> A:
+        await self.load()
+        return self
+
+    async def __aexit__(
+        self,
+        exctype: type[BaseException] | None,
+        excinst: BaseException | None,
+        exctb: TracebackType | None,
+    ) -> None:
+        # Like FileBackend, the contract is written in any case.
+        await self.commit()
+
+    async def load(self) -> None:
+        await self._run(self._backend.load)
+        self._contract = self._backend._contract
+
+    async def commit(self) -> None:
+        self._backend._contract = self._contract
+        await self._run(self._backend.commit)
+        self._contract = self._backend._contract
 
 
 def file(
     filename: str | Path | None = None,
-    method: Literal["json", "pickle"] = "json",
+    method: Literal["json", "pickle", "journal", "binary"] = "json",
+    compact_every: int = 1000,
+    coalesce: bool = False,
+    dedupe: bool = False,
 ) -> FileBackend:
-    return FileBackend(filename, method=method)
+    return FileBackend(
+        filename,
+        method=method,
+        compact_every=compact_every,
+        coalesce=coalesce,
+        dedupe=dedupe,
+    )
+
+
+def afile(
+    filename: str | Path | None = None,
+    method: Literal["json", "pickle", "journal", "binary"] = "json",
+    compact_every: int = 1000,
+    executor: Executor | None = None,
+    dedupe: bool = False,
+) -> AsyncFileBackend:
+    return AsyncFileBackend(filename, method, compact_every, executor, dedupe)
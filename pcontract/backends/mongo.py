@@ -1,36 +1,443 @@
-import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Iterable, Iterator
+from uuid import uuid4
 
+from pymongo import DESCENDING, DeleteMany, InsertOne, ReplaceOne, UpdateOne
 from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+from pymongo.results import BulkWriteResult
 
-from pcontract.backends.base import Backend
-from pcontract.serialization import from_json, to_json
+from pcontract.backends.base import AsyncBackend, Backend
+from pcontract.data import Branch, Contract, utc, validate_tz
+from pcontract.serialization import branch_to_dict, from_dict, to_dict
 
 
-class MongoBackend(Backend):
-    def __init__(self, collection: Collection) -> None:
+class ConflictError(ValueError):
+    pass
+
+
+Document = dict[str, Any]
+Operation = InsertOne[Document] | ReplaceOne[Document] | UpdateOne
+
+# Contract, branches added and branches replaced, None if the contract is
+# stored as a whole.
+Changes = tuple[Contract, list[Branch], list[Branch] | None]
+
+
+class BaseMongoBackend(Backend):
+    # State and operations shared by the blocking and asyncio backends,
+    # which only differ in how they talk to the collections.
+    def __init__(self, collection: Any, timeline: Any | None = None) -> None:
         super().__init__()
+        self.collection = collection
+        # Optional collection holding one document per active branch of
+        # every contract, with its effective data, so that point-in-time
+        # queries run on the server.
+        self.timeline = timeline
+        # Versions of the stored documents contracts were loaded from, by
+        # uuid. Versions are random tags, so that a writer can tell whether
+        # the stored version is the one it wrote. Contracts that are not
+        # stored yet have no entry, documents stored without a version
+        # have None.
+        self._versions: dict[str, str | None] = {}
+
+    def unset(self) -> None:
+        self._contract = None
+
+    def _load(self, document: dict[str, Any]) -> Contract:
+        contract = from_dict(document)
+        self._versions[contract.uuid] = document.get("version")
+        return contract
+
+    def _operation(
+        self,
+        contract: Contract,
+        added: list[Branch],
+        replaced: dict[int, Branch] | None,
+        version: str,
+    ) -> Operation | None:
+        # Only the branches added and the replaced_by lists changed since
+        # the last commit are sent. Updates apply only if the stored
+        # document is still at the version the contract was loaded from.
+        if contract.uuid not in self._versions:
+            # Inserted unless another writer stored the same contract, in
+            # which case the stored document is left as is.
+            document = to_dict(contract)
+            document["version"] = version
+            return UpdateOne(
+                {"uuid": contract.uuid}, {"$setOnInsert": document}, upsert=True
+            )
+
+        current = self._versions[contract.uuid]
+        query = {
+            "uuid": contract.uuid,
+            "version": {"$exists": False} if current is None else current,
+        }
+
+        if replaced is None:
+            document = to_dict(contract)
+            document["version"] = version
+            return ReplaceOne(query, document)
+
+        if not added and not replaced:
+            return None
+
+        # New branches are set by position rather than pushed, since an
+        # update can't both push to items and set fields of its elements.
+        offset = len(contract) - len(added)
+        changes: dict[str, Any] = {
+            "items.%d" % (offset + index): branch_to_dict(branch)
+            for index, branch in enumerate(added)
+        }
+        changes.update(
+            ("items.%d.replaced_by" % index, branch.replaced_by)
+            for index, branch in replaced.items()
+        )
+        changes["version"] = version
+        return UpdateOne(query, {"$set": changes})
+
+    def _prepare(
+        self, contracts: Iterable[Contract]
+    ) -> tuple[str, list[Operation], list[Changes]]:
+        # Changes are popped until the write is acknowledged, they are put
+        # back with restore if it fails.
+        version = uuid4().hex
+        operations = []
+        changes: list[Changes] = []
+        popped: list[Contract] = []
+        try:
+            for contract in contracts:
+                # Positions of branches change on compaction.
+                whole = contract.compacted or contract.uuid not in self._versions
+                added, replaced = contract.pop_changes()
+                popped.append(contract)
+                if whole:
+                    # Stored as a whole, so is its timeline.
+                    added = list(contract.items)
+
+                operation = self._operation(
+                    contract, added, None if whole else replaced, version
+                )
+                if operation is not None:
+                    operations.append(operation)
+                    changes.append(
+                        (contract, added, None if whole else list(replaced.values()))
+                    )
+        except BaseException:
+            restore(popped)
+            raise
+        return version, operations, changes
+
+    def _written(self, result: BulkWriteResult | BulkWriteError) -> int:
+        # Number of documents written, given the result of a bulk write or
+        # the error it raised. Duplicate keys only come from contracts
+        # stored meanwhile by another writer, those are conflicts, other
+        # errors are raised.
+        if isinstance(result, BulkWriteResult):
+            return result.upserted_count + result.modified_count
+
+        details = result.details
+        if any(error["code"] != 11000 for error in details["writeErrors"]):
+            raise result
+        return details["nUpserted"] + details["nModified"]  # type: ignore[no-any-return]
+
+    def _settle(
+        self, version: str, changes: list[Changes], applied: set[str] | None
+    ) -> tuple[list[DeleteMany | InsertOne[Document]], list[str]]:
+        # Given the uuids of the contracts whose update applied (None if
+        # all did), records the new versions. Returns the operations to
+        # bring the timeline up to date, along with the conflicting uuids.
+        conflicts = []
+        settled = []
+        for contract, added, replaced in changes:
+            if applied is None or contract.uuid in applied:
+                self._versions[contract.uuid] = version
+                settled.append((contract, added, replaced))
+            else:
+                conflicts.append(contract.uuid)
+        return self._timeline_operations(settled), conflicts
+
+    def _timeline_operations(
+        self, changes: Iterable[Changes]
+    ) -> list[DeleteMany | InsertOne[Document]]:
+        # Rows of replaced branches are removed, active branches added get
+        # a row with their effective data, references resolved. These are
+        # meant to be written in order.
+        operations: list[DeleteMany | InsertOne[Document]] = []
+        if self.timeline is None:
+            return operations
+
+        for contract, added, replaced in changes:
+            if replaced is None:
+                operations.append(DeleteMany({"contract": contract.uuid}))
+            elif replaced:
+                uuids = [branch.uuid for branch in replaced]
+                operations.append(DeleteMany({"uuid": {"$in": uuids}}))
+            operations.extend(
+                InsertOne(
+                    {
+                        "contract": contract.uuid,
+                        "uuid": branch.uuid,
+                        "start_at": branch.start_at,
+                        "end_at": branch.end_at,
+                        "data": contract.resolve(branch),
+                    }
+                )
+                for branch in added
+                if not branch.replaced_by
+            )
+        return operations
+
+    def _point_query(
+        self, uuid: str, at: datetime
+    ) -> tuple[dict[str, Any], dict[str, Any], list[tuple[str, int]]]:
+        # Active branches don't overlap, so only the latest one starting
+        # before the date can contain it.
+        assert self.timeline is not None
+        return (
+            {"contract": uuid, "start_at": {"$lte": at}},
+            {"_id": False, "end_at": True, "data": True},
+            [("start_at", DESCENDING)],
+        )
+
+    def _point_data(
+        self, row: dict[str, Any] | None, at: datetime
+    ) -> dict[str, Any] | None:
+        if row is None:
+            return None
+
+        # Unless the client is timezone aware, dates are returned naive.
+        end_at = row["end_at"]
+        if end_at.tzinfo is None:
+            end_at = end_at.replace(tzinfo=utc)
+        if end_at <= at:
+            return None
+        return row["data"]  # type: ignore[no-any-return]
+
+    def _range_query(
+        self, at: datetime, uuids: Iterable[str] | None
+    ) -> tuple[dict[str, Any], dict[str, Any]]:
+        assert self.timeline is not None
+        query: dict[str, Any] = {"start_at": {"$lte": at}, "end_at": {"$gt": at}}
+        if uuids is not None:
+            query["contract"] = {"$in": list(uuids)}
+        return query, {"_id": False, "contract": True, "data": True}
+
+
+def restore(contracts: Iterable[Contract]) -> None:
+    for contract in contracts:
+        contract.restore_changes()
+
+
+def conflict(uuids: list[str]) -> ConflictError:
+    return ConflictError(
+        "Contracts were modified since they were loaded: %s." % ", ".join(uuids)
+    )
+
+
+class MongoBackend(BaseMongoBackend):
+    def __init__(
+        self, collection: Collection, timeline: Collection | None = None
+    ) -> None:
+        super().__init__(collection, timeline)
         self.collection: Collection = collection
+        self.timeline: Collection | None = timeline
+
+    def ensure_indexes(self) -> None:
+        self.collection.create_index("uuid", unique=True)
+        if self.timeline is not None:
+            self.timeline.create_index([("contract", 1), ("start_at", DESCENDING)])
+            self.timeline.create_index([("start_at", 1), ("end_at", 1)])
+            self.timeline.create_index("uuid")
 
     def set_contract(self, uuid: str | None) -> None:
         if uuid is None:
-            self._contract = None
+            self.unset()
         else:
-            collection = self.collection.find_one({"uuid": uuid}, {"_id": False})
-            collection = json.dumps(collection)
-            self._contract = from_json(collection)
+            document = self.collection.find_one({"uuid": uuid}, {"_id": False})
+            if document is None:
+                self.unset()
+            else:
+                self._contract = self._load(document)
 
-    def unset(self) -> None:
-        self._contract = None
+    def load_many(
+        self, uuids: Iterable[str], *, batch_size: int = 1000
+    ) -> Iterator[Contract]:
+        # Contracts are fetched with a single query and decoded as the
+        # cursor yields them, in no particular order. Unknown uuids are
+        # skipped.
+        cursor = self.collection.find(
+            {"uuid": {"$in": list(uuids)}}, {"_id": False}
+        ).batch_size(batch_size)
+        for document in cursor:
+            yield self._load(document)
 
     def commit(self) -> None:
+        # Raises ConflictError if the stored document was modified since
+        # the contract was loaded, the contract must be reloaded then.
         assert self._contract
-        contract_data = json.loads(to_json(self._contract))
-        self.collection.replace_one(
-            {"uuid": self._contract.uuid},
-            contract_data,
-            upsert=True,
+        self.commit_many([self._contract])
+
+    def commit_many(self, contracts: Iterable[Contract]) -> None:
+        # Commits all contracts with a single bulk write. Conflicting
+        # updates don't prevent the others from being applied.
+        version, operations, changes = self._prepare(contracts)
+        if not operations:
+            return
+
+        try:
+            result: BulkWriteResult | BulkWriteError
+            try:
+                result = self.collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as error:
+                result = error
+            written = self._written(result)
+        except BaseException:
+            restore(contract for contract, _, _ in changes)
+            raise
+
+        applied = None
+        if written < len(operations):
+            # Find out which of the updates did not match, those documents
+            # are not at the version just written.
+            uuids = [contract.uuid for contract, _, _ in changes]
+            applied = {
+                document["uuid"]
+                for document in self.collection.find(
+                    {"uuid": {"$in": uuids}, "version": version}, {"uuid": True}
+                )
+            }
+
+        timeline, conflicts = self._settle(version, changes, applied)
+        if timeline:
+            assert self.timeline is not None
+            self.timeline.bulk_write(timeline)
+
+        if conflicts:
+            raise conflict(conflicts)
+
+    def reindex(self, contracts: Iterable[Contract]) -> None:
+        # Rebuilds the timeline of given contracts, e.g. the ones stored
+        # before the backend had a timeline collection.
+        assert self.timeline is not None
+        operations = self._timeline_operations(
+            (contract, list(contract.items), None) for contract in contracts
         )
+        if operations:
+            self.timeline.bulk_write(operations)
+
+    def get_data(self, uuid: str, *, at: datetime) -> dict[str, Any] | None:
+        # Effective data of a contract at given date.
+        at, _ = validate_tz(at)
+        query, projection, sort = self._point_query(uuid, at)
+        assert self.timeline is not None
+        return self._point_data(
+            self.timeline.find_one(query, projection, sort=sort), at
+        )
+
+    def get_data_many(
+        self, *, at: datetime, uuids: Iterable[str] | None = None
+    ) -> dict[str, dict[str, Any]]:
+        # Effective data at given date by contract uuid, across all
+        # contracts or the given ones. Contracts not in effect are omitted.
+        at, _ = validate_tz(at)
+        query, projection = self._range_query(at, uuids)
+        assert self.timeline is not None
+        return {
+            row["contract"]: row["data"]
+            for row in self.timeline.find(query, projection)
+        }
+
+
+class AsyncMongoBackend(AsyncBackend, BaseMongoBackend):
+    # Same storage as MongoBackend through an asyncio driver such as motor,
+    # collection methods are awaited and cursors iterated with async for.
+    async def load(self, uuid: str) -> Contract | None:
+        # Loads a contract without making it the current one, so that many
+        # can be loaded concurrently.
+        document = await self.collection.find_one({"uuid": uuid}, {"_id": False})
+        if document is None:
+            return None
+        return self._load(document)
+
+    async def set_contract(self, uuid: str | None) -> None:
+        self._contract = None if uuid is None else await self.load(uuid)
+
+    async def load_many(
+        self, uuids: Iterable[str], *, batch_size: int = 1000
+    ) -> AsyncIterator[Contract]:
+        cursor = self.collection.find(
+            {"uuid": {"$in": list(uuids)}}, {"_id": False}
+        ).batch_size(batch_size)
+        async for document in cursor:
+            yield self._load(document)
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index("uuid", unique=True)
+        if self.timeline is not None:
+            await self.timeline.create_index(
+                [("contract", 1), ("start_at", DESCENDING)]
+            )
+            await self.timeline.create_index([("start_at", 1), ("end_at", 1)])
+            await self.timeline.create_index("uuid")
+
+    async def commit(self) -> None:
+        assert self._contract
+        await self.commit_many([self._contract])
+
+    async def commit_many(self, contracts: Iterable[Contract]) -> None:
+        version, operations, changes = self._prepare(contracts)
+        if not operations:
+            return
+
+        try:
+            try:
+                result = await self.collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as error:
+                result = error
+            written = self._written(result)
+        except BaseException:
+            restore(contract for contract, _, _ in changes)
+            raise
+
+        applied = None
+        if written < len(operations):
+            uuids = [contract.uuid for contract, _, _ in changes]
+            cursor = self.collection.find(
+                {"uuid": {"$in": uuids}, "version": version}, {"uuid": True}
+            )
+            applied = {document["uuid"] async for document in cursor}
+
+        timeline, conflicts = self._settle(version, changes, applied)
+        if timeline:
+            assert self.timeline is not None
+            await self.timeline.bulk_write(timeline)
+
+        if conflicts:
+            raise conflict(conflicts)
+
+    async def get_data(self, uuid: str, *, at: datetime) -> dict[str, Any] | None:
+        at, _ = validate_tz(at)
+        query, projection, sort = self._point_query(uuid, at)
+        assert self.timeline is not None
+        row = await self.timeline.find_one(query, projection, sort=sort)
+        return self._point_data(row, at)
+
+    async def get_data_many(
+        self, *, at: datetime, uuids: Iterable[str] | None = None
+    ) -> dict[str, dict[str, Any]]:
+        at, _ = validate_tz(at)
+        query, projection = self._range_query(at, uuids)
+        assert self.timeline is not None
+        return {
+            row["contract"]: row["data"]
+            async for row in self.timeline.find(query, projection)
+        }
+
+
+def mongo(collection: Collection, timeline: Collection | None = None) -> MongoBackend:
+    return MongoBackend(collection, timeline)
 
 
-def mongo(collection: Collection) -> MongoBackend:
-    return MongoBackend(collection)
+def amongo(collection: Any, timeline: Any | None = None) -> AsyncMongoBackend:
+    return AsyncMongoBackend(collection, timeline)
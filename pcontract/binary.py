@@ -0,0 +1,290 @@
+import array
+import bisect
+import json
+import mmap
+import struct
+from datetime import datetime
+from pathlib import Path
+from types import TracebackType
+from typing import Any, TypeVar, cast
+
+from pcontract.data import (
+    Branch,
+    BranchArray,
+    Contract,
+    from_micros,
+    to_micros,
+    validate_tz,
+)
+from pcontract.serialization import Encoder
+
+T = TypeVar("T", bound="MappedContract")
+
+MAGIC = b"PCNT"
+VERSION = 1
+
+# magic, version, branch count, active branch count, created_at, uuid,
+# length of meta
+HEADER = struct.Struct("<4sH2xIIq16sI")
+# start_at, end_at, position of the branch
+ACTIVE = struct.Struct("<qqI")
+# uuid, start_at, end_at, created_at, payload offset, payload length
+ITEM = struct.Struct("<16sqqqQI")
+# uuid, position of the branch
+UUID = struct.Struct("<16sI")
+
+# A contract file consists of the header and meta, followed by the index
+# of active branches sorted by start date, the table of all branches, the
+# index of branches sorted by uuid and finally the payloads of branches
+# (data and replaced_by), which are the only variable sized parts.
+
+
+def to_bytes(contract: Contract) -> bytes:
+    items = list(contract.items)
+    # Dates within data and meta are encoded as by Encoder.
+    default = Encoder().default
+    meta = json.dumps(contract.meta, default=default).encode()
+    payloads = [
+        json.dumps(
+            {"data": branch.data, "replaced_by": branch.replaced_by},
+            separators=(",", ":"),
+            default=default,
+        ).encode()
+        for branch in items
+    ]
+    active = sorted(
+        (branch.start_at, index)
+        for index, branch in enumerate(items)
+        if not branch.replaced_by
+    )
+    uuids = [bytes.fromhex(branch.uuid) for branch in items]
+
+    parts = [
+        HEADER.pack(
+            MAGIC,
+            VERSION,
+            len(items),
+            len(active),
+            to_micros(contract.created_at),
+            bytes.fromhex(contract.uuid),
+            len(meta),
+        ),
+        meta,
+    ]
+    parts.extend(
+        ACTIVE.pack(
+            to_micros(start_at),
+            to_micros(cast(datetime, items[index].end_at)),
+            index,
+        )
+        for start_at, index in active
+    )
+
+    offset = (
+        HEADER.size
+        + len(meta)
+        + ACTIVE.size * len(active)
+        + (ITEM.size + UUID.size) * len(items)
+    )
+    for branch, uid, payload in zip(items, uuids, payloads):
+        parts.append(
+            ITEM.pack(
+                uid,
+                to_micros(branch.start_at),
+                to_micros(cast(datetime, branch.end_at)),
+                to_micros(branch.created_at),
+                offset,
+                len(payload),
+            )
+        )
+        offset += len(payload)
+
+    parts.extend(
+        UUID.pack(uid, index) for uid, index in sorted(zip(uuids, range(len(items))))
+    )
+    parts.extend(payloads)
+    return b"".join(parts)
+
+
+def from_bytes(b: bytes) -> Contract:
+    return MappedContract(b).load()
+
+
+class MappedContract:
+    # Read-only view of a contract file. The file is memory-mapped and
+    # branches are decoded on access, so point lookups only touch the
+    # pages holding the indexes and the branch found.
+    def __init__(self, source: str | Path | bytes) -> None:
+        self._buffer: bytes | mmap.mmap
+        if isinstance(source, bytes):
+            self._buffer = source
+        else:
+            with open(source, "rb") as f:
+                self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count, active, created_at, uid, size = HEADER.unpack_from(
+            self._buffer
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Given source is not a contract file.")
+
+        self.uuid: str = uid.hex()
+        self.created_at: datetime = from_micros(created_at)
+        self.meta: dict[str, Any] = json.loads(
+            self._buffer[HEADER.size : HEADER.size + size]
+        )
+        self._count: int = count
+        self._active: int = active
+        self._active_at = HEADER.size + size
+        self._items_at = self._active_at + ACTIVE.size * active
+        self._uuids_at = self._items_at + ITEM.size * count
+
+    def __enter__(self: T) -> T:
+        return self
+
+    def __exit__(
+        self,
+        exctype: type[BaseException] | None,
+        excinst: BaseException | None,
+        exctb: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def __repr__(self) -> str:
+        return "<%s %s>" % (self.__class__.__name__, self.uuid)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> Branch:
+        if index < 0:
+            index += self._count
+
+        if not 0 <= index < self._count:
+            raise IndexError("branch index out of range")
+
+        uid, start_at, end_at, created_at, offset, size = ITEM.unpack_from(
+            self._buffer, self._items_at + ITEM.size * index
+        )
+        payload = json.loads(self._buffer[offset : offset + size])
+        return Branch.restore(
+            uuid=uid.hex(),
+            data=payload["data"],
+            start_at=from_micros(start_at),
+            end_at=from_micros(end_at),
+            created_at=from_micros(created_at),
+            replaced_by=payload["replaced_by"],
+        )
+
+    def close(self) -> None:
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+    def find(self, uid: str) -> Branch | None:
+        index = self.index(uid)
+        return None if index is None else self[index]
+
+    def index(self, uid: str) -> int | None:
+        # Position of the branch of the given uuid, if any.
+        key = bytes.fromhex(uid)
+        position = bisect.bisect_left(range(self._count), key, key=self._uuid_at)
+        if position < self._count and self._uuid_at(position) == key:
+            (_, index) = UUID.unpack_from(
+                self._buffer, self._uuids_at + UUID.size * position
+            )
+            return cast(int, index)
+        return None
+
+    def active(self) -> list[int]:
+        # Positions of the active branches, by start date.
+        return [
+            index
+            for _, _, index in ACTIVE.iter_unpack(
+                self._buffer[self._active_at : self._items_at]
+            )
+        ]
+
+    def _uuid_at(self, position: int) -> bytes:
+        offset = self._uuids_at + UUID.size * position
+        return self._buffer[offset : offset + 16]
+
+    def _start_at(self, position: int) -> int:
+        (start_at,) = struct.unpack_from(
+            "<q", self._buffer, self._active_at + ACTIVE.size * position
+        )
+        return cast(int, start_at)
+
+    def get_branch(self, *, at: datetime) -> Branch | None:
+        at, _ = validate_tz(at)
+        point = to_micros(at)
+        position = (
+            bisect.bisect_right(range(self._active), point, key=self._start_at) - 1
+        )
+
+        if position < 0:
+            return None
+
+        _, end_at, index = ACTIVE.unpack_from(
+            self._buffer, self._active_at + ACTIVE.size * position
+        )
+        if point < end_at:
+            return self[index]
+        return None
+
+    def resolve(self, branch: Branch) -> dict[str, Any]:
+        while "_ref" in branch.data:
+            branch = cast(Branch, self.find(branch.data["_ref"]))
+        return branch.data
+
+    def load(self) -> Contract:
+        # Only the active branches are decoded, the others are decoded from
+        # the view on access, which must stay open as long as the contract
+        # is used.
+        contract = Contract(items=MappedArray(self), meta=self.meta)
+        contract.uuid = self.uuid
+        contract.created_at = self.created_at
+        return contract
+
+
+def unmapped(branches: list[Branch]) -> BranchArray:
+    items = BranchArray(branches)
+    items.pack()
+    return items
+
+
+class MappedArray(BranchArray):
+    # Branches of a contract file followed by the ones added since, which
+    # are handled as by BranchArray. Replaced branches of the file are
+    # packed from the start, decoded from the view on access.
+    __slots__ = ("view",)
+
+    def __init__(self, view: MappedContract) -> None:
+        super().__init__()
+        self.view = view
+        count = len(view)
+        self._starts = array.array("q", bytes(8 * count))
+        self._ends = array.array("q", bytes(8 * count))
+        self._created = array.array("q", bytes(8 * count))
+        self._uuids = bytearray(16 * count)
+        self._data = [None] * count
+        self._replaced_by = [b""] * count
+        self.live = {index: view[index] for index in view.active()}
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        # Pickled as a BranchArray, views can't be.
+        return unmapped, (list(self),)
+
+    def find(self, uid: str, /) -> Branch | None:
+        index = self.view.index(uid)
+        if index is None:
+            return super().find(uid)
+        return self[index]
+
+    def _materialize(self, index: int) -> Branch:
+        if index < len(self.view) and self._data[index] is None:
+            return self.view[index]
+        return super()._materialize(index)
+
+
+def mapped(filename: str | Path) -> MappedContract:
+    return MappedContract(filename)
@@ -1,23 +1,69 @@
 from __future__ import annotations
 
+import array
+import bisect
+import collections
+import contextlib
+import itertools
+import os
+import threading
+import time
 import typing
-import uuid
 import warnings
 import zoneinfo
 from datetime import datetime, timedelta
-from typing import Any, Type, cast
+from operator import attrgetter
+from typing import IO, Any, Callable, Iterable, Iterator, Sequence, Type, cast
+
+from pcontract.aggregate import Aggregate, Series
+from pcontract.history import History, Snapshot
+from pcontract.probe import Probe, Sample, observed
+from pcontract.store import DataStore
 
 __version__ = "1.0.0"
 __all__ = ["Branch", "Contract"]
 
 zero = timedelta()
 utc = zoneinfo.ZoneInfo("UTC")
+epoch = datetime(1970, 1, 1, tzinfo=utc)
+microsecond = timedelta(microseconds=1)
 
 
 def is_aware(dt: datetime, /) -> bool:
     return dt.tzinfo is not None and dt.tzinfo.utcoffset(dt) is not None
 
 
+def to_micros(dt: datetime, /) -> int:
+    return (dt - epoch) // microsecond
+
+
+def from_micros(value: int, /) -> datetime:
+    return epoch + timedelta(microseconds=value)
+
+
+# Ids are drawn from the system's random source in batches, forked
+# processes start over so that they don't hand out the same ids. There's
+# no fork on Windows.
+uuids: collections.deque[str] = collections.deque()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=uuids.clear)
+
+
+def new_uuid() -> str:
+    # Same as uuid.uuid4().hex, with one urandom call per 256 ids.
+    try:
+        return uuids.popleft()
+    except IndexError:
+        pass
+
+    raw = bytearray(os.urandom(16 * 256))
+    raw[6::16] = bytes(byte & 0x0F | 0x40 for byte in raw[6::16])
+    raw[8::16] = bytes(byte & 0x3F | 0x80 for byte in raw[8::16])
+    hexed = raw.hex()
+    uuids.extend(hexed[n : n + 32] for n in range(32, len(hexed), 32))
+    return hexed[:32]
+
+
 def validate_tz(
     start_at: datetime, end_at: datetime | None = None, /
 ) -> tuple[datetime, datetime | None]:
@@ -38,7 +84,36 @@ def validate_tz(
     return start_at, end_at
 
 
+# Slots of classes and of their bases, by class.
+slots_of: dict[type, tuple[str, ...]] = {}
+
+
+def slot_names(cls: type) -> tuple[str, ...]:
+    names = slots_of.get(cls)
+    if names is None:
+        found: list[str] = []
+        for klass in reversed(cls.__mro__):
+            slots = klass.__dict__.get("__slots__", ())
+            found.extend(
+                name
+                for name in ((slots,) if isinstance(slots, str) else slots)
+                if name not in ("__dict__", "__weakref__")
+            )
+        names = slots_of[cls] = tuple(found)
+    return names
+
+
 class Branch:
+    __slots__ = (
+        "start_at",
+        "end_at",
+        "created_at",
+        "updated_at",
+        "replaced_by",
+        "uuid",
+        "data",
+    )
+
     def __init__(
         self,
         *,
@@ -55,9 +130,52 @@ class Branch:
         self.updated_at: datetime = now
         self.replaced_by: list[str] = []
 
-        self.uuid: str = uuid.uuid4().hex
+        self.uuid: str = new_uuid()
         self.data: dict[str, Any] = data or {}
 
+    @classmethod
+    def create(
+        cls,
+        *,
+        data: dict[str, Any],
+        start_at: datetime,
+        end_at: datetime,
+        now: datetime,
+    ) -> Branch:
+        # Same as __init__, for dates that are known to be aware and a
+        # clock reading shared by all branches of an operation.
+        branch = cls.__new__(cls)
+        branch.uuid = new_uuid()
+        branch.data = data
+        branch.start_at = start_at
+        branch.end_at = end_at
+        branch.created_at = now
+        branch.updated_at = now
+        branch.replaced_by = []
+        return branch
+
+    @classmethod
+    def restore(
+        cls,
+        *,
+        uuid: str,
+        data: dict[str, Any],
+        start_at: datetime,
+        end_at: datetime | None,
+        created_at: datetime,
+        replaced_by: list[str],
+    ) -> Branch:
+        # Rebuild a stored branch, skipping the defaults set by __init__.
+        branch = cls.__new__(cls)
+        branch.uuid = uuid
+        branch.data = data
+        branch.start_at = start_at
+        branch.end_at = end_at
+        branch.created_at = created_at
+        branch.updated_at = created_at
+        branch.replaced_by = replaced_by
+        return branch
+
     def __repr__(self) -> str:
         return (
             "<%s %s start_at=%-26s end_at=%-26s span=%-26s data=%s"
@@ -78,25 +196,359 @@ class Branch:
             return NotImplemented
         return self.uuid == other.uuid
 
+    def __getstate__(self) -> dict[str, Any]:
+        if type(self) is Branch:
+            return {name: getattr(self, name) for name in Branch.__slots__}
+
+        # Attributes of subclasses are kept too, in slots or in __dict__.
+        state = {
+            name: getattr(self, name)
+            for name in slot_names(type(self))
+            if hasattr(self, name)
+        }
+        state.update(getattr(self, "__dict__", {}))
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
+
     @property
     def span(self) -> timedelta:
         assert isinstance(self.end_at, datetime)
         return self.end_at - self.start_at
 
 
+class BranchArray(Sequence[Branch]):
+    # A list of branches in which branches that will not change anymore
+    # (i.e., replaced ones) can be packed into compact columns, holding
+    # dates as epoch microseconds and uuids as bytes. Packed branches are
+    # materialized on access; their dates are given in UTC.
+    __slots__ = (
+        "klass",
+        "live",
+        "_starts",
+        "_ends",
+        "_created",
+        "_uuids",
+        "_data",
+        "_replaced_by",
+        "_sorted",
+    )
+
+    def __init__(
+        self, branches: Iterable[Branch] = (), *, klass: Type[Branch] = Branch
+    ) -> None:
+        self.klass: Type[Branch] = klass
+        self.live: dict[int, Branch] = {}
+        self._starts = array.array("q")
+        self._ends = array.array("q")
+        self._created = array.array("q")
+        self._uuids = bytearray()
+        self._data: list[dict[str, Any] | bytes | None] = []
+        self._replaced_by: list[bytes] = []
+        self._sorted = array.array("l")
+
+        for branch in branches:
+            self.append(branch)
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @typing.overload
+    def __getitem__(self, index: int) -> Branch: ...
+
+    @typing.overload
+    def __getitem__(self, index: slice) -> list[Branch]: ...
+
+    def __getitem__(self, index: int | slice) -> Branch | list[Branch]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+
+        if (branch := self.live.get(index)) is not None:
+            return branch
+
+        if not 0 <= index < len(self):
+            raise IndexError("branch index out of range")
+        return self._materialize(index)
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {name: getattr(self, name) for name in BranchArray.__slots__}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def append(self, branch: Branch, /) -> None:
+        self.live[len(self)] = branch
+        self._starts.append(0)
+        self._ends.append(0)
+        self._created.append(0)
+        self._uuids.extend(bytes(16))
+        self._data.append(None)
+        self._replaced_by.append(b"")
+
+    def pack(self) -> None:
+        for index, branch in list(self.live.items()):
+            if not branch.replaced_by:
+                continue
+
+            data: dict[str, Any] | bytes = branch.data
+            if list(branch.data) == ["_ref"]:
+                data = bytes.fromhex(branch.data["_ref"])
+
+            self._starts[index] = to_micros(branch.start_at)
+            self._ends[index] = to_micros(cast(datetime, branch.end_at))
+            self._created[index] = to_micros(branch.created_at)
+            self._uuids[16 * index : 16 * (index + 1)] = bytes.fromhex(branch.uuid)
+            self._data[index] = data
+            self._replaced_by[index] = b"".join(
+                bytes.fromhex(uid) for uid in branch.replaced_by
+            )
+            del self.live[index]
+
+        # Packed branches are looked up by binary search over their uuids.
+        self._sorted = array.array(
+            "l",
+            sorted(
+                (index for index in range(len(self)) if self._data[index] is not None),
+                key=self._uuid_at,
+            ),
+        )
+
+    def intern(self, store: DataStore) -> None:
+        for branch in self.live.values():
+            if "_ref" not in branch.data:
+                branch.data = store.intern(branch.data)
+
+        self._data = [
+            store.intern(data) if isinstance(data, dict) else data
+            for data in self._data
+        ]
+
+    def find(self, uid: str, /) -> Branch | None:
+        # Finds a packed branch by its uuid.
+        key = bytes.fromhex(uid)
+        position = bisect.bisect_left(self._sorted, key, key=self._uuid_at)
+
+        if position < len(self._sorted):
+            index = self._sorted[position]
+            if self._uuid_at(index) == key:
+                return self._materialize(index)
+        return None
+
+    def _uuid_at(self, index: int) -> bytes:
+        return bytes(self._uuids[16 * index : 16 * (index + 1)])
+
+    def _materialize(self, index: int) -> Branch:
+        data = self._data[index]
+        replaced_by = self._replaced_by[index]
+
+        return self.klass.restore(
+            uuid=self._uuid_at(index).hex(),
+            data={"_ref": data.hex()} if isinstance(data, bytes) else data or {},
+            start_at=from_micros(self._starts[index]),
+            end_at=from_micros(self._ends[index]),
+            created_at=from_micros(self._created[index]),
+            replaced_by=[
+                replaced_by[i : i + 16].hex() for i in range(0, len(replaced_by), 16)
+            ],
+        )
+
+
+# Called with a contract and the active branches replaced by a write, and
+# the ones replacing them.
+Watcher = Callable[["Contract", list[Branch], list[Branch]], None]
+
+
 class Contract:
+    __slots__ = (
+        "items",
+        "klass",
+        "uuid",
+        "meta",
+        "created_at",
+        "store",
+        "_branches",
+        "_order",
+        "_active",
+        "_starts",
+        "_arrays",
+        "_resolved",
+        "_mark",
+        "_replaced",
+        "_popped",
+        "_view",
+        "_lock",
+        "_compacted",
+        "_history",
+        "_series",
+        "_probe",
+        "_watchers",
+    )
+
     def __init__(
         self,
         *,
-        items: list[Branch],
+        items: list[Branch] | BranchArray,
         meta: dict[str, Any] | None = None,
         klass: Type[Branch] = Branch,
     ) -> None:
-        self.items: list[Branch] = items
+        self.items: list[Branch] | BranchArray = items
         self.klass: Type[Branch] = klass
-        self.uuid: str = uuid.uuid4().hex
+        self.uuid: str = new_uuid()
         self.meta: dict[str, Any] = meta or {}
         self.created_at = datetime.now(tz=utc)
+        self.store: DataStore | None = None
+        self._lock: threading.Lock | None = None
+        self._probe: Probe | None = None
+        self._watchers: tuple[Watcher, ...] = ()
+        self._reindex()
+        self._reset_changes()
+        self._popped: tuple[int, set[int], bool] = (self._mark, set(), False)
+
+    def _reindex(self) -> None:
+        items = self.items
+        pairs: Iterable[tuple[int, Branch]] = (
+            items.live.items() if isinstance(items, BranchArray) else enumerate(items)
+        )
+        self._branches: dict[str, Branch] = {}
+        self._order: list[int] = []
+
+        for index, item in pairs:
+            self._branches[item.uuid] = item
+            if not item.replaced_by:
+                self._order.append(index)
+
+        # Active branches never overlap, so keeping them sorted by start
+        # date allows locating any point in time with a binary search.
+        # Positions of these branches within items are kept alongside.
+        self._order.sort(key=lambda index: items[index].start_at)
+        self._active: list[Branch] = [items[index] for index in self._order]
+        self._starts: list[datetime] = [item.start_at for item in self._active]
+        self._arrays: tuple[Any, ...] | None = None
+        self._resolved: dict[str, dict[str, Any]] = {}
+        self._history: History | None = None
+        self._series: dict[str, Series] = {}
+        self._publish()
+
+    def _publish(self) -> None:
+        # Readers go through the view, active branches along with their
+        # start dates. Once shared, the view is a copy replaced as a whole
+        # after each write, so readers never see a write half applied.
+        if self._lock is None:
+            self._view: tuple[list[datetime], list[Branch]] = (
+                self._starts,
+                self._active,
+            )
+        else:
+            self._view = (list(self._starts), list(self._active))
+
+    def share(self) -> Contract:
+        # Makes the contract safe to use from many threads, writers are
+        # serialized while readers keep working on the latest view without
+        # locking. Not kept on pickling.
+        if self._lock is None:
+            self._lock = threading.Lock()
+            self._publish()
+        return self
+
+    def instrument(self, probe: Probe | None) -> Contract:
+        # Reports a sample of each branch, branch_many, get_branch,
+        # get_branches and aggregate call to the probe, None turns it off.
+        # Not kept on pickling.
+        self._probe = probe
+        return self
+
+    def watch(self, watcher: Watcher) -> Contract:
+        # Calls the watcher on each change of the active branches, from
+        # within the write. Not kept on pickling.
+        self._watchers = (*self._watchers, watcher)
+        return self
+
+    def unwatch(self, watcher: Watcher) -> Contract:
+        self._watchers = tuple(w for w in self._watchers if w != watcher)
+        return self
+
+    def _observing(self) -> bool:
+        # Whether a call is to be observed, rather than being part of one.
+        return self._probe is not None and id(self) not in observed.counts
+
+    def _observe(self, operation: str, method: Any, *args: Any, **kwargs: Any) -> Any:
+        # Calls the method again with counters set for the current thread,
+        # which also keeps it from being observed twice. Counters are only
+        # looked up when a probe is set, so that they cost nothing otherwise.
+        probe = cast(Probe, self._probe)
+        key = id(self)
+        observed.counts[key] = counts = [0, 0, 0]
+        began = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - began
+            del observed.counts[key]
+            probe(Sample(operation, elapsed, *counts))
+
+    def _count(self, index: int, amount: int = 1) -> None:
+        counts = observed.counts.get(id(self))
+        if counts is not None:
+            counts[index] += amount
+
+    @contextlib.contextmanager
+    def _writing(self) -> Iterator[None]:
+        if self._lock is None:
+            yield
+            return
+
+        with self._lock:
+            try:
+                yield
+            finally:
+                self._arrays = None
+                self._publish()
+
+    def __getstate__(self) -> dict[str, Any]:
+        # Indexes are derived from items, rebuild them on unpickling.
+        # Attributes of subclasses are kept, in slots or in __dict__.
+        state = {
+            "items": self.items,
+            "klass": self.klass,
+            "uuid": self.uuid,
+            "meta": self.meta,
+            "created_at": self.created_at,
+        }
+        if type(self) is not Contract:
+            own = slot_names(Contract)
+            state.update(
+                (name, getattr(self, name))
+                for name in slot_names(type(self))
+                if name not in own and hasattr(self, name)
+            )
+            state.update(getattr(self, "__dict__", {}))
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        state = dict(state)
+        self.items = state.pop("items")
+        self.klass = state.pop("klass")
+        self.uuid = state.pop("uuid")
+        self.meta = state.pop("meta")
+        self.created_at = state.pop("created_at")
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.store = None
+        self._lock = None
+        self._probe = None
+        self._watchers = ()
+        self._reindex()
+        self._reset_changes()
+        self._popped = (self._mark, set(), False)
 
     def __repr__(self) -> str:
         return "<%s %s>" % (self.__class__.__name__, repr(self.items))
@@ -128,11 +580,103 @@ class Contract:
         start_at: datetime,
         end_at: datetime | None = None,
     ) -> Branch:
+        if self._observing():
+            return cast(
+                Branch,
+                self._observe(
+                    "branch", self.branch, data, start_at=start_at, end_at=end_at
+                ),
+            )
+
         start_at, end_at = validate_tz(start_at, end_at)
-        items: list[Branch] = [item for item in self.items if not item.replaced_by]
+        if self.store is not None:
+            data = self.store.intern(data)
+
+        now = datetime.now(tz=utc)
+        with self._writing():
+            branch = self._create(data, start_at, end_at, self._max_end, now)
+            self._apply([branch])
+        return branch
+
+    def branch_many(
+        self,
+        amendments: Iterable[tuple[dict[str, Any], datetime, datetime | None]],
+    ) -> list[Branch]:
+        if self._observing():
+            return cast(
+                list[Branch], self._observe("branch_many", self.branch_many, amendments)
+            )
+
+        entries, naive = [], False
+        for data, start_at, end_at in amendments:
+            if not is_aware(start_at):
+                start_at, naive = start_at.replace(tzinfo=utc), True
+            if end_at and not is_aware(end_at):
+                end_at, naive = end_at.replace(tzinfo=utc), True
+            if self.store is not None:
+                data = self.store.intern(data)
+            entries.append((data, start_at, end_at))
 
-        max_end: datetime = max(cast(datetime, item.end_at) for item in items)
-        min_start: datetime = min(item.start_at for item in items)
+        if naive:
+            warnings.warn(
+                "Received naive datetimes for amendments, assuming UTC.",
+                stacklevel=2,
+            )
+
+        with self._writing():
+            # Every amendment is validated against the boundary it would
+            # see if branched one by one, before the contract is touched.
+            branches, max_end = [], self._max_end
+            now = datetime.now(tz=utc)
+            for data, start_at, end_at in entries:
+                branch = self._create(data, start_at, end_at, max_end, now)
+                max_end = max(max_end, cast(datetime, branch.end_at))
+                branches.append(branch)
+
+            ordered = sorted(branches, key=attrgetter("start_at"))
+            if any(
+                cast(datetime, prev.end_at) > succ.start_at
+                for prev, succ in zip(ordered, ordered[1:])
+            ):
+                # Later amendments override earlier ones, order matters.
+                for branch in branches:
+                    self._apply([branch])
+            else:
+                for run in self._runs(ordered):
+                    self._apply(run)
+        return branches
+
+    def _runs(self, branches: list[Branch]) -> Iterator[list[Branch]]:
+        # Splits sorted branches into runs overlapping the same active
+        # branches, so that the ones in between are left untouched.
+        active, starts = self._active, self._starts
+        run: list[Branch] = []
+        last = -1
+        for branch in branches:
+            first = bisect.bisect_right(starts, branch.start_at) - 1
+            if first >= 0 and cast(datetime, active[first].end_at) <= branch.start_at:
+                first += 1
+            if run and first > last:
+                yield run
+                run = []
+            run.append(branch)
+            last = bisect.bisect_left(starts, cast(datetime, branch.end_at)) - 1
+        if run:
+            yield run
+
+    @property
+    def _max_end(self) -> datetime:
+        return cast(datetime, self._active[-1].end_at)
+
+    def _create(
+        self,
+        data: dict[str, Any],
+        start_at: datetime,
+        end_at: datetime | None,
+        max_end: datetime,
+        now: datetime,
+    ) -> Branch:
+        min_start: datetime = self._active[0].start_at
 
         if (start_at > max_end) or (start_at < min_start):
             raise ValueError(
@@ -142,70 +686,299 @@ class Contract:
             )
 
         end_at = end_at or max_end
-        branch = self.klass(data=data, start_at=start_at, end_at=end_at)
+        branch = self._new(data, start_at, end_at, now)
 
         if (not branch.span) or (zero > branch.span):
             raise ValueError("%s spans nothing." % branch)
+        return branch
+
+    def _new(
+        self, data: dict[str, Any], start_at: datetime, end_at: datetime, now: datetime
+    ) -> Branch:
+        # Dates are validated once at the API boundary, which allows
+        # skipping __init__ unless the branch class customizes it.
+        if self.klass.__init__ is Branch.__init__:
+            return self.klass.create(
+                data=data, start_at=start_at, end_at=end_at, now=now
+            )
+        return self.klass(data=data, start_at=start_at, end_at=end_at)
 
-        for item in items:
-            assert item.start_at is not None
-            assert item.end_at is not None
+    def _apply(self, branches: list[Branch]) -> None:
+        # Given branches are sorted and do not overlap each other.
+        active, starts, order = self._active, self._starts, self._order
+        start_at = branches[0].start_at
+        end_at = cast(datetime, branches[-1].end_at)
+        max_end = self._max_end
 
-            latest_start = max(item.start_at, start_at)
-            earliest_end = min(item.end_at, end_at)
-            delta = earliest_end - latest_start
-            overlap = max(zero, delta)
-            is_extension = (not overlap) and (start_at == item.end_at)
+        # Only the active branches within [lo, hi) overlap new branches,
+        # the ones starting past the end of them extend the contract.
+        lo = bisect.bisect_right(starts, start_at) - 1
+        if cast(datetime, active[lo].end_at) <= start_at:
+            lo += 1
+        hi = bisect.bisect_left(starts, end_at, lo)
+        if self._probe is not None:
+            self._count(0, hi - lo)
 
-            if not (overlap or is_extension):
-                continue
+        # Overlapping branches are visited in the order they were added,
+        # which determines the order in which new branches are appended.
+        size = len(self.items)
+        bstarts = [branch.start_at for branch in branches]
+        pieces: dict[int, list[Branch]] = {}
 
-            ldelta = max(zero, start_at - item.start_at)
-            rdelta = max(zero, item.end_at - end_at)
-            dataref = None
+        # Branches added since changes were popped are stored as a whole,
+        # only the replacement of earlier ones is tracked.
+        mark, replaced = self._mark, self._replaced
+        for index in sorted(range(lo, hi), key=order.__getitem__):
+            pieces[index] = self._split(active[index], branches, bstarts)
+            if order[index] < mark:
+                replaced.add(order[index])
 
-            if ldelta and ldelta != item.span:
-                dataref = self._resolve_data_ref(item)
-                left = self.klass(
-                    start_at=item.start_at,
-                    end_at=item.start_at + ldelta,
-                    data=dataref,
-                )
-                self._shift(item, left)
+        timeline: list[Branch] = []
+        for index in range(lo, hi):
+            for piece in pieces[index]:
+                if not (timeline and timeline[-1] is piece):
+                    timeline.append(piece)
+
+        for branch in branches:
+            if branch.start_at >= max_end:
+                self._append(branch)
+                timeline.append(branch)
+
+        # The index of past versions, if any, is kept up to date.
+        history = self._history
+        if history is not None and not history.record(
+            branches[0].created_at, active[lo:hi], timeline
+        ):
+            self._history = None
 
-            self._shift(item, branch, replace=not is_extension)
+        for series in self._series.values():
+            series.splice(lo, hi, timeline, self.resolve)
 
-            if rdelta:
+        for watcher in self._watchers:
+            watcher(self, active[lo:hi], timeline)
+
+        positions = {b.uuid: size + n for n, b in enumerate(self.items[size:])}
+        active[lo:hi] = timeline
+        starts[lo:hi] = [b.start_at for b in timeline]
+        order[lo:hi] = [positions[b.uuid] for b in timeline]
+        self._arrays = None
+
+    def _split(
+        self, item: Branch, branches: list[Branch], starts: list[datetime]
+    ) -> list[Branch]:
+        # Replace the item with the branches overlapping it, the remaining
+        # gaps are covered by new branches referring to the item's data.
+        assert item.end_at is not None
+        cursor, dataref = item.start_at, None
+        # Pieces are created along with the given branches.
+        now = branches[0].created_at
+        pieces: list[Branch] = []
+        first = max(0, bisect.bisect_right(starts, item.start_at) - 1)
+
+        for branch in itertools.islice(branches, first, None):
+            assert branch.end_at is not None
+
+            if branch.start_at >= item.end_at:
+                break
+
+            if branch.end_at <= cursor:
+                continue
+
+            if branch.start_at > cursor:
                 if dataref is None:
                     dataref = self._resolve_data_ref(item)
 
-                right = self.klass(
-                    start_at=end_at,
-                    end_at=item.end_at,
-                    data=dataref,
-                )
-                self._shift(item, right)
-        return branch
+                left = self._new(dataref, cursor, branch.start_at, now)
+                self._shift(item, left)
+                pieces.append(left)
+                if self._probe is not None:
+                    self._count(1)
+
+            self._shift(item, branch)
+            pieces.append(branch)
+            cursor = branch.end_at
+
+        if cursor < item.end_at:
+            if dataref is None:
+                dataref = self._resolve_data_ref(item)
+
+            right = self._new(dataref, cursor, item.end_at, now)
+            self._shift(item, right)
+            pieces.append(right)
+            if self._probe is not None:
+                self._count(1)
+        return pieces
 
     def _shift(self, old: Branch, new: Branch, /, *, replace: bool = True) -> None:
         if not self.contains(new):
-            self.items.append(new)
+            self._append(new)
 
         if replace:
             old.replaced_by.append(new.uuid)
 
+    def _append(self, branch: Branch, /) -> None:
+        self.items.append(branch)
+        self._branches[branch.uuid] = branch
+
+    def _lookup(self, uid: str, /) -> Branch | None:
+        branch = self._branches.get(uid)
+        if branch is None and isinstance(self.items, BranchArray):
+            branch = self.items.find(uid)
+        return branch
+
+    def resolve(self, branch: Branch) -> dict[str, Any]:
+        # Returns the effective data of the branch. References are made to
+        # the branch that holds the data, whose data is cached per uuid.
+        if "_ref" not in branch.data:
+            return branch.data
+
+        ref = branch.data["_ref"]
+        if (data := self._resolved.get(ref)) is None:
+            if self._probe is not None:
+                self._count(2)
+            item = cast(Branch, self._lookup(ref))
+            data = self._resolved[ref] = self.resolve(item)
+        return data
+
     def _resolve_data_ref(self, item: Branch) -> dict[str, Any]:
         if "_ref" in item.data:
-            ref = item.data["_ref"]
-            branch = next(b for b in self.items if b.uuid == ref)
+            if self._probe is not None:
+                self._count(2)
+            branch = cast(Branch, self._lookup(item.data["_ref"]))
             return self._resolve_data_ref(branch)
         return {"_ref": item.uuid}
 
     def contains(self, branch: Branch) -> bool:
-        for item in self.items:
-            if item.uuid == branch.uuid:
-                return True
-        return False
+        return self._lookup(branch.uuid) is not None
+
+    def _reset_changes(self) -> None:
+        # Replaced branches are tracked by position, holding on to them
+        # would keep packing from freeing them.
+        self._mark: int = len(self.items)
+        self._replaced: set[int] = set()
+        self._compacted: bool = False
+
+    @property
+    def changed(self) -> bool:
+        # Whether branches were made or history compacted since changes
+        # were last popped.
+        return len(self.items) > self._mark or bool(self._replaced) or self._compacted
+
+    @property
+    def compacted(self) -> bool:
+        # Whether history was compacted since changes were last popped,
+        # positions of branches changed then, so the contract must be
+        # stored as a whole rather than by changes.
+        return self._compacted
+
+    def pop_changes(self) -> tuple[list[Branch], dict[int, Branch]]:
+        # Returns the branches added since the last call, along with the
+        # existing branches that got replaced meanwhile, by position.
+        added = self.items[self._mark :]
+        replaced = {index: self.items[index] for index in sorted(self._replaced)}
+        self._popped = (self._mark, self._replaced, self._compacted)
+        self._reset_changes()
+        return added, replaced
+
+    def restore_changes(self) -> None:
+        # Puts back the changes last popped, along with the ones made
+        # since, e.g. when storing them failed.
+        mark, replaced, compacted = self._popped
+        self._mark = min(self._mark, mark)
+        self._replaced |= replaced
+        self._compacted |= compacted
+
+    def apply_changes(
+        self, added: Iterable[Branch], replaced: dict[int, list[str]]
+    ) -> None:
+        # Counterpart of pop_changes, used to replay recorded changes.
+        # Branches that are already present are skipped.
+        with self._writing():
+            for branch in added:
+                if not self.contains(branch):
+                    self.items.append(branch)
+
+            for index, replaced_by in replaced.items():
+                self.items[index].replaced_by = replaced_by
+
+            self._reindex()
+            self._reset_changes()
+
+    def compact(self, *, before: datetime | None = None) -> int:
+        # Drops the branches replaced before the given date, all replaced
+        # branches by default. Branches holding data referred to by the
+        # ones kept are kept as well. Returns the number of branches
+        # dropped.
+        with self._writing():
+            items = list(self.items)
+            dropped = set()
+            for branch in items:
+                if not branch.replaced_by:
+                    continue
+
+                if before is not None:
+                    # Branches are replaced when their replacements are
+                    # created.
+                    replacement = self._lookup(branch.replaced_by[-1])
+                    if replacement is None or replacement.created_at >= before:
+                        continue
+                dropped.add(branch.uuid)
+
+            refs = [
+                b.data["_ref"]
+                for b in items
+                if b.uuid not in dropped and "_ref" in b.data
+            ]
+            while refs:
+                ref = refs.pop()
+                if ref in dropped:
+                    dropped.discard(ref)
+                    holder = cast(Branch, self._lookup(ref))
+                    if "_ref" in holder.data:
+                        refs.append(holder.data["_ref"])
+
+            if not dropped:
+                return 0
+
+            kept = [branch for branch in items if branch.uuid not in dropped]
+            if isinstance(self.items, BranchArray):
+                self.items = BranchArray(kept, klass=self.klass)
+                self.items.pack()
+            else:
+                self.items = kept
+
+            self._reindex()
+            self._reset_changes()
+            self._compacted = True
+        return len(dropped)
+
+    def intern(self, store: DataStore | None = None) -> DataStore:
+        # Makes branches carrying equal data share a single copy of it,
+        # along with the other contracts interned into the same store.
+        # Branches made from now on are interned too. Not kept on
+        # pickling, shared copies are though.
+        if store is None:
+            store = self.store or DataStore()
+
+        with self._writing():
+            self.store = store
+            if isinstance(self.items, BranchArray):
+                self.items.intern(store)
+            else:
+                for branch in self.items:
+                    if "_ref" not in branch.data:
+                        branch.data = store.intern(branch.data)
+            self._resolved = {}
+        return store
+
+    def pack(self) -> None:
+        # Move replaced branches into compact columns, they are looked up
+        # and materialized on demand from now on.
+        with self._writing():
+            if not isinstance(self.items, BranchArray):
+                self.items = BranchArray(self.items, klass=self.klass)
+            self.items.pack()
+            self._reindex()
 
     def explain(self) -> None:
         span = timedelta()
@@ -223,64 +996,181 @@ class Contract:
 
         print("span=%s,count=%s" % (span, len(self.items)))
 
-    def get_branch(self, *, at: datetime) -> Branch | None:
+    def history(self) -> History:
+        # Index of past versions of the timeline, built on first use after
+        # a write.
+        history = self._history
+        if history is None:
+            with self._lock or contextlib.nullcontext():
+                history = self._history = History(self)
+        return history
+
+    def as_of(self, known_at: datetime) -> Snapshot:
+        # The active timeline as it was at the given (system) time.
+        known_at, _ = validate_tz(known_at)
+        return self.history().as_of(known_at)
+
+    def get_branch(
+        self, *, at: datetime, known_at: datetime | None = None
+    ) -> Branch | None:
+        if self._observing():
+            return cast(
+                Branch | None,
+                self._observe("get_branch", self.get_branch, at=at, known_at=known_at),
+            )
+
         at, _ = validate_tz(at)
-        candidates = [
-            b
-            for b in self.items
-            if not b.replaced_by and b.start_at <= at < cast(datetime, b.end_at)
-        ]
+        if known_at is not None:
+            return self.as_of(known_at).get_branch(at=at)
 
-        if not candidates:
+        starts, active = self._view
+        index = bisect.bisect_right(starts, at) - 1
+
+        if index < 0:
             return None
 
-        (branch,) = candidates
-        return branch
+        if self._probe is not None:
+            self._count(0)
+        branch = active[index]
+        if at < cast(datetime, branch.end_at):
+            return branch
+        return None
 
-    @typing.no_type_check
-    def gantt(self) -> None:
-        import matplotlib.dates
-        import matplotlib.pyplot as plt
-        import pandas as pd
-
-        matplotlib.use("TkAgg")
-
-        df_list = [
-            {
-                "uuid": item.uuid[-8:],
-                "start_at": item.start_at,
-                "end_at": item.end_at,
-                "color": "#f53214" if bool(item.replaced_by) else "#05bbed",
-                "span": item.span,
-            }
-            for item in self.items
-        ]
-        df = pd.DataFrame.from_records(df_list)
-
-        fig, ax = plt.subplots(1, figsize=(16, 16), dpi=80)
-        ax.xaxis.set_minor_locator(matplotlib.dates.DayLocator(interval=1))
-        ax.xaxis.set_major_locator(matplotlib.dates.DayLocator(interval=30))
-        ax.xaxis.set_major_formatter(matplotlib.dates.DateFormatter("%Y-%m-%d"))
-        plt.xticks(rotation=90)
-        plt.hlines(
-            df.uuid,
-            df.start_at,
-            df.end_at,
-            colors=df.color,
-            linewidth=100,
-            label=df.color,
-        )
+    def aggregate(
+        self,
+        field: str,
+        *,
+        start_at: datetime,
+        end_at: datetime,
+        per: timedelta = timedelta(days=1),
+    ) -> Aggregate:
+        # Aggregates a numeric data field over the given window, the total
+        # being the sum of the field per unit of time, e.g. the number of
+        # eggs delivered given eggs_per_day. Branches without a number for
+        # the field don't count.
+        if self._observing():
+            return cast(
+                Aggregate,
+                self._observe(
+                    "aggregate",
+                    self.aggregate,
+                    field,
+                    start_at=start_at,
+                    end_at=end_at,
+                    per=per,
+                ),
+            )
+
+        start_at, end = validate_tz(start_at, end_at)
+        if cast(datetime, end) < start_at:
+            raise ValueError(
+                "Given window ends (%s) before it starts (%s)." % (end, start_at)
+            )
+        if per <= zero:
+            raise ValueError("Given unit of time (%s) is not positive." % per)
 
-        for item in df_list:
-            startx = matplotlib.dates.date2num(item["start_at"])
-            endx = matplotlib.dates.date2num(item["end_at"])
-            y = item["uuid"]
-            ax.annotate(
-                item["span"],
-                (endx, y),
-                xytext=(startx - 100, y),
-                arrowprops={"arrowstyle": "->"},
-                backgroundcolor="black",
-                color="white",
+        with self._lock or contextlib.nullcontext():
+            series = self._series.get(field)
+            if series is None:
+                series = Series(field, self._active, self.resolve)
+                self._series[field] = series
+            return series.query(
+                self._active, self._starts, start_at, cast(datetime, end), per
             )
+
+    def get_branches(self, *, at: Iterable[datetime], resolve: bool = False) -> Any:
+        # Returns the active branch (or its effective data if `resolve` is
+        # set) for each given point in time, None for points outside.
+        if self._observing():
+            return self._observe(
+                "get_branches", self.get_branches, at=at, resolve=resolve
+            )
+
+        if type(at).__module__ == "numpy":
+            return self._get_branches_array(at, resolve)
+
+        starts, active = self._view
+        found: list[Any] = []
+        naive = False
+
+        for point in at:
+            if not is_aware(point):
+                point, naive = point.replace(tzinfo=utc), True
+
+            index = bisect.bisect_right(starts, point) - 1
+            branch = active[index] if index >= 0 else None
+
+            if branch is None or point >= cast(datetime, branch.end_at):
+                found.append(None)
+            elif resolve:
+                found.append(self.resolve(branch))
+            else:
+                found.append(branch)
+
+        if naive:
+            warnings.warn(
+                "Received naive datetimes for at, assuming UTC.",
+                stacklevel=2,
+            )
+
+        if self._probe is not None:
+            self._count(0, len(found) - found.count(None))
+        return found
+
+    def _get_branches_array(self, at: Any, resolve: bool) -> list[Any]:
+        # NumPy datetimes carry no time zone, they are taken as UTC.
+        import numpy
+
+        # Arrays are cached along with the view they were built from.
+        _, active = view = self._view
+        if self._arrays is None or self._arrays[0] is not view:
+            count = len(active)
+            starts = numpy.fromiter(
+                (to_micros(b.start_at) for b in active), "int64", count
+            )
+            ends = numpy.fromiter(
+                (to_micros(cast(datetime, b.end_at)) for b in active),
+                "int64",
+                count,
+            )
+            branches = numpy.empty(count + 1, dtype=object)
+            branches[:count] = active
+            values = numpy.empty(count + 1, dtype=object)
+            values[:count] = [self.resolve(b) for b in active]
+            self._arrays = view, starts, ends, branches, values
+
+        _, starts, ends, branches, values = self._arrays
+        points = numpy.asarray(at, dtype="datetime64[us]").astype("int64")
+        index = numpy.searchsorted(starts, points, side="right") - 1
+        index[(index < 0) | (points >= ends[index])] = len(starts)
+        return list((values if resolve else branches)[index])
+
+    def gantt(
+        self,
+        fname: str | os.PathLike[str] | IO[bytes] | None = None,
+        *,
+        active_only: bool = False,
+        limit: int | None = None,
+        format: str | None = None,
+    ) -> None:
+        # Shows the chart, or writes it to the given file (e.g., PNG or
+        # SVG) without involving an interactive backend. Only active
+        # branches are drawn if `active_only` is set, history is sampled
+        # down to `limit` bars in total if given.
+        if fname is not None:
+            from pcontract.gantt import render
+
+            render(self, fname, active_only=active_only, limit=limit, format=format)
+            return
+
+        import matplotlib.pyplot as plt
+
+        from pcontract.gantt import figure
+
+        figure(
+            self,
+            active_only=active_only,
+            limit=limit,
+            fig=plt.figure(figsize=(16, 16), dpi=80),
+        )
         plt.show()
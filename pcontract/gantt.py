@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import os
+from typing import IO, Any
+
+import matplotlib.dates
+import numpy
+from matplotlib.axes import Axes
+from matplotlib.collections import PolyCollection
+from matplotlib.figure import Figure
+
+from pcontract.data import Branch, Contract
+
+ACTIVE = "#05bbed"
+REPLACED = "#f53214"
+
+# Rows are labelled by uuid up to this many branches.
+LABELS = 60
+
+
+def sample(positions: list[int], count: int) -> list[int]:
+    # Evenly spread picks, keeping the first and the last positions.
+    if count >= len(positions):
+        return positions
+    if count <= 1:
+        return positions[-count:] if count else []
+    step = (len(positions) - 1) / (count - 1)
+    return [positions[round(n * step)] for n in range(count)]
+
+
+def select(
+    contract: Contract, *, active_only: bool = False, limit: int | None = None
+) -> list[Branch]:
+    # Branches to draw, in the order they were added. Given a limit, the
+    # active branches are kept first and history is sampled to fill the
+    # rest. Packed branches are only materialized when picked.
+    active = sorted(contract._order)
+    replaced = [] if active_only else sorted(set(range(len(contract))) - set(active))
+
+    if limit is not None and len(active) + len(replaced) > limit:
+        if len(active) >= limit:
+            active, replaced = sample(active, limit), []
+        else:
+            replaced = sample(replaced, limit - len(active))
+
+    return [contract[index] for index in sorted(active + replaced)]
+
+
+def draw(ax: Axes, branches: list[Branch]) -> None:
+    # One bar per row, all of them in a single collection.
+    count = len(branches)
+    date2num = matplotlib.dates.date2num
+    starts = date2num([b.start_at for b in branches])  # type: ignore[no-untyped-call]
+    ends = date2num([b.end_at for b in branches])  # type: ignore[no-untyped-call]
+    rows = numpy.arange(count, dtype=float)
+
+    verts: Any = numpy.empty((count, 4, 2))
+    verts[:, 0, 0] = verts[:, 1, 0] = starts
+    verts[:, 2, 0] = verts[:, 3, 0] = ends
+    verts[:, 0, 1] = verts[:, 3, 1] = rows - 0.4
+    verts[:, 1, 1] = verts[:, 2, 1] = rows + 0.4
+
+    colors = [REPLACED if b.replaced_by else ACTIVE for b in branches]
+    # Edges keep bars shorter than a pixel visible.
+    ax.add_collection(
+        PolyCollection(verts, facecolors=colors, edgecolors=colors, linewidths=0.5)
+    )
+
+    if count:
+        ax.set_xlim(starts.min(), ends.max())
+    ax.set_ylim(count - 0.5, -0.5)
+    ax.xaxis_date()
+    formatter = matplotlib.dates.DateFormatter("%Y-%m-%d")  # type: ignore[no-untyped-call]
+    ax.xaxis.set_major_formatter(formatter)
+    ax.tick_params(axis="x", labelrotation=90)
+
+    if count <= LABELS:
+        ax.set_yticks(rows, [b.uuid[-8:] for b in branches])
+    else:
+        ax.set_yticks([])
+
+
+def figure(
+    contract: Contract,
+    *,
+    active_only: bool = False,
+    limit: int | None = None,
+    fig: Figure | None = None,
+) -> Figure:
+    # Draws the chart on a figure made without pyplot (so that no
+    # interactive backend is involved), or on the given one.
+    branches = select(contract, active_only=active_only, limit=limit)
+    if fig is None:
+        fig = Figure(figsize=(16, min(64, max(4, 1 + len(branches) * 0.25))), dpi=80)
+    draw(fig.add_subplot(), branches)
+    fig.tight_layout()
+    return fig
+
+
+def render(
+    contract: Contract,
+    fname: str | os.PathLike[str] | IO[bytes],
+    *,
+    active_only: bool = False,
+    limit: int | None = None,
+    format: str | None = None,
+) -> None:
+    # Writes the chart to a file, the format (e.g., png or svg) is taken
+    # from the file name unless given.
+    fig = figure(contract, active_only=active_only, limit=limit)
+    fig.savefig(fname, format=format)
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import bisect
+import random
+from datetime import datetime
+from operator import attrgetter
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, cast
+
+if TYPE_CHECKING:
+    from pcontract.data import Branch, Contract
+
+priorities = random.Random()
+
+
+class Node:
+    # Node of a treap keyed by start date. Nodes are never modified once
+    # built, versions of the timeline share the nodes they have in common.
+    __slots__ = ("branch", "priority", "left", "right", "size")
+
+    def __init__(
+        self,
+        branch: Branch,
+        priority: float,
+        left: Node | None = None,
+        right: Node | None = None,
+    ) -> None:
+        self.branch = branch
+        self.priority = priority
+        self.left = left
+        self.right = right
+        self.size: int = (
+            1
+            + (0 if left is None else left.size)
+            + (0 if right is None else right.size)
+        )
+
+
+def size(node: Node | None) -> int:
+    return 0 if node is None else node.size
+
+
+def split(
+    node: Node | None, key: datetime, *, after: bool = False
+) -> tuple[Node | None, Node | None]:
+    # Splits at the given start date, nodes starting at it go to the right
+    # unless `after` is set.
+    if node is None:
+        return None, None
+
+    start_at = node.branch.start_at
+    if start_at < key or (after and start_at == key):
+        left, right = split(node.right, key, after=after)
+        return Node(node.branch, node.priority, node.left, left), right
+
+    left, right = split(node.left, key, after=after)
+    return left, Node(node.branch, node.priority, right, node.right)
+
+
+def merge(left: Node | None, right: Node | None) -> Node | None:
+    # All nodes on the left start before the ones on the right.
+    if left is None:
+        return right
+
+    if right is None:
+        return left
+
+    if left.priority > right.priority:
+        return Node(left.branch, left.priority, left.left, merge(left.right, right))
+    return Node(right.branch, right.priority, merge(left, right.left), right.right)
+
+
+class Snapshot:
+    # Active timeline of a contract as it was known at a point in time.
+    __slots__ = ("contract", "known_at", "_root")
+
+    def __init__(
+        self, contract: Contract, known_at: datetime, root: Node | None
+    ) -> None:
+        self.contract = contract
+        self.known_at = known_at
+        self._root = root
+
+    def __repr__(self) -> str:
+        return "<%s known_at=%s %r>" % (
+            self.__class__.__name__,
+            self.known_at,
+            list(self),
+        )
+
+    def __len__(self) -> int:
+        return size(self._root)
+
+    def __iter__(self) -> Iterator[Branch]:
+        stack: list[Node] = []
+        node = self._root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.branch
+            node = node.right
+
+    def get_branch(self, *, at: datetime) -> Branch | None:
+        node, found = self._root, None
+        while node is not None:
+            if node.branch.start_at <= at:
+                found, node = node, node.right
+            else:
+                node = node.left
+
+        if found is not None and at < cast(datetime, found.branch.end_at):
+            return found.branch
+        return None
+
+    def get_branches(self, *, at: Iterable[datetime], resolve: bool = False) -> Any:
+        found = [self.get_branch(at=point) for point in at]
+        if resolve:
+            return [
+                self.contract.resolve(branch) if branch is not None else None
+                for branch in found
+            ]
+        return found
+
+
+class History:
+    # Versions of the active timeline, one per operation that changed it.
+    # A branch belongs to the timeline from its creation until its
+    # replacements were created, which is when it got replaced. Versions
+    # are built by path copying, each one costs a logarithmic number of
+    # nodes, and is located by a binary search over the dates of the
+    # operations.
+    __slots__ = ("contract", "_times", "_roots")
+
+    def __init__(self, contract: Contract) -> None:
+        self.contract = contract
+        self._times: list[datetime] = []
+        self._roots: list[Node | None] = []
+
+        branches = list(contract.items)
+        created = {branch.uuid: branch.created_at for branch in branches}
+        added: dict[datetime, list[Branch]] = {}
+        removed: dict[datetime, list[Branch]] = {}
+        for branch in branches:
+            if branch.replaced_by:
+                # Replacements dropped by compaction leave no trace.
+                replaced_at = min(
+                    (created[uid] for uid in branch.replaced_by if uid in created),
+                    default=branch.created_at,
+                )
+                if replaced_at <= branch.created_at:
+                    continue  # Replaced by the operation that created it.
+                removed.setdefault(replaced_at, []).append(branch)
+            added.setdefault(branch.created_at, []).append(branch)
+
+        for time in sorted(added.keys() | removed.keys()):
+            self.record(time, removed.get(time, []), added.get(time, []))
+
+    def record(
+        self, time: datetime, removed: list[Branch], added: list[Branch]
+    ) -> bool:
+        # Adds the version made by an operation at the given time, or
+        # amends the last one if made at the same time. Returns False if
+        # the operation predates the last version. Readers of a shared
+        # contract don't lock, so roots are added before their dates and
+        # amended in a single assignment, as_of always finds the root of a
+        # date.
+        if not (removed or added):
+            return True
+
+        root = self._roots[-1] if self._roots else None
+        amend = bool(self._times) and time <= self._times[-1]
+        if amend and time < self._times[-1]:
+            return False
+
+        # An operation changes a range of the timeline, which is cut out
+        # and rebuilt.
+        changed = removed + added
+        left, middle = split(root, min(b.start_at for b in changed))
+        middle, right = split(middle, max(b.start_at for b in changed), after=True)
+
+        gone = {branch.uuid for branch in removed}
+        kept = [b for b in Snapshot(self.contract, time, middle) if b.uuid not in gone]
+        middle = None
+        for branch in sorted(kept + added, key=attrgetter("start_at")):
+            middle = merge(middle, Node(branch, priorities.random()))
+
+        root = merge(merge(left, middle), right)
+        if amend:
+            self._roots[-1] = root
+        else:
+            self._roots.append(root)
+            self._times.append(time)
+        return True
+
+    def as_of(self, known_at: datetime) -> Snapshot:
+        index = bisect.bisect_right(self._times, known_at) - 1
+        return Snapshot(
+            self.contract, known_at, self._roots[index] if index >= 0 else None
+        )
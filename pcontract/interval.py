@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import random
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, cast
+
+if TYPE_CHECKING:
+    from pcontract.data import Branch, Contract
+
+priorities = random.Random()
+
+
+class Node:
+    # Node of a treap keyed by start date and uuid, holding the latest end
+    # date of its subtree to skip the ones ending before a point in time.
+    __slots__ = (
+        "contract",
+        "branch",
+        "value",
+        "start",
+        "end",
+        "high",
+        "priority",
+        "left",
+        "right",
+    )
+
+    def __init__(self, contract: Contract, branch: Branch, value: Any = None) -> None:
+        self.contract = contract
+        self.branch = branch
+        self.value = value
+        self.start = branch.start_at
+        self.end = self.high = cast(datetime, branch.end_at)
+        self.priority = priorities.random()
+        self.left: Node | None = None
+        self.right: Node | None = None
+
+
+def update(node: Node) -> Node:
+    high = node.end
+    if node.left is not None and node.left.high > high:
+        high = node.left.high
+    if node.right is not None and node.right.high > high:
+        high = node.right.high
+    node.high = high
+    return node
+
+
+def split(
+    node: Node | None, key: tuple[datetime, str]
+) -> tuple[Node | None, Node | None]:
+    # Nodes before the key go to the left, the others to the right.
+    if node is None:
+        return None, None
+
+    if (node.start, node.branch.uuid) < key:
+        node.right, right = split(node.right, key)
+        return update(node), right
+
+    left, node.left = split(node.left, key)
+    return left, update(node)
+
+
+def merge(left: Node | None, right: Node | None) -> Node | None:
+    # All nodes on the left come before the ones on the right.
+    if left is None:
+        return right
+
+    if right is None:
+        return left
+
+    if left.priority > right.priority:
+        left.right = merge(left.right, right)
+        return update(left)
+    right.left = merge(left, right.left)
+    return update(right)
+
+
+def insert(root: Node | None, new: Node) -> Node:
+    # Goes down to where the node belongs by priority, the latest end
+    # dates only grow on the way, then splits the subtree found there.
+    start, uid = key = (new.start, new.branch.uuid)
+    parent, node, left = None, root, False
+    while node is not None and node.priority > new.priority:
+        if new.end > node.high:
+            node.high = new.end
+        parent = node
+        left = start < node.start or (start == node.start and uid < node.branch.uuid)
+        node = node.left if left else node.right
+
+    new.left, new.right = split(node, key)
+    update(new)
+    if parent is None:
+        return new
+    if left:
+        parent.left = new
+    else:
+        parent.right = new
+    return cast(Node, root)
+
+
+def build(nodes: list[Node]) -> Node | None:
+    # Treap of nodes sorted by key, built in linear time: each node takes
+    # the nodes of lower priority before it as its left subtree.
+    stack: list[Node] = []
+    for node in nodes:
+        node.right = last = None
+        while stack and stack[-1].priority < node.priority:
+            last = stack.pop()
+        node.left = last
+        if stack:
+            stack[-1].right = node
+        stack.append(node)
+
+    def fix(node: Node | None) -> None:
+        if node is not None:
+            fix(node.left)
+            fix(node.right)
+            update(node)
+
+    root = stack[0] if stack else None
+    fix(root)
+    return root
+
+
+def delete(root: Node | None, key: tuple[datetime, str]) -> tuple[Node | None, bool]:
+    # Returns the tree without the node of the given key, and whether it
+    # was found. Latest end dates are brought up to date on the way back
+    # up, until one doesn't change.
+    start, uid = key
+    path: list[Node] = []
+    node = root
+    while node is not None:
+        if start == node.start:
+            if uid == node.branch.uuid:
+                break
+            left = uid < node.branch.uuid
+        else:
+            left = start < node.start
+        path.append(node)
+        node = node.left if left else node.right
+    else:
+        return root, False
+
+    replacement = merge(node.left, node.right)
+    if not path:
+        return replacement, True
+
+    if path[-1].left is node:
+        path[-1].left = replacement
+    else:
+        path[-1].right = replacement
+    for parent in reversed(path):
+        high = parent.high
+        if update(parent).high == high:
+            break
+    return root, True
+
+
+class IntervalTree:
+    # Branches of any number of contracts, looked up by the point in time
+    # they cover. Updates cost a logarithmic number of steps on average,
+    # and so does finding each branch covering a point.
+    __slots__ = ("_root", "_size")
+
+    def __init__(self) -> None:
+        self._root: Node | None = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[Node]:
+        stack: list[Node] = []
+        node = self._root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node
+            node = node.right
+
+    def add(self, contract: Contract, branch: Branch, value: Any = None) -> None:
+        self._root = insert(self._root, Node(contract, branch, value))
+        self._size += 1
+
+    def extend(self, entries: Iterable[tuple[Contract, Branch, Any]]) -> None:
+        # Adds many branches at once, rebuilding the tree if that's less
+        # work than inserting them.
+        nodes = [Node(*entry) for entry in entries]
+        size = self._size + len(nodes)
+        if len(nodes) < self._size:
+            for node in nodes:
+                self._root = insert(self._root, node)
+        else:
+            nodes.extend(self)
+            nodes.sort(key=lambda node: (node.start, node.branch.uuid))
+            self._root = build(nodes)
+        self._size = size
+
+    def remove(self, branch: Branch) -> None:
+        self._root, found = delete(self._root, (branch.start_at, branch.uuid))
+        self._size -= found
+
+    def stab(self, at: datetime) -> Iterator[Node]:
+        # Nodes covering the point in time. Subtrees ending at or before
+        # it, and the right of nodes starting after it, are skipped.
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None or node.high <= at:
+                continue
+
+            stack.append(node.left)
+            if node.start <= at:
+                if at < node.end:
+                    yield node
+                stack.append(node.right)
@@ -0,0 +1,346 @@
+import bisect
+import operator
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from numbers import Real
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Literal, TypeVar, cast
+
+from pcontract.backends.file import FileBackend
+from pcontract.data import Branch, Contract, validate_tz
+from pcontract.interval import IntervalTree, Node
+
+R = TypeVar("R")
+
+Method = Literal["json", "pickle", "journal", "binary"]
+
+OPERATORS: dict[str, Callable[[Any, Any], Any]] = {
+    "==": operator.eq,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+# A condition on a data key, e.g. (">", 12).
+Condition = tuple[str, Any]
+
+
+class EffectiveData:
+    # Effective data of a contract at each of the given points in time.
+    def __init__(self, at: Iterable[datetime]) -> None:
+        self.at = list(at)
+
+    def __call__(self, contract: Contract) -> list[dict[str, Any] | None]:
+        found: list[dict[str, Any] | None] = contract.get_branches(
+            at=self.at, resolve=True
+        )
+        return found
+
+
+def active_span(contract: Contract) -> timedelta:
+    # Time covered by the active branches, as in Contract.explain.
+    return sum(
+        (item.span for item in contract.items if not item.replaced_by), timedelta()
+    )
+
+
+def _evaluate(
+    filename: str | Path, method: Method, job: Callable[[Contract], R]
+) -> tuple[str, R]:
+    backend = FileBackend(filename, method)
+    backend.load()
+    contract = backend._contract
+    assert contract is not None
+    return contract.uuid, job(contract)
+
+
+def evaluate(
+    filenames: Iterable[str | Path],
+    job: Callable[[Contract], R],
+    *,
+    method: Method = "json",
+    processes: int | None = None,
+    chunksize: int = 16,
+) -> Iterator[tuple[str, R]]:
+    # Runs the job on each contract file in a pool of processes, yielding
+    # contract uuids along with results in the order of the files. Only
+    # paths are sent to the workers, which open the files themselves, so
+    # the job must be picklable (a module level function or an instance
+    # of a module level class).
+    filenames = list(filenames)
+    with ProcessPoolExecutor(processes) as executor:
+        yield from executor.map(
+            _evaluate,
+            filenames,
+            [method] * len(filenames),
+            [job] * len(filenames),
+            chunksize=chunksize,
+        )
+
+
+def total_span(
+    filenames: Iterable[str | Path],
+    *,
+    method: Method = "json",
+    processes: int | None = None,
+    chunksize: int = 16,
+) -> timedelta:
+    return sum(
+        (
+            span
+            for _, span in evaluate(
+                filenames,
+                active_span,
+                method=method,
+                processes=processes,
+                chunksize=chunksize,
+            )
+        ),
+        timedelta(),
+    )
+
+
+def matches(data: dict[str, Any], key: str, condition: Condition) -> bool:
+    # Data without the key, or with a value that can't be compared, don't
+    # match.
+    op, value = condition
+    if key not in data:
+        return False
+    try:
+        return bool(OPERATORS[op](data[key], value))
+    except TypeError:
+        return False
+
+
+class KeyIndex:
+    # Active branches by the value of a data key. Numbers and strings get
+    # a tree per distinct value, kept sorted to answer range conditions,
+    # other values share a tree and are compared one by one.
+    def __init__(self, key: str) -> None:
+        self.key = key
+        self.trees: dict[Any, IntervalTree] = {}
+        self.numbers: list[Any] = []
+        self.strings: list[str] = []
+        self.rest = IntervalTree()
+
+    def _sorted(self, value: Any) -> list[Any] | None:
+        # Values of the same kind, if the value has an order (NaN doesn't).
+        if isinstance(value, str):
+            return self.strings
+        if isinstance(value, (int, float, Real)) and value == value:
+            return self.numbers
+        return None
+
+    def add(self, contract: Contract, branch: Branch, data: dict[str, Any]) -> None:
+        if self.key not in data:
+            return
+
+        value = data[self.key]
+        values = self._sorted(value)
+        if values is None:
+            self.rest.add(contract, branch, value)
+            return
+
+        tree = self.trees.get(value)
+        if tree is None:
+            tree = self.trees[value] = IntervalTree()
+            bisect.insort(values, value)
+        tree.add(contract, branch)
+
+    def extend(
+        self, entries: Iterable[tuple[Contract, Branch, dict[str, Any]]]
+    ) -> None:
+        # Adds many branches at once, along with their data.
+        groups: dict[Any, list[tuple[Contract, Branch, Any]]] = {}
+        rest = []
+        for contract, branch, data in entries:
+            if self.key not in data:
+                continue
+
+            value = data[self.key]
+            if self._sorted(value) is None:
+                rest.append((contract, branch, value))
+            else:
+                groups.setdefault(value, []).append((contract, branch, None))
+
+        self.rest.extend(rest)
+        for value, group in groups.items():
+            tree = self.trees.get(value)
+            if tree is None:
+                tree = self.trees[value] = IntervalTree()
+                bisect.insort(cast(list[Any], self._sorted(value)), value)
+            tree.extend(group)
+
+    def remove(self, branch: Branch, data: dict[str, Any]) -> None:
+        if self.key not in data:
+            return
+
+        value = data[self.key]
+        values = self._sorted(value)
+        if values is None:
+            self.rest.remove(branch)
+            return
+
+        tree = self.trees[value]
+        tree.remove(branch)
+        if not tree:
+            del self.trees[value]
+            del values[bisect.bisect_left(values, value)]
+
+    def stab(self, at: datetime, condition: Condition) -> Iterator[Node]:
+        # Branches covering the point in time whose value matches.
+        op, value = condition
+        values = self._sorted(value)
+        if values is not None:
+            if op == "==":
+                tree = self.trees.get(value)
+                selected = [] if tree is None else [value]
+            else:
+                lo, hi = 0, len(values)
+                if op in (">", ">="):
+                    find = bisect.bisect_right if op == ">" else bisect.bisect_left
+                    lo = find(values, value)
+                else:
+                    find = bisect.bisect_left if op == "<" else bisect.bisect_right
+                    hi = find(values, value)
+                selected = values[lo:hi]
+
+            for selection in selected:
+                yield from self.trees[selection].stab(at)
+
+        compare = OPERATORS[op]
+        for node in self.rest.stab(at):
+            try:
+                if compare(node.value, value):
+                    yield node
+            except TypeError:
+                pass
+
+
+class Portfolio:
+    # Contracts held in memory with an index of the active branches of all
+    # of them, and optionally indexes on data keys, so that finding the
+    # contracts active at a point in time costs in proportion to the
+    # result rather than to the number of contracts. Indexes are kept up
+    # to date as branches are made on the contracts, payloads must not be
+    # modified in place. Contracts of a portfolio must not be written from
+    # several threads at once.
+    def __init__(
+        self, contracts: Iterable[Contract] = (), *, keys: Iterable[str] = ()
+    ) -> None:
+        self.contracts: dict[str, Contract] = {}
+        self._timeline = IntervalTree()
+        self._indexes: dict[str, KeyIndex] = {key: KeyIndex(key) for key in keys}
+        self.extend(contracts)
+
+    def __len__(self) -> int:
+        return len(self.contracts)
+
+    def __iter__(self) -> Iterator[Contract]:
+        return iter(self.contracts.values())
+
+    def __contains__(self, contract: Contract) -> bool:
+        return self.contracts.get(contract.uuid) is contract
+
+    def add(self, contract: Contract) -> None:
+        self.extend([contract])
+
+    def extend(self, contracts: Iterable[Contract]) -> None:
+        # Adds contracts, their branches are indexed all at once.
+        entries: list[tuple[Contract, Branch, Any]] = []
+        for contract in contracts:
+            if contract.uuid in self.contracts:
+                if contract in self:
+                    continue
+                raise ValueError(
+                    "Contract %s already in the portfolio." % contract.uuid
+                )
+
+            with contract._writing():
+                self.contracts[contract.uuid] = contract
+                contract.watch(self._update)
+                entries.extend((contract, branch, None) for branch in contract._active)
+
+        self._timeline.extend(entries)
+        if self._indexes:
+            resolved = [(c, b, c.resolve(b)) for c, b, _ in entries]
+            for index in self._indexes.values():
+                index.extend(resolved)
+
+    def remove(self, contract: Contract) -> None:
+        if contract not in self:
+            raise ValueError("Contract %s not in the portfolio." % contract.uuid)
+
+        with contract._writing():
+            contract.unwatch(self._update)
+            self._update(contract, contract._active, [])
+            del self.contracts[contract.uuid]
+
+    def index(self, key: str) -> None:
+        # Adds an index on a data key for the contracts already held.
+        if key in self._indexes:
+            return
+
+        self._indexes[key] = KeyIndex(key)
+        self._indexes[key].extend(
+            (contract, branch, contract.resolve(branch))
+            for contract in self
+            for branch in contract._active
+        )
+
+    def _update(
+        self, contract: Contract, removed: list[Branch], added: list[Branch]
+    ) -> None:
+        indexes = self._indexes.values()
+        for branch in removed:
+            self._timeline.remove(branch)
+            if indexes:
+                data = contract.resolve(branch)
+                for index in indexes:
+                    index.remove(branch, data)
+
+        for branch in added:
+            self._timeline.add(contract, branch)
+            if indexes:
+                data = contract.resolve(branch)
+                for index in indexes:
+                    index.add(contract, branch, data)
+
+    def find(
+        self,
+        *,
+        at: datetime,
+        where: dict[str, Condition] | None = None,
+        predicate: Callable[[dict[str, Any]], bool] | None = None,
+    ) -> list[tuple[Contract, Branch]]:
+        # Contracts active at the point in time, along with their branch
+        # covering it, whose data meets all the conditions, e.g. where=
+        # {"eggs_per_day": (">", 12)}, and the predicate. The first indexed
+        # key of the conditions narrows the search, others are checked on
+        # the way.
+        at, _ = validate_tz(at)
+        conditions = dict(where or {})
+        for op, _ in conditions.values():
+            if op not in OPERATORS:
+                raise ValueError("Unknown operator %s." % op)
+
+        key = next((key for key in conditions if key in self._indexes), None)
+        if key is None:
+            nodes = self._timeline.stab(at)
+        else:
+            nodes = self._indexes[key].stab(at, conditions.pop(key))
+
+        found = []
+        for node in nodes:
+            if conditions or predicate is not None:
+                data = node.contract.resolve(node.branch)
+                if not all(
+                    matches(data, name, condition)
+                    for name, condition in conditions.items()
+                ):
+                    continue
+                if predicate is not None and not predicate(data):
+                    continue
+            found.append((node.contract, node.branch))
+        return found
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import threading
+from typing import Callable, NamedTuple
+
+
+class Sample(NamedTuple):
+    # One operation on an instrumented contract: active branches visited,
+    # pieces created by splitting branches, and references followed to
+    # resolve data.
+    operation: str
+    seconds: float
+    scanned: int
+    splits: int
+    hops: int
+
+
+Probe = Callable[[Sample], None]
+
+
+class Observed(threading.local):
+    # Counters of the calls being observed in the current thread, by id of
+    # the contract, so that threads sharing a contract count apart.
+    def __init__(self) -> None:
+        self.counts: dict[int, list[int]] = {}
+
+
+observed = Observed()
+
+
+class Recorder:
+    # A probe keeping totals per operation, to be exported to metrics.
+    __slots__ = ("totals",)
+
+    def __init__(self) -> None:
+        self.totals: dict[str, dict[str, float]] = {}
+
+    def __call__(self, sample: Sample) -> None:
+        totals = self.totals.get(sample.operation)
+        if totals is None:
+            totals = self.totals[sample.operation] = dict.fromkeys(
+                ("count", "seconds", "max_seconds", "scanned", "splits", "hops"), 0
+            )
+
+        totals["count"] += 1
+        totals["seconds"] += sample.seconds
+        totals["max_seconds"] = max(totals["max_seconds"], sample.seconds)
+        totals["scanned"] += sample.scanned
+        totals["splits"] += sample.splits
+        totals["hops"] += sample.hops
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        # Totals along with the mean duration of each operation.
+        return {
+            operation: {**totals, "mean_seconds": totals["seconds"] / totals["count"]}
+            for operation, totals in self.totals.items()
+        }
+
+    def reset(self) -> None:
+        self.totals.clear()
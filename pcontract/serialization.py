@@ -1,11 +1,27 @@
 import datetime
-from json import JSONDecoder, JSONEncoder
-from typing import Any
+import json
+import re
+from json import JSONEncoder
+from typing import IO, Any, Iterable, Iterator, Literal
 
-from pcontract.data import Branch, Contract
+from pcontract.data import Branch, Contract, from_micros, to_micros
+from pcontract.store import digest
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore[assignment]
 
 BRANCH_TYPE = "pcontract.branch"
 CONTRACT_TYPE = "pcontract.contract"
+DATA_TYPE = "pcontract.data"
+
+Dates = Literal["iso", "int"]
+
+# Integers orjson may not read exactly, it reads the ones beyond 64 bits
+# as floats.
+long_number = re.compile(r"[0-9]{19}")
+long_number_bytes = re.compile(rb"[0-9]{19}")
 
 
 class Encoder(JSONEncoder):
@@ -36,39 +52,218 @@ class Encoder(JSONEncoder):
             "uuid": contract.uuid,
             "created_at": contract.created_at,
             "meta": contract.meta,
-            "items": contract.items,
+            "items": list(contract.items),
         }
 
 
+def to_date(value: str | int) -> datetime.datetime:
+    # Dates are either ISO 8601 strings or epoch microseconds.
+    if isinstance(value, int):
+        return from_micros(value)
+    return datetime.datetime.fromisoformat(value)
+
+
 def object_hook(obj: dict[Any, Any]) -> dict[Any, Any] | Branch | Contract:
     kind = obj.get("type")
-    isodate = datetime.datetime.fromisoformat
 
     if kind == BRANCH_TYPE:
-        branch = Branch(
-            data=obj["data"],
-            start_at=isodate(obj["start_at"]),
-            end_at=isodate(obj["end_at"]),
-        )
-        branch.created_at = isodate(obj["created_at"])
-        branch.uuid = obj["uuid"]
-        branch.replaced_by = obj["replaced_by"]
-        return branch
+        return branch_from_dict(obj)
 
     if kind == CONTRACT_TYPE:
         contract = Contract(items=obj["items"], meta=obj["meta"])
         contract.uuid = obj["uuid"]
-        contract.created_at = isodate(obj["created_at"])
+        contract.created_at = to_date(obj["created_at"])
         return contract
 
     return obj
 
 
-def to_json(contract: Contract) -> str:
-    encoder = Encoder()
-    return encoder.encode(contract)
+def branch_to_dict(branch: Branch, *, dates: Dates = "iso") -> dict[str, Any]:
+    encode = datetime.datetime.isoformat if dates == "iso" else to_micros
+    return {
+        "type": BRANCH_TYPE,
+        "uuid": branch.uuid,
+        "start_at": encode(branch.start_at),
+        "end_at": encode(branch.end_at),  # type: ignore[arg-type]
+        "created_at": encode(branch.created_at),
+        "replaced_by": branch.replaced_by,
+        "data": branch.data,
+    }
+
+
+def branch_from_dict(obj: dict[str, Any]) -> Branch:
+    return Branch.restore(
+        uuid=obj["uuid"],
+        data=obj["data"],
+        start_at=to_date(obj["start_at"]),
+        end_at=to_date(obj["end_at"]),
+        created_at=to_date(obj["created_at"]),
+        replaced_by=obj["replaced_by"],
+    )
+
+
+def to_dict(
+    contract: Contract, *, dates: Dates = "iso", dedupe: bool = False
+) -> dict[str, Any]:
+    # Same structure Encoder produces, built without going through
+    # JSONEncoder.default for each object. If deduplicating, each distinct
+    # payload is written once in a table of data by content hash, which
+    # branches refer to as {"_hash": key}.
+    encode = datetime.datetime.isoformat if dates == "iso" else to_micros
+    obj: dict[str, Any] = {
+        "type": CONTRACT_TYPE,
+        "uuid": contract.uuid,
+        "created_at": encode(contract.created_at),
+        "meta": contract.meta,
+        "items": [branch_to_dict(branch, dates=dates) for branch in contract.items],
+    }
+    if dedupe:
+        obj["data"] = refer(obj["items"])
+    return obj
+
+
+def refer(items: list[dict[str, Any]]) -> dict[str, dict[str, Any]]:
+    # Replaces the data of branches with references to the returned table.
+    # Interned payloads are hashed once.
+    table: dict[str, dict[str, Any]] = {}
+    keys: dict[int, str] = {}
+    for item in items:
+        data = item["data"]
+        if "_ref" in data:
+            continue
+
+        key = keys.get(id(data))
+        if key is None:
+            key = keys[id(data)] = digest(data)
+            table.setdefault(key, data)
+        item["data"] = {"_hash": key}
+    return table
+
+
+def from_dict(
+    obj: dict[str, Any], *, table: dict[str, dict[str, Any]] | None = None
+) -> Contract:
+    # Data referred to by hash is looked up in the table of the document,
+    # or the given one. Branches referring to the same data share it.
+    items = [branch_from_dict(item) for item in obj["items"]]
+    table = obj.get("data", table)
+    if table is not None:
+        for branch in items:
+            if "_hash" in branch.data:
+                try:
+                    branch.data = table[branch.data["_hash"]]
+                except KeyError:
+                    raise ValueError(
+                        "No data with hash %s." % branch.data["_hash"]
+                    ) from None
+
+    contract = Contract(items=items, meta=obj["meta"])
+    contract.uuid = obj["uuid"]
+    contract.created_at = to_date(obj["created_at"])
+    return contract
+
+
+def dumps(obj: dict[str, Any]) -> str:
+    # orjson is only used where it's lossless: it fails on integers beyond
+    # 64 bits and writes NaN and infinities as null, which the standard
+    # library writes as NaN and Infinity. Dates within data are encoded as
+    # by Encoder.
+    if orjson is not None:
+        try:
+            encoded = orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+        else:
+            if b"null" not in encoded:
+                return encoded.decode()
+    return json.dumps(obj, default=Encoder().default)
+
+
+def loads(s: str | bytes) -> Any:
+    # Counterpart of dumps, documents orjson rejects (NaN, Infinity) or
+    # may not read exactly are read by the standard library.
+    if orjson is not None:
+        search = (
+            long_number_bytes.search if isinstance(s, bytes) else long_number.search
+        )
+        if search(s) is None:  # type: ignore[arg-type]
+            try:
+                return orjson.loads(s)
+            except orjson.JSONDecodeError:
+                pass
+    return json.loads(s)
+
+
+def to_json(contract: Contract, *, dates: Dates = "iso", dedupe: bool = False) -> str:
+    return dumps(to_dict(contract, dates=dates, dedupe=dedupe))
+
+
+def revive(obj: Any) -> Any:
+    # Applies object_hook to an already decoded document, bottom up.
+    if isinstance(obj, list):
+        return [revive(value) for value in obj]
+
+    if isinstance(obj, dict):
+        if obj.get("type") == CONTRACT_TYPE:
+            return from_dict(obj)
+        return object_hook({key: revive(value) for key, value in obj.items()})
+    return obj
+
+
+def from_json(s: str | bytes) -> Any:
+    return revive(loads(s))
+
+
+def iter_records(
+    contracts: Iterable[Contract], *, dates: Dates = "iso", dedupe: bool = False
+) -> Iterator[dict[str, Any]]:
+    # If deduplicating, payloads are given once for all contracts, each in
+    # a record of its own before the first contract referring to it.
+    written: set[str] = set()
+    for contract in contracts:
+        obj = to_dict(contract, dates=dates, dedupe=dedupe)
+        for key, data in obj.pop("data", {}).items():
+            if key not in written:
+                written.add(key)
+                yield {"type": DATA_TYPE, "key": key, "data": data}
+        yield obj
+
+
+def iter_json(
+    contracts: Iterable[Contract], *, dates: Dates = "iso", dedupe: bool = False
+) -> Iterator[str]:
+    # One record per line, encoded only when the consumer asks for it.
+    for obj in iter_records(contracts, dates=dates, dedupe=dedupe):
+        yield dumps(obj) + "\n"
+
+
+def dump(
+    contracts: Iterable[Contract],
+    fp: IO[str],
+    *,
+    dates: Dates = "iso",
+    dedupe: bool = False,
+) -> int:
+    # Returns the number of contracts written.
+    count = 0
+    for obj in iter_records(contracts, dates=dates, dedupe=dedupe):
+        fp.write(dumps(obj) + "\n")
+        count += obj["type"] == CONTRACT_TYPE
+    return count
+
 
+def load(records: Iterable[str | bytes | dict[str, Any]]) -> Iterator[Contract]:
+    # Records are lines of a dump or of FileBackend JSON files, or decoded
+    # documents such as the ones returned by a MongoDB cursor. Data records
+    # of deduplicated dumps are kept for the contracts that follow.
+    table: dict[str, dict[str, Any]] = {}
+    for record in records:
+        if not isinstance(record, dict):
+            if not record.strip():
+                continue
+            record = loads(record)
 
-def from_json(s: str) -> Any:
-    decoder = JSONDecoder(object_hook=object_hook)
-    return decoder.decode(s)
+        if record.get("type") == DATA_TYPE:
+            table[record["key"]] = record["data"]
+        else:
+            yield from_dict(record, table=table)
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Iterator
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore[assignment]
+
+
+def default(o: Any) -> Any:
+    # Same as serialization.Encoder.default for what payloads may hold.
+    if isinstance(o, datetime):
+        return o.isoformat()
+
+
+def canonical(data: dict[str, Any]) -> bytes:
+    # Same bytes for equal payloads, whatever the order of their keys.
+    # orjson fails on integers beyond 64 bits and writes NaN and infinities
+    # as null, the standard library writes them as NaN and Infinity. Keys
+    # of mixed types can't be sorted, those payloads hash by key order.
+    if orjson is not None:
+        try:
+            encoded = orjson.dumps(
+                data, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+            )
+        except TypeError:
+            pass
+        else:
+            if b"null" not in encoded:
+                return encoded
+    try:
+        return json.dumps(
+            data, sort_keys=True, separators=(",", ":"), default=default
+        ).encode()
+    except TypeError:
+        return json.dumps(data, separators=(",", ":"), default=default).encode()
+
+
+def digest(data: dict[str, Any]) -> str:
+    # Content hash of a payload, shaped like the uuids of branches. Only
+    # meant to be compared within a process or a file, the bytes hashed
+    # depend on whether orjson is installed. Unequal payloads may share
+    # one, e.g. {1: 0} and {"1": 0}, or a date and its ISO string.
+    return hashlib.blake2b(canonical(data), digest_size=16).hexdigest()
+
+
+class DataStore:
+    # Branch payloads by content hash. Interned payloads are shared by all
+    # the branches (of any contract) that carry them, so they must not be
+    # modified in place.
+    __slots__ = ("_data",)
+
+    def __init__(self, data: dict[str, dict[str, Any]] | None = None) -> None:
+        self._data: dict[str, dict[str, Any]] = data or {}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._data
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._data)
+
+    def put(self, data: dict[str, Any]) -> str:
+        # Payloads sharing a hash with an unequal one get the next free key.
+        key = base = digest(data)
+        count = 0
+        while True:
+            stored = self._data.setdefault(key, data)
+            if stored is data or stored == data:
+                return key
+            count += 1
+            key = "%s-%d" % (base, count)
+
+    def get(self, key: str) -> dict[str, Any]:
+        try:
+            return self._data[key]
+        except KeyError:
+            raise ValueError("No data with hash %s." % key) from None
+
+    def intern(self, data: dict[str, Any]) -> dict[str, Any]:
+        # Returns the stored payload equal to the given one, or the given one
+        # if an unequal payload shares its hash.
+        stored = self._data.setdefault(digest(data), data)
+        return stored if stored is data or stored == data else data
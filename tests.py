@@ -1,7 +1,47 @@
+import asyncio
 import datetime
+import importlib.util
+import io
+import json
+import os
+import pickle
+import random
+import sys
+import tempfile
+import threading
 import unittest
+import uuid
+from unittest import mock
 
-from pcontract.data import Contract, utc
+from pcontract.data import Branch, BranchArray, Contract, new_uuid, utc
+from pcontract.history import History
+from pcontract.probe import Recorder
+from pcontract.backends.base import AsyncBackend
+from pcontract.backends.file import FileBackend, afile, file
+from pcontract.binary import MappedArray, MappedContract, from_bytes, mapped, to_bytes
+from pcontract import portfolio, serialization
+from pcontract.serialization import Encoder, dump, from_json, load, to_json
+
+
+class TaggedBranch(Branch):
+    # Extensions are defined at module level to be picklable.
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.tag = "x"
+
+
+class NotedBranch(Branch):
+    __slots__ = ("note",)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.note = "y"
+
+
+class TaggedContract(Contract):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.tag = "z"
 
 
 class TestContract(unittest.TestCase):
@@ -252,3 +292,1865 @@ class TestContract(unittest.TestCase):
             branch.span.total_seconds(),
             places=5,
         )
+
+    def test_get_branch(self):
+        contract = Contract.init(
+            start_at=self.start,
+            end_at=self.end,
+            data={"key": "world"},
+        )
+        contract.branch(
+            start_at=self.start + datetime.timedelta(days=5),
+            end_at=self.start + datetime.timedelta(days=45),
+            data={"key": "venus"},
+        )
+        _, left, main, right = contract
+
+        self.assertIsNone(
+            contract.get_branch(at=self.start - datetime.timedelta(seconds=1))
+        )
+        self.assertEqual(left, contract.get_branch(at=self.start))
+        self.assertEqual(
+            main,
+            contract.get_branch(at=self.start + datetime.timedelta(days=5)),
+        )
+        self.assertEqual(
+            right,
+            contract.get_branch(at=self.start + datetime.timedelta(days=45)),
+        )
+        self.assertIsNone(contract.get_branch(at=self.end))
+
+    def test_get_branch_matches_scan(self):
+        contract = Contract.init(
+            start_at=self.start,
+            end_at=self.end,
+            data={"key": 0},
+        )
+        for n, (start, end) in enumerate(
+            [(40, 90), (10, 50), (300, 365), (365, 400), (0, 20), (85, 310)], 1
+        ):
+            contract.branch(
+                start_at=self.start + datetime.timedelta(days=start),
+                end_at=self.start + datetime.timedelta(days=end),
+                data={"key": n},
+            )
+
+        for day in range(-1, 402):
+            at = self.start + datetime.timedelta(days=day, hours=12)
+            expected = [
+                b
+                for b in contract.items
+                if not b.replaced_by and b.start_at <= at < b.end_at
+            ]
+            self.assertEqual(expected or [None], [contract.get_branch(at=at)])
+
+    def timeline(self, contract):
+        def resolve(branch):
+            while "_ref" in branch.data:
+                (branch,) = [b for b in contract if b.uuid == branch.data["_ref"]]
+            return branch.data
+
+        return [
+            (b.start_at, b.end_at, resolve(b))
+            for b in sorted(contract, key=lambda b: b.start_at)
+            if not b.replaced_by
+        ]
+
+    def test_branch_many(self):
+        days = datetime.timedelta(days=1)
+        amendments = [
+            ({"key": "venus"}, self.start + 5 * days, self.start + 10 * days),
+            ({"key": "mars"}, self.start + 200 * days, self.start + 300 * days),
+            ({"key": "jupiter"}, self.start + 10 * days, self.start + 20 * days),
+            ({"key": "saturn"}, self.start + 300 * days, None),
+            ({"key": "pluto"}, self.end, self.end + 20 * days),
+        ]
+        one_by_one = Contract.init(
+            start_at=self.start, end_at=self.end, data={"key": "world"}
+        )
+        for data, start_at, end_at in amendments:
+            one_by_one.branch(data, start_at=start_at, end_at=end_at)
+
+        contract = Contract.init(
+            start_at=self.start, end_at=self.end, data={"key": "world"}
+        )
+        branches = contract.branch_many(amendments)
+
+        self.assertEqual(self.timeline(one_by_one), self.timeline(contract))
+        self.assertEqual(
+            [data for data, _, _ in amendments], [b.data for b in branches]
+        )
+        for branch in branches:
+            self.assertTrue(contract.contains(branch))
+
+        # The single sweep does not leave intermediate branches behind.
+        self.assertLess(len(contract), len(one_by_one))
+
+    def test_pop_changes(self):
+        days = datetime.timedelta(days=1)
+        contract = Contract.init(start_at=self.start, end_at=self.end, data={})
+        contract.branch({"key": 1}, start_at=self.start + 10 * days)
+        added, replaced = contract.pop_changes()
+        self.assertEqual(list(contract)[1:], added)
+        self.assertEqual({0: contract[0]}, replaced)
+
+        # Branches added since are sent as a whole, whether replaced or not.
+        contract.branch({"key": 2}, start_at=self.start + 5 * days)
+        contract.branch({"key": 3}, start_at=self.start + 2 * days)
+        contract.pack()
+        added, replaced = contract.pop_changes()
+        self.assertEqual(list(contract)[3:], added)
+        self.assertEqual([1, 2], list(replaced))
+        self.assertEqual([contract[1], contract[2]], list(replaced.values()))
+        self.assertTrue(all(branch.replaced_by for branch in replaced.values()))
+
+        contract.restore_changes()
+        contract.branch({"key": 4}, start_at=self.start + 1 * days)
+        added, replaced = contract.pop_changes()
+        self.assertEqual(list(contract)[3:], added)
+        self.assertEqual([1, 2], list(replaced))
+        self.assertEqual(([], {}), contract.pop_changes())
+
+    def test_branch_many_untouched(self):
+        days = datetime.timedelta(days=1)
+        base = Contract.init(start_at=self.start, end_at=self.end, data={"key": 0})
+        base.branch(
+            {"key": 1}, start_at=self.start + 100 * days, end_at=self.start + 120 * days
+        )
+        base.branch(
+            {"key": 2}, start_at=self.start + 150 * days, end_at=self.start + 160 * days
+        )
+        amendments = [
+            ({"key": 3}, self.start + 10 * days, self.start + 20 * days),
+            ({"key": 4}, self.start + 200 * days, self.start + 210 * days),
+        ]
+
+        one_by_one = pickle.loads(pickle.dumps(base))
+        for data, start_at, end_at in amendments:
+            one_by_one.branch(data, start_at=start_at, end_at=end_at)
+        contract = pickle.loads(pickle.dumps(base))
+        contract.branch_many(amendments)
+
+        # Branches no amendment overlaps are neither replaced nor copied.
+        self.assertEqual(len(one_by_one), len(contract))
+        self.assertEqual(
+            [(b.uuid, bool(b.replaced_by)) for b in one_by_one[: len(base)]],
+            [(b.uuid, bool(b.replaced_by)) for b in contract[: len(base)]],
+        )
+        for day in (15, 110, 155, 205):
+            self.assertEqual(
+                one_by_one.get_branch(at=self.start + day * days).data,
+                contract.get_branch(at=self.start + day * days).data,
+            )
+        for day in (110, 155):
+            self.assertEqual(
+                one_by_one.get_branch(at=self.start + day * days).uuid,
+                contract.get_branch(at=self.start + day * days).uuid,
+            )
+
+    def test_branch_many_overlapping(self):
+        days = datetime.timedelta(days=1)
+        amendments = [
+            ({"key": "venus"}, self.start + 5 * days, self.start + 50 * days),
+            ({"key": "mars"}, self.start + 20 * days, self.start + 30 * days),
+            ({"key": "jupiter"}, self.start + 25 * days, None),
+        ]
+        one_by_one = Contract.init(
+            start_at=self.start, end_at=self.end, data={"key": "world"}
+        )
+        for data, start_at, end_at in amendments:
+            one_by_one.branch(data, start_at=start_at, end_at=end_at)
+
+        contract = Contract.init(
+            start_at=self.start, end_at=self.end, data={"key": "world"}
+        )
+        contract.branch_many(amendments)
+        self.assertEqual(self.timeline(one_by_one), self.timeline(contract))
+
+    def test_branch_many_atomic(self):
+        days = datetime.timedelta(days=1)
+        contract = Contract.init(
+            start_at=self.start, end_at=self.end, data={"key": "world"}
+        )
+        amendments = [
+            ({"key": "venus"}, self.start + 5 * days, self.end + 10 * days),
+            ({"key": "mars"}, self.end + 5 * days, self.end + 20 * days),
+            ({"key": "pluto"}, self.end + 30 * days, None),
+        ]
+
+        with self.assertRaisesRegex(ValueError, r".out of the boundary"):
+            contract.branch_many(amendments)
+
+        with self.assertRaisesRegex(ValueError, r".spans nothing"):
+            contract.branch_many(
+                [
+                    ({"key": "venus"}, self.start + 5 * days, None),
+                    ({"key": "mars"}, self.start + 9 * days, self.start),
+                ]
+            )
+
+        (branch,) = contract
+        self.assertEqual([], branch.replaced_by)
+        self.assertEqual(branch, contract.get_branch(at=self.start + 6 * days))
+
+    def test_get_branches(self):
+        contract = Contract.init(
+            start_at=self.start,
+            end_at=self.end,
+            data={"key": "world"},
+        )
+        contract.branch(
+            start_at=self.start + datetime.timedelta(days=5),
+            end_at=self.start + datetime.timedelta(days=45),
+            data={"key": "venus"},
+        )
+        points = [
+            self.start - datetime.timedelta(days=1),
+            self.start + datetime.timedelta(days=50),
+            self.start,
+            self.start + datetime.timedelta(days=10),
+            self.end,
+        ]
+        self.assertEqual(
+            [contract.get_branch(at=at) for at in points],
+            contract.get_branches(at=points),
+        )
+        self.assertEqual(
+            [None, {"key": "world"}, {"key": "world"}, {"key": "venus"}, None],
+            contract.get_branches(at=points, resolve=True),
+        )
+
+        with self.assertWarnsRegex(UserWarning, r"naive datetimes"):
+            found = contract.get_branches(
+                at=[point.replace(tzinfo=None) for point in points]
+            )
+        self.assertEqual(contract.get_branches(at=points), found)
+
+    @unittest.skipUnless(importlib.util.find_spec("numpy"), "requires numpy")
+    def test_get_branches_numpy(self):
+        import numpy
+
+        contract = Contract.init(
+            start_at=self.start,
+            end_at=self.end,
+            data={"key": "world"},
+        )
+        contract.branch(
+            start_at=self.start + datetime.timedelta(days=5),
+            end_at=self.start + datetime.timedelta(days=45),
+            data={"key": "venus"},
+        )
+        points = [
+            self.start + datetime.timedelta(days=day, seconds=1)
+            for day in range(-2, 370, 3)
+        ]
+        array = numpy.array(
+            [point.replace(tzinfo=None) for point in points],
+            dtype="datetime64[us]",
+        )
+        self.assertEqual(
+            contract.get_branches(at=points), contract.get_branches(at=array)
+        )
+        self.assertEqual(
+            contract.get_branches(at=points, resolve=True),
+            contract.get_branches(at=array, resolve=True),
+        )
+
+    def test_pack(self):
+        contract = Contract.init(
+            start_at=self.start,
+            end_at=self.end,
+            data={"key": "world"},
+        )
+        contract.branch(
+            start_at=self.start + datetime.timedelta(days=5),
+            end_at=self.start + datetime.timedelta(days=45),
+            data={"key": "venus"},
+        )
+        branches = [
+            (b.uuid, b.start_at, b.end_at, b.replaced_by, b.data) for b in contract
+        ]
+        contract.pack()
+
+        self.assertIsInstance(contract.items, BranchArray)
+        self.assertEqual(
+            branches,
+            [(b.uuid, b.start_at, b.end_at, b.replaced_by, b.data) for b in contract],
+        )
+        self.assertEqual({0}, set(range(4)) - set(contract.items.live))
+        self.assertTrue(all(contract.contains(b) for b in contract))
+
+        # Packed branches are still referred to by new branches.
+        initial = contract[0]
+        contract.branch(
+            start_at=self.start + datetime.timedelta(days=100),
+            end_at=self.start + datetime.timedelta(days=200),
+            data={"key": "mars"},
+        )
+        left, main, right = contract[-3:]
+        self.assertEqual({"_ref": initial.uuid}, left.data)
+        self.assertEqual({"_ref": initial.uuid}, right.data)
+        self.assertEqual(
+            [{"key": "world"}],
+            contract.get_branches(
+                at=[self.start + datetime.timedelta(days=300)], resolve=True
+            ),
+        )
+        self.assertEqual(main, contract.get_branch(at=main.start_at))
+
+    def test_resolve(self):
+        contract = Contract.init(
+            start_at=self.start,
+            end_at=self.end,
+            data={"key": "world"},
+        )
+        contract.branch(
+            start_at=self.start + datetime.timedelta(days=30),
+            end_at=self.start + datetime.timedelta(days=60),
+            data={"key": "venus"},
+        )
+        contract.branch(
+            start_at=self.start + datetime.timedelta(days=35),
+            end_at=self.start + datetime.timedelta(days=40),
+            data={"key": "jupiter"},
+        )
+        m0, l1, m1, r1, l2, m2, r2 = contract
+
+        for branch, data in [
+            (m0, {"key": "world"}),
+            (l1, {"key": "world"}),
+            (m1, {"key": "venus"}),
+            (r1, {"key": "world"}),
+            (l2, {"key": "venus"}),
+            (m2, {"key": "jupiter"}),
+            (r2, {"key": "venus"}),
+        ]:
+            self.assertEqual(data, contract.resolve(branch))
+
+        # Data of packed branches is materialized once.
+        contract.pack()
+        resolved = contract.resolve(contract[1])
+        self.assertIs(resolved, contract.resolve(contract[3]))
+        self.assertIs(resolved, contract.resolve(contract[1]))
+
+    def test_branch_construction(self):
+        ids = [new_uuid() for _ in range(1000)]
+        self.assertEqual(1000, len(set(ids)))
+        for uid in ids[:300]:
+            self.assertEqual(uid, uuid.UUID(hex=uid, version=4).hex)
+
+        contract = Contract.init(start_at=self.start, end_at=self.end, data={"n": 0})
+        branch = contract.branch(
+            {"n": 1},
+            start_at=self.start + datetime.timedelta(days=10),
+            end_at=self.start + datetime.timedelta(days=20),
+        )
+        _, left, middle, right = contract
+        self.assertIs(branch, middle)
+        # Branches made by one operation share the clock reading.
+        self.assertEqual({branch.created_at}, {b.created_at for b in contract[1:]})
+        self.assertEqual({branch.created_at}, {b.updated_at for b in contract[1:]})
+
+        class Custom(Branch):
+            __slots__ = ("note",)
+
+            def __init__(self, **kwargs):
+                super().__init__(**kwargs)
+                self.note = "custom"
+
+        contract.klass = Custom
+        contract.branch(
+            {"n": 2},
+            start_at=self.start + datetime.timedelta(days=12),
+            end_at=self.start + datetime.timedelta(days=15),
+        )
+        self.assertEqual(["custom"] * 3, [b.note for b in contract[4:]])
+
+    def test_share(self):
+        contract = Contract.init(start_at=self.start, end_at=self.end, data={"n": 0})
+        self.assertIs(contract, contract.share())
+        points = [self.start + datetime.timedelta(hours=h) for h in range(0, 8760, 7)]
+        errors, done = [], threading.Event()
+
+        self.addCleanup(sys.setswitchinterval, sys.getswitchinterval())
+        sys.setswitchinterval(1e-6)
+
+        def read():
+            while not done.is_set():
+                found = contract.get_branches(at=points, resolve=False)
+                for point, branch in zip(points, found):
+                    if branch is None or not (branch.start_at <= point < branch.end_at):
+                        errors.append((point, branch))
+
+        def read_past():
+            # Past versions are looked up while being recorded.
+            while not done.is_set():
+                try:
+                    contract.get_branch(
+                        at=points[0], known_at=datetime.datetime.now(tz=utc)
+                    )
+                except Exception as error:
+                    errors.append(error)
+
+        def write(seed):
+            rnd = random.Random(seed)
+            for n in range(200):
+                start_at = self.start + datetime.timedelta(days=rnd.randint(0, 360))
+                contract.branch(
+                    {"n": n},
+                    start_at=start_at,
+                    end_at=start_at + datetime.timedelta(days=rnd.randint(1, 20)),
+                )
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        readers += [threading.Thread(target=read_past) for _ in range(2)]
+        writers = [threading.Thread(target=write, args=(n,)) for n in range(2)]
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        done.set()
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual([], errors)
+        self.assertEqual(401, len([b for b in contract if "n" in b.data]))
+        self.assertEqual(
+            contract.get_branches(at=points),
+            [contract.get_branch(at=point) for point in points],
+        )
+        self.assertIsNone(pickle.loads(pickle.dumps(contract))._lock)
+
+    def test_as_of(self):
+        rnd = random.Random(0)
+        contract = Contract.init(start_at=self.start, end_at=self.end, data={"n": 0})
+        contract[0].created_at = self.start
+        points = [self.start + datetime.timedelta(days=d) for d in range(-1, 500, 3)]
+        versions = [list(contract._active)]
+
+        for n in range(1, 60):
+            # Operations get distinct dates, an hour apart.
+            size = len(contract)
+            if n % 10 == 0:
+                contract.pack()
+            start_at = self.start + datetime.timedelta(days=rnd.randint(0, 360))
+            contract.branch(
+                {"n": n},
+                start_at=start_at,
+                end_at=start_at + datetime.timedelta(days=rnd.randint(1, 90)),
+            )
+            for branch in contract[size:]:
+                branch.created_at = self.start + datetime.timedelta(hours=n)
+            versions.append(list(contract._active))
+
+        for n, active in enumerate(versions):
+            for known_at in (
+                self.start + datetime.timedelta(hours=n),
+                self.start + datetime.timedelta(hours=n, minutes=59),
+            ):
+                snapshot = contract.as_of(known_at)
+                self.assertEqual(active, list(snapshot))
+                self.assertEqual(len(active), len(snapshot))
+                expected = [
+                    next((b for b in active if b.start_at <= p < b.end_at), None)
+                    for p in points
+                ]
+                self.assertEqual(expected, snapshot.get_branches(at=points))
+                self.assertEqual(
+                    [contract.resolve(b) if b else None for b in expected],
+                    snapshot.get_branches(at=points, resolve=True),
+                )
+                self.assertEqual(
+                    expected[40], contract.get_branch(at=points[40], known_at=known_at)
+                )
+
+        self.assertEqual([], list(contract.as_of(self.start - datetime.timedelta(1))))
+        self.assertEqual(
+            contract.get_branches(at=points),
+            contract.as_of(datetime.datetime.now(utc)).get_branches(at=points),
+        )
+
+        # Once built, the index is kept up to date by later operations.
+        history = contract.history()
+        contract.branch({"n": 60}, start_at=self.start + datetime.timedelta(days=7))
+        self.assertIs(history, contract.history())
+        known_at = contract[-1].created_at
+        self.assertEqual(contract._active, list(contract.as_of(known_at)))
+        self.assertEqual(
+            list(History(contract).as_of(known_at)), list(contract.as_of(known_at))
+        )
+
+    def test_aggregate(self):
+        contract = Contract.init(
+            start_at=datetime.datetime(2022, 12, 1, tzinfo=utc),
+            end_at=datetime.datetime(2023, 12, 1, tzinfo=utc),
+            data={"eggs_per_day": 10},
+        )
+        contract.branch(
+            start_at=datetime.datetime(2023, 4, 1, tzinfo=utc),
+            end_at=datetime.datetime(2023, 5, 1, tzinfo=utc),
+            data={"eggs_per_day": 20},
+        )
+        window = {
+            "start_at": datetime.datetime(2023, 3, 3, tzinfo=utc),
+            "end_at": datetime.datetime(2023, 7, 19, tzinfo=utc),
+        }
+        self.assertEqual(
+            (29 * 10 + 30 * 20 + 79 * 10, 10, 20),
+            contract.aggregate("eggs_per_day", **window)[:3],
+        )
+
+        # Cached sums are brought up to date after branching.
+        contract.branch(
+            start_at=datetime.datetime(2023, 5, 16, tzinfo=utc),
+            data={"eggs_per_day": 15},
+        )
+        contract.branch(
+            start_at=datetime.datetime(2023, 7, 1, tzinfo=utc),
+            end_at=datetime.datetime(2023, 7, 11, tzinfo=utc),
+            data={"note": "holidays"},
+        )
+        total = 29 * 10 + 30 * 20 + 15 * 10 + 46 * 15 + 8 * 15
+        result = contract.aggregate("eggs_per_day", **window)
+        self.assertEqual((total, 10, 20), result[:3])
+        self.assertEqual(datetime.timedelta(days=128), result.covered)
+        self.assertAlmostEqual(total / 128, result.average)
+
+        days = [
+            window["start_at"] + datetime.timedelta(days=n)
+            for n in range((window["end_at"] - window["start_at"]).days)
+        ]
+        self.assertEqual(
+            total,
+            sum(
+                data.get("eggs_per_day", 0)
+                for data in contract.get_branches(at=days, resolve=True)
+            ),
+        )
+        self.assertEqual(
+            total * 24,
+            contract.aggregate(
+                "eggs_per_day", per=datetime.timedelta(hours=1), **window
+            ).total,
+        )
+        self.assertEqual(
+            (0.0, None, None, None, datetime.timedelta()),
+            contract.aggregate(
+                "eggs_per_day",
+                start_at=datetime.datetime(2023, 7, 2, tzinfo=utc),
+                end_at=datetime.datetime(2023, 7, 3, tzinfo=utc),
+            ),
+        )
+        with self.assertRaisesRegex(ValueError, "before it starts"):
+            contract.aggregate(
+                "eggs_per_day",
+                start_at=window["end_at"],
+                end_at=window["start_at"],
+            )
+        with self.assertRaisesRegex(ValueError, "not positive"):
+            contract.aggregate("eggs_per_day", per=datetime.timedelta(), **window)
+        self.assertEqual(
+            (0.0, None, None, None, datetime.timedelta()),
+            contract.aggregate("note", **window),
+        )
+
+    def test_instrument(self):
+        samples = []
+        contract = Contract.init(start_at=self.start, end_at=self.end, data={"n": 0})
+        self.assertIs(contract, contract.instrument(samples.append))
+
+        contract.branch(
+            {"n": 1},
+            start_at=self.start + datetime.timedelta(days=10),
+            end_at=self.start + datetime.timedelta(days=20),
+        )
+        points = [self.start + datetime.timedelta(days=d) for d in (1, 2, 15, 400)]
+        contract.get_branches(at=points, resolve=True)
+        contract.get_branch(at=points[0])
+        self.assertEqual(
+            [
+                ("branch", 1, 2, 0),
+                ("get_branches", 3, 0, 1),
+                ("get_branch", 1, 0, 0),
+            ],
+            [(s.operation, s.scanned, s.splits, s.hops) for s in samples],
+        )
+        self.assertTrue(all(s.seconds > 0 for s in samples))
+
+        recorder = Recorder()
+        contract.instrument(recorder)
+        contract.branch_many(
+            [
+                ({"n": 2}, self.start + datetime.timedelta(days=15), None),
+                ({"n": 3}, self.start + datetime.timedelta(days=30), None),
+            ]
+        )
+        contract.aggregate("n", start_at=self.start, end_at=self.end)
+        stats = recorder.stats()
+        self.assertEqual({"branch_many", "aggregate"}, set(stats))
+        self.assertEqual(1, stats["branch_many"]["count"])
+        self.assertEqual(3, stats["branch_many"]["scanned"])
+        self.assertEqual(2, stats["branch_many"]["splits"])
+
+        contract.instrument(None)
+        contract.get_branch(at=points[0])
+        self.assertEqual(1, recorder.stats()["aggregate"]["count"])
+        self.assertEqual(3, len(samples))
+
+        # Threads sharing the contract count their own calls.
+        samples.clear()
+        contract.share().instrument(samples.append)
+        barrier, resolve = threading.Barrier(2), Contract.resolve
+
+        def resolving(self, branch):
+            barrier.wait(5)
+            return resolve(self, branch)
+
+        with mock.patch.object(Contract, "resolve", resolving):
+            threads = [
+                threading.Thread(
+                    target=contract.get_branches,
+                    kwargs={"at": points[:1], "resolve": True},
+                )
+                for _ in range(2)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(
+            [("get_branches", 1)] * 2, [(s.operation, s.scanned) for s in samples]
+        )
+
+    def test_compact(self):
+        contract = Contract.init(
+            start_at=self.start, end_at=self.end, data={"key": "world"}
+        )
+        contract.branch(
+            start_at=self.start + datetime.timedelta(days=30),
+            end_at=self.start + datetime.timedelta(days=60),
+            data={"key": "venus"},
+        )
+        later = datetime.datetime.now(utc)
+        contract.branch(
+            start_at=self.start + datetime.timedelta(days=30),
+            end_at=self.start + datetime.timedelta(days=60),
+            data={"key": "jupiter"},
+        )
+        m0, l1, m1, r1, m2 = contract
+        points = [self.start + datetime.timedelta(days=d) for d in range(-1, 370, 2)]
+        expected = contract.get_branches(at=points, resolve=True)
+        contract.pop_changes()
+
+        # m1 was replaced after the given date, m0 is referred to.
+        self.assertEqual(0, contract.compact(before=later))
+        self.assertFalse(contract.compacted)
+        self.assertEqual(1, contract.compact())
+        self.assertTrue(contract.compacted)
+        self.assertEqual([m0, l1, r1, m2], list(contract))
+        self.assertEqual(expected, contract.get_branches(at=points, resolve=True))
+
+        # Once the references are gone, so is m0.
+        contract.branch(start_at=self.start, data={"key": "mars"})
+        self.assertEqual(4, contract.compact())
+        self.assertEqual([{"key": "mars"}], [b.data for b in contract])
+        contract.pop_changes()
+        self.assertFalse(contract.compacted)
+
+        contract.branch(
+            start_at=self.start + datetime.timedelta(days=45),
+            end_at=self.start + datetime.timedelta(days=50),
+            data={"key": "saturn"},
+        )
+        contract.pack()
+        contract.branch(
+            start_at=self.start + datetime.timedelta(days=45),
+            end_at=self.start + datetime.timedelta(days=50),
+            data={"key": "pluto"},
+        )
+        expected = contract.get_branches(at=points, resolve=True)
+        self.assertEqual(1, contract.compact())
+        self.assertIsInstance(contract.items, BranchArray)
+        self.assertEqual(4, len(contract))
+        self.assertEqual(expected, contract.get_branches(at=points, resolve=True))
+
+    def test_intern(self):
+        contracts = []
+        for days in (0, 10):
+            contract = Contract.init(
+                start_at=self.start, end_at=self.end, data={"a": 1, "b": [2]}
+            )
+            contract.branch(
+                start_at=self.start + datetime.timedelta(days=days + 5),
+                end_at=self.start + datetime.timedelta(days=days + 20),
+                data={"b": [2], "a": 1},
+            )
+            contracts.append(contract)
+        contracts[1].pack()
+
+        store = contracts[0].intern()
+        self.assertIs(store, contracts[1].intern(store))
+        self.assertEqual(1, len(store))
+        payloads = [contract.resolve(b) for contract in contracts for b in contract]
+        self.assertEqual(8, len(payloads))
+        self.assertTrue(all(data is payloads[0] for data in payloads))
+
+        # Branches made from now on share the stored copies too.
+        at = self.start + datetime.timedelta(days=100)
+        branch = contracts[1].branch(start_at=at, data={"a": 1, "b": [2]})
+        self.assertIs(payloads[0], branch.data)
+        contracts[0].branch_many([({"a": 2}, at, None)])
+        self.assertEqual(2, len(store))
+        self.assertIs(
+            store.get(next(iter(reversed(list(store))))),
+            contracts[0].get_branch(at=at).data,
+        )
+        self.assertNotIn("missing", store)
+        with self.assertRaisesRegex(ValueError, r"No data with hash missing"):
+            store.get("missing")
+
+        # The store is left out when pickling.
+        self.assertIsNone(pickle.loads(pickle.dumps(contracts[0])).store)
+
+        # Branches keep their payload, even if an unequal one hashes the same.
+        for data, other in (
+            ({"rate": float("nan")}, {"rate": None}),
+            ({1: "a"}, {"1": "a"}),
+        ):
+            self.assertIs(other, store.intern(other))
+            branch = contracts[0].branch(start_at=at, data=data)
+            self.assertIs(data, branch.data)
+            self.assertNotEqual(store.put(data), store.put(other))
+            self.assertIs(data, store.get(store.put(data)))
+
+        # So do payloads written once for all the branches holding them.
+        contract = Contract.init(
+            start_at=self.start, end_at=self.end, data={"rate": None}
+        )
+        contract.branch(start_at=at, data={"rate": float("nan")})
+        self.assertEqual(
+            [repr(branch.data) for branch in contract],
+            [repr(branch.data) for branch in from_json(to_json(contract, dedupe=True))],
+        )
+
+    def test_portfolio_find(self):
+        rnd = random.Random(0)
+        values = [1, 5, 12, 12.5, 20, "low", "high", None, [1, 2]]
+        contracts = [
+            Contract.init(start_at=self.start, end_at=self.end, data={"n": 0})
+            for _ in range(8)
+        ]
+        index = portfolio.Portfolio(contracts[:2], keys=["n"])
+        index.extend(contracts[2:6])
+        index.add(contracts[6])
+        index.add(contracts[6])
+
+        def amend(count):
+            for _ in range(count):
+                contract = rnd.choice(contracts)
+                start_at = self.start + datetime.timedelta(days=rnd.randint(0, 365))
+                contract.branch(
+                    {"n": rnd.choice(values)} if rnd.random() < 0.9 else {},
+                    start_at=start_at,
+                    end_at=start_at + datetime.timedelta(days=rnd.randint(1, 60)),
+                )
+
+        def check(where, predicate=None):
+            for day in range(-10, 470, 9):
+                at = self.start + datetime.timedelta(days=day)
+                expected = set()
+                for contract in index:
+                    branch = contract.get_branch(at=at)
+                    if branch is None:
+                        continue
+                    data = contract.resolve(branch)
+                    if all(
+                        portfolio.matches(data, key, condition)
+                        for key, condition in where.items()
+                    ) and (predicate is None or predicate(data)):
+                        expected.add((contract.uuid, branch.uuid))
+                found = index.find(at=at, where=where, predicate=predicate)
+                self.assertEqual(len(expected), len(found))
+                self.assertEqual(expected, {(c.uuid, b.uuid) for c, b in found})
+
+        conditions = [
+            {},
+            {"n": ("==", 12)},
+            {"n": (">", 12)},
+            {"n": ("<=", 12)},
+            {"n": (">=", "low")},
+            {"n": ("==", None)},
+            {"n": ("==", [1, 2])},
+            {"m": ("==", 1)},
+        ]
+        amend(60)
+        for where in conditions:
+            check(where)
+
+        # Indexes follow the contracts as they change.
+        amend(60)
+        index.index("m")
+        contracts[1].branch({"n": 7, "m": 1}, start_at=self.start)
+        check({"n": (">", 5), "m": ("==", 1)})
+        check({"m": ("==", 1)}, predicate=lambda data: data["n"] == 7)
+        for where in conditions:
+            check(where)
+
+        index.remove(contracts[0])
+        self.assertNotIn(contracts[0], index)
+        self.assertEqual(6, len(index))
+        contracts[0].branch({"n": 12}, start_at=self.start)
+        amend(30)
+        for where in conditions:
+            check(where)
+
+        at = self.start + datetime.timedelta(days=1)
+        self.assertEqual(
+            [(contracts[1], contracts[1].get_branch(at=at))],
+            index.find(at=at, where={"n": ("==", 7)}),
+        )
+        with self.assertWarns(UserWarning):
+            self.assertEqual(index.find(at=at), index.find(at=at.replace(tzinfo=None)))
+        with self.assertRaisesRegex(ValueError, r"Unknown operator !="):
+            index.find(at=at, where={"n": ("!=", 7)})
+        with self.assertRaisesRegex(ValueError, r"not in the portfolio"):
+            index.remove(contracts[7])
+        other = Contract.init(start_at=self.start, end_at=self.end, data={})
+        other.uuid = contracts[1].uuid
+        with self.assertRaisesRegex(ValueError, r"already in the portfolio"):
+            index.add(other)
+
+
+class TestSerialization(unittest.TestCase):
+    def setUp(self) -> None:
+        self.start = datetime.datetime(2022, 10, 10, tzinfo=utc)
+        self.end = self.start + datetime.timedelta(days=365)
+        self.contract = Contract.init(
+            start_at=self.start,
+            end_at=self.end,
+            data={"key": "world"},
+        )
+        self.contract.branch(
+            start_at=self.start + datetime.timedelta(days=5),
+            end_at=self.start + datetime.timedelta(days=45),
+            data={"key": "venus"},
+        )
+
+    def assertSameContract(self, expected, actual):
+        self.assertEqual(expected.uuid, actual.uuid)
+        self.assertEqual(
+            [(b.uuid, b.replaced_by, b.data) for b in expected],
+            [(b.uuid, b.replaced_by, b.data) for b in actual],
+        )
+        for branch in expected:
+            self.assertTrue(actual.contains(branch))
+
+        at = self.start + datetime.timedelta(days=50)
+        self.assertEqual(expected.get_branch(at=at), actual.get_branch(at=at))
+
+        # Indexes must keep working after the round trip.
+        branch = actual.branch(
+            start_at=self.start + datetime.timedelta(days=40),
+            end_at=self.start + datetime.timedelta(days=60),
+            data={"key": "mars"},
+        )
+        left, _, right = actual[-3:]
+        self.assertEqual(branch, actual.get_branch(at=at))
+        self.assertEqual({"_ref": actual[2].uuid}, left.data)
+        self.assertEqual({"_ref": actual[0].uuid}, right.data)
+
+    def test_json_roundtrip(self):
+        self.assertSameContract(self.contract, from_json(to_json(self.contract)))
+
+    def test_pickle_roundtrip(self):
+        contract = pickle.loads(pickle.dumps(self.contract))
+        self.assertSameContract(self.contract, contract)
+
+    def test_pickle_subclasses(self):
+        contract = TaggedContract(
+            items=[
+                TaggedBranch(start_at=self.start, end_at=self.end),
+                NotedBranch(start_at=self.start, end_at=self.end),
+            ]
+        )
+        copy = pickle.loads(pickle.dumps(contract))
+        self.assertEqual("z", copy.tag)
+        self.assertEqual(("x", "y"), (copy[0].tag, copy[1].note))
+        self.assertIsInstance(copy[1], NotedBranch)
+
+    def test_packed_roundtrip(self):
+        self.contract.pack()
+        self.assertSameContract(self.contract, from_json(to_json(self.contract)))
+        self.assertSameContract(
+            self.contract, pickle.loads(pickle.dumps(self.contract))
+        )
+
+    def test_binary_roundtrip(self):
+        self.assertSameContract(self.contract, from_bytes(to_bytes(self.contract)))
+
+        # Only active branches are decoded on loading.
+        contract = from_bytes(to_bytes(self.contract))
+        self.assertIsInstance(contract.items, MappedArray)
+        self.assertEqual(sorted(contract._order), sorted(contract.items.live))
+        self.assertSameContract(self.contract, contract)
+        contract.pack()
+        for branch in contract:
+            self.assertTrue(contract.contains(branch))
+            self.assertEqual(branch, contract._lookup(branch.uuid))
+        copy = pickle.loads(pickle.dumps(contract))
+        self.assertEqual(list(contract), list(copy))
+        self.assertEqual(
+            [contract.resolve(b) for b in contract], [copy.resolve(b) for b in copy]
+        )
+
+    def test_mapped_contract(self):
+        self.contract.branch(
+            start_at=self.start + datetime.timedelta(days=40),
+            end_at=self.start + datetime.timedelta(days=60),
+            data={"key": "mars"},
+        )
+        view = MappedContract(to_bytes(self.contract))
+        self.assertEqual(self.contract.uuid, view.uuid)
+        self.assertEqual(len(self.contract), len(view))
+
+        for day in range(-1, 367, 7):
+            at = self.start + datetime.timedelta(days=day)
+            branch = self.contract.get_branch(at=at)
+            found = view.get_branch(at=at)
+            self.assertEqual(branch, found)
+
+            if branch is not None:
+                self.assertEqual(self.contract.resolve(branch), view.resolve(found))
+
+        for branch in self.contract:
+            self.assertEqual(branch.replaced_by, view.find(branch.uuid).replaced_by)
+        self.assertIsNone(view.find(self.contract.uuid))
+
+        with self.assertRaisesRegex(ValueError, r"not a contract file"):
+            MappedContract(to_json(self.contract).encode())
+
+    def test_json_schema(self):
+        self.assertEqual(
+            json.loads(Encoder().encode(self.contract)),
+            json.loads(to_json(self.contract)),
+        )
+
+        document = json.loads(to_json(self.contract, dates="int"))
+        self.assertEqual(
+            [int(branch.start_at.timestamp() * 10**6) for branch in self.contract],
+            [item["start_at"] for item in document["items"]],
+        )
+        self.assertSameContract(
+            self.contract, from_json(to_json(self.contract, dates="int"))
+        )
+        self.assertSameContract(
+            self.contract, from_json(Encoder().encode(self.contract))
+        )
+
+    def test_json_without_orjson(self):
+        if serialization.orjson is not None:
+            self.addCleanup(setattr, serialization, "orjson", serialization.orjson)
+            serialization.orjson = None
+
+        self.assertEqual(Encoder().encode(self.contract), to_json(self.contract))
+        self.assertSameContract(self.contract, from_json(to_json(self.contract)))
+
+        # Dates within data are encoded as by Encoder, whichever the path.
+        self.contract.branch(
+            {"signed_at": self.start},
+            start_at=self.start + datetime.timedelta(days=100),
+        )
+        self.assertEqual(Encoder().encode(self.contract), to_json(self.contract))
+        self.assertEqual(
+            [b.data for b in from_json(Encoder().encode(self.contract))],
+            [b.data for b in from_json(to_json(self.contract, dedupe=True))],
+        )
+        with mock.patch("pcontract.store.orjson", None):
+            self.assertEqual(3, len(self.contract.intern()))
+        self.assertEqual(
+            {"signed_at": self.start.isoformat()},
+            from_bytes(to_bytes(self.contract))[-1].data,
+        )
+
+    def test_json_lossless(self):
+        # Payloads orjson can't write or read exactly round-trip, and so do
+        # files the standard library wrote.
+        payloads = [
+            {"x": float("nan")},
+            {"x": float("inf"), "y": None},
+            {"x": 2**70},
+            {"x": -(2**63) - 1},
+        ]
+        for days, data in enumerate(payloads, 100):
+            self.contract.branch(
+                data, start_at=self.start + datetime.timedelta(days=days)
+            )
+        expected = [repr(branch.data) for branch in self.contract]
+        for encoded in (
+            to_json(self.contract),
+            Encoder().encode(self.contract),
+            Encoder().encode(self.contract).encode(),
+        ):
+            self.assertEqual(
+                expected, [repr(branch.data) for branch in from_json(encoded)]
+            )
+
+        buffer = io.StringIO()
+        dump([self.contract], buffer, dedupe=True)
+        (loaded,) = load(buffer.getvalue().splitlines())
+        self.assertEqual(expected, [repr(branch.data) for branch in loaded])
+
+    def test_stream(self):
+        contracts = [self.contract, from_json(to_json(self.contract))]
+        contracts[1].uuid = "other"
+
+        buffer = io.StringIO()
+        self.assertEqual(2, dump(iter(contracts), buffer))
+        self.assertEqual(2, buffer.getvalue().count("\n"))
+
+        buffer.seek(0)
+        stream = load(buffer)
+        self.assertSameContract(self.contract, next(stream))
+        self.assertEqual("other", next(stream).uuid)
+        self.assertEqual([], list(stream))
+
+        # Decoded documents, as stored by MongoBackend.
+        documents = [json.loads(to_json(contract)) for contract in contracts]
+        documents[0]["_id"] = 1
+        self.assertEqual(
+            [self.contract.uuid, "other"],
+            [contract.uuid for contract in load(documents)],
+        )
+
+    def test_dedupe(self):
+        contract = from_json(to_json(self.contract, dedupe=True))
+        self.assertSameContract(self.contract, contract)
+
+        self.contract.branch(
+            start_at=self.start + datetime.timedelta(days=50),
+            end_at=self.start + datetime.timedelta(days=60),
+            data={"key": "venus"},
+        )
+        document = json.loads(to_json(self.contract, dedupe=True))
+        self.assertEqual(2, len(document["data"]))
+        hashes = [item["data"].get("_hash") for item in document["items"]]
+        self.assertEqual(2, hashes.count(hashes[2]))
+        self.assertEqual(
+            [b.data.get("_ref") for b in self.contract],
+            [item["data"].get("_ref") for item in document["items"]],
+        )
+
+        contract = from_json(to_json(self.contract, dedupe=True))
+        first, second = (b.data for b in contract if b.data.get("key") == "venus")
+        self.assertIs(first, second)
+
+        # Payloads are written once for the whole stream.
+        other = from_json(to_json(self.contract))
+        other.uuid = "other"
+        buffer = io.StringIO()
+        self.assertEqual(2, dump([self.contract, other], buffer, dedupe=True))
+        records = [json.loads(line) for line in buffer.getvalue().splitlines()]
+        self.assertEqual(
+            [serialization.DATA_TYPE] * 2 + [serialization.CONTRACT_TYPE] * 2,
+            [record["type"] for record in records],
+        )
+
+        buffer.seek(0)
+        first, second = load(buffer)
+        self.assertEqual("other", second.uuid)
+        self.assertIs(first[2].data, second[2].data)
+        self.assertEqual([b.data for b in self.contract], [b.data for b in first])
+
+        del records[1]
+        with self.assertRaisesRegex(ValueError, r"No data with hash"):
+            list(load(records))
+
+
+class TestFileBackend(unittest.TestCase):
+    def setUp(self) -> None:
+        self.start = datetime.datetime(2022, 10, 10, tzinfo=utc)
+        self.end = self.start + datetime.timedelta(days=365)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(directory.name)
+
+    def state(self, contract):
+        return [(b.uuid, b.start_at, b.end_at, b.replaced_by, b.data) for b in contract]
+
+    def amend(self, backend, days):
+        backend.branch(
+            start_at=self.start + datetime.timedelta(days=days),
+            end_at=self.start + datetime.timedelta(days=days + 10),
+            data={"key": days},
+        )
+
+    def test_file_journal_lossless(self):
+        with file(method="journal") as backend:
+            backend.init(start_at=self.start, end_at=self.end, data={"key": 0})
+            filename = backend._contract.uuid
+        with file(filename, method="journal") as backend:
+            backend.branch({"x": float("nan")}, start_at=self.start)
+            backend.branch({"x": 2**70}, start_at=self.end - datetime.timedelta(1))
+            expected = [repr(branch.data) for branch in backend._contract]
+        with file(filename, method="journal") as backend:
+            self.assertEqual(
+                expected, [repr(branch.data) for branch in backend._contract]
+            )
+
+    def test_file_json(self):
+        with file() as backend:
+            backend.init(start_at=self.start, end_at=self.end, data={"key": 0})
+            self.amend(backend, 10)
+            expected = self.state(backend._contract)
+            filename = backend._contract.uuid
+
+        with file(filename) as backend:
+            self.assertEqual(expected, self.state(backend._contract))
+            self.amend(backend, 20)
+            expected = self.state(backend._contract)
+
+    def test_file_dedupe(self):
+        with file(dedupe=True) as backend:
+            backend.init(start_at=self.start, end_at=self.end, data={"key": 0})
+            self.amend(backend, 10)
+            self.amend(backend, 30)
+            backend.branch(
+                start_at=self.start + datetime.timedelta(days=35), data={"key": 10}
+            )
+            expected = self.state(backend._contract)
+            filename = backend._contract.uuid
+
+        with open(filename) as f:
+            self.assertEqual(3, len(json.load(f)["data"]))
+
+        with file(filename, dedupe=True) as backend:
+            self.assertEqual(expected, self.state(backend._contract))
+
+    def test_file_dump(self):
+        filenames = []
+        for key in range(3):
+            with file() as backend:
+                backend.init(start_at=self.start, end_at=self.end, data={"key": key})
+                self.amend(backend, 10)
+                filenames.append(backend._filename)
+
+        with open("dump.ndjson", "w") as f:
+            for filename in filenames:
+                with open(filename) as g:
+                    f.write(g.read() + "\n")
+
+        with open("dump.ndjson") as f:
+            self.assertEqual(
+                [str(filename) for filename in filenames],
+                [contract.uuid for contract in load(f)],
+            )
+
+    def test_file_pickle(self):
+        with file(method="pickle") as backend:
+            backend.init(start_at=self.start, end_at=self.end, data={"key": 0})
+            self.amend(backend, 10)
+            filename = backend._contract.uuid
+
+        with file(filename, method="pickle") as backend:
+            self.amend(backend, 20)
+            expected = self.state(backend._contract)
+
+        with file(filename, method="pickle") as backend:
+            self.assertEqual(expected, self.state(backend._contract))
+
+    def test_file_journal(self):
+        with file(method="journal") as backend:
+            backend.init(start_at=self.start, end_at=self.end, data={"key": 0})
+            self.amend(backend, 10)
+            filename = backend._contract.uuid
+
+        with open(filename) as f:
+            snapshot = f.read()
+
+        for days in (20, 30, 25):
+            with file(filename, method="journal") as backend:
+                self.amend(backend, days)
+                expected = self.state(backend._contract)
+
+        # Only the journal grows, one record per amendment.
+        with open(filename) as f:
+            self.assertEqual(snapshot, f.read())
+        with open(filename + ".journal") as f:
+            self.assertEqual(3, len(f.readlines()))
+
+        with file(filename, method="journal") as backend:
+            self.assertEqual(expected, self.state(backend._contract))
+            self.assertEqual(
+                {"key": 25},
+                backend._contract.get_branch(
+                    at=self.start + datetime.timedelta(days=30)
+                ).data,
+            )
+
+    def test_file_journal_compaction(self):
+        with file(method="journal", compact_every=2) as backend:
+            backend.init(start_at=self.start, end_at=self.end, data={"key": 0})
+            filename = backend._contract.uuid
+
+            for days in (10, 20, 30, 40):
+                self.amend(backend, days)
+            expected = self.state(backend._contract)
+
+        with open(filename + ".journal") as f:
+            self.assertEqual(1, len(f.readlines()))
+
+        with file(filename, method="json") as backend:
+            self.assertNotEqual(expected, self.state(backend._contract))
+
+        with file(filename, method="journal") as backend:
+            self.assertEqual(expected, self.state(backend._contract))
+
+            # Replaying records already in the snapshot changes nothing.
+            with open(filename + ".journal") as f:
+                record = f.read()
+            backend._compact()
+            with open(filename + ".journal", "w") as f:
+                f.write(record)
+
+        with file(filename, method="journal") as backend:
+            self.assertEqual(expected, self.state(backend._contract))
+
+    def test_file_journal_compact(self):
+        with file(method="journal") as backend:
+            backend.init(start_at=self.start, end_at=self.end, data={"key": 0})
+            filename = backend._contract.uuid
+            for days in (10, 20):
+                self.amend(backend, days)
+
+        with file(filename, method="journal") as backend:
+            self.amend(backend, 15)
+            backend._contract.compact()
+            expected = self.state(backend._contract)
+
+        # Written as a new snapshot.
+        with open(filename + ".journal") as f:
+            self.assertEqual("", f.read())
+        with file(filename, method="json") as backend:
+            self.assertEqual(expected, self.state(backend._contract))
+
+        # Records made before compaction are not replayed on top of it.
+        with file(filename, method="journal") as backend:
+            with open(filename) as f:
+                snapshot = f.read()
+            self.amend(backend, 30)
+        with open(filename + ".journal") as f:
+            record = f.read()
+        with open(filename, "w") as f:
+            f.write(snapshot)
+
+        with file(filename, method="journal") as backend:
+            self.amend(backend, 25)
+            backend._contract.compact()
+            backend._replace(to_json(backend._contract).encode())
+            expected = self.state(backend._contract)
+        with open(filename + ".journal", "w") as f:
+            f.write(record)
+
+        with file(filename, method="journal") as backend:
+            self.assertEqual(expected, self.state(backend._contract))
+
+    def test_file_journal_retry(self):
+        with file(method="journal") as backend:
+            backend.init(start_at=self.start, end_at=self.end, data={"key": 0})
+            filename = backend._contract.uuid
+
+        with file(filename, method="journal") as backend:
+            self.amend(backend, 10)
+            with mock.patch("builtins.open", side_effect=OSError("disk full")):
+                with self.assertRaisesRegex(OSError, r"disk full"):
+                    self.amend(backend, 20)
+
+            # Changes that failed to be written are sent again.
+            self.amend(backend, 30)
+            expected = self.state(backend._contract)
+        with file(filename, method="journal") as backend:
+            self.assertEqual(expected, self.state(backend._contract))
+
+    def test_file_binary(self):
+        with file(method="binary") as backend:
+            backend.init(start_at=self.start, end_at=self.end, data={"key": 0})
+            self.amend(backend, 10)
+            filename = backend._contract.uuid
+
+        with file(filename, method="binary") as backend:
+            self.amend(backend, 20)
+            expected = self.state(backend._contract)
+
+        with file(filename, method="binary") as backend:
+            self.assertEqual(expected, self.state(backend._contract))
+
+        with mapped(filename) as view:
+            self.assertEqual(
+                {"key": 20},
+                view.get_branch(at=self.start + datetime.timedelta(days=25)).data,
+            )
+
+    def test_file_lock(self):
+        with file() as backend:
+            backend.init(start_at=self.start, end_at=self.end, data={"key": 0})
+            filename = backend._contract.uuid
+
+        amended, states = threading.Event(), []
+
+        def amend(days):
+            with file(filename) as backend:
+                self.amend(backend, days)
+                amended.set()
+                states.append(self.state(backend._contract))
+
+        def read():
+            with file(filename) as backend:
+                states.append(len(backend._contract))
+
+        with file(filename) as backend:
+            self.amend(backend, 10)
+            thread = threading.Thread(target=amend, args=(20,))
+            thread.start()
+            # The other writer, which loaded the file before this one wrote
+            # it, waits for this one to be done.
+            self.assertFalse(amended.wait(0.2))
+            # Sessions that only read don't wait.
+            reader = threading.Thread(target=read)
+            reader.start()
+            reader.join(5)
+            self.assertFalse(reader.is_alive())
+            self.assertEqual([1], states)
+            expected = [branch.uuid for branch in backend._contract]
+        thread.join()
+
+        # The other writer amended the contract written by this one.
+        self.assertEqual(expected, [uuid for uuid, *_ in states[1]][: len(expected)])
+        with file(filename) as backend:
+            self.assertEqual(states[1], self.state(backend._contract))
+        self.assertEqual(
+            sorted([filename, filename + ".lock"]), sorted(os.listdir("."))
+        )
+
+        # Sessions on the same file can be nested.
+        def nest():
+            with file(filename) as first:
+                self.amend(first, 30)
+                with file(filename) as second:
+                    self.amend(second, 40)
+
+        thread = threading.Thread(target=nest, daemon=True)
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+        # The lock is released when loading fails.
+        import fcntl
+
+        with open(filename, "w") as f:
+            f.write("{")
+        with self.assertRaises(ValueError):
+            file(filename).__enter__()
+        with open(filename + ".lock", "ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def test_file_coalesce(self):
+        with file() as backend:
+            backend.init(start_at=self.start, end_at=self.end, data={"key": 0})
+            filename = backend._contract.uuid
+
+        first = file(filename, coalesce=True).__enter__()
+        second = file(filename, coalesce=True).__enter__()
+        for days in range(0, 100, 10):
+            self.amend(first, days)
+        self.amend(second, 200)
+
+        # Each commit writes the file once, on top of the other's changes.
+        replace = FileBackend._replace
+        with mock.patch.object(
+            FileBackend, "_replace", autospec=True, side_effect=replace
+        ) as patched:
+            first.__exit__(None, None, None)
+            second.__exit__(None, None, None)
+        self.assertEqual(2, patched.call_count)
+
+        with file(filename) as backend:
+            self.assertEqual(
+                {0, 200, *range(0, 100, 10)},
+                {
+                    branch.data["key"]
+                    for branch in backend._contract
+                    if "key" in branch.data
+                },
+            )
+
+    def test_async_file(self):
+        async def amend(filename, days):
+            async with afile(filename, method="journal") as backend:
+                self.amend(backend, days)
+            return self.state(backend._contract)
+
+        async def run():
+            async with afile(method="journal") as backend:
+                backend.init(start_at=self.start, end_at=self.end, data={"key": 0})
+                self.amend(backend, 10)
+            filename = backend._contract.uuid
+
+            expected = await amend(filename, 20)
+            expected = await amend(filename, 30)
+            with file(filename, method="journal") as backend:
+                self.assertEqual(expected, self.state(backend._contract))
+
+            # Files are loaded concurrently in the thread pool, amendments are
+            # applied to the latest version under the lock, none is lost.
+            days = range(40, 140, 20)
+            states = await asyncio.gather(*(amend(filename, d) for d in days))
+            self.assertEqual(5, len(states))
+            async with afile(filename, method="journal") as backend:
+                self.assertEqual(
+                    {0, 10, 20, 30, *days},
+                    {
+                        backend._contract.resolve(branch)["key"]
+                        for branch in backend._contract
+                    },
+                )
+
+        asyncio.run(run())
+
+        # Asynchronous backends must implement commit.
+        with self.assertRaises(TypeError):
+            AsyncBackend()
+
+    def test_portfolio(self):
+        contracts, filenames = [], []
+        for key in range(5):
+            contract = Contract.init(
+                start_at=self.start, end_at=self.end, data={"key": key}
+            )
+            for days in range(key):
+                contract.branch(
+                    start_at=self.start + datetime.timedelta(days=30 * days),
+                    end_at=self.end + datetime.timedelta(days=days),
+                    data={"key": days},
+                )
+            with file() as backend:
+                backend._contract = contract
+                backend._filename = contract.uuid
+            contracts.append(contract)
+            filenames.append(contract.uuid)
+
+        points = [self.start + datetime.timedelta(days=d) for d in range(-1, 400, 9)]
+        self.assertEqual(
+            [
+                (contract.uuid, contract.get_branches(at=points, resolve=True))
+                for contract in contracts
+            ],
+            list(
+                portfolio.evaluate(
+                    filenames, portfolio.EffectiveData(points), processes=2, chunksize=2
+                )
+            ),
+        )
+        self.assertEqual(
+            sum(map(portfolio.active_span, contracts), datetime.timedelta()),
+            portfolio.total_span(filenames, processes=2),
+        )
+        self.assertEqual(
+            datetime.timedelta(days=365 + 3), portfolio.active_span(contracts[4])
+        )
+
+
+@unittest.skipUnless(importlib.util.find_spec("mongomock"), "requires mongomock")
+class TestMongoBackend(unittest.TestCase):
+    def setUp(self) -> None:
+        import mongomock
+
+        self.start = datetime.datetime(2022, 10, 10, tzinfo=utc)
+        self.end = self.start + datetime.timedelta(days=365)
+        self.collection = mongomock.MongoClient().db.contracts
+
+    def amend(self, backend, days):
+        backend.branch(
+            start_at=self.start + datetime.timedelta(days=days),
+            end_at=self.start + datetime.timedelta(days=days + 10),
+            data={"key": days},
+        )
+
+    def stored(self, backend, uuid):
+        document = self.collection.find_one({"uuid": uuid}, {"_id": False})
+        self.assertEqual(backend._versions[uuid], document.pop("version"))
+        return document
+
+    def test_commit(self):
+        from pcontract.backends.mongo import mongo
+
+        backend = mongo(self.collection)
+        backend.init(start_at=self.start, end_at=self.end, data={"key": 0})
+        self.amend(backend, 10)
+        backend.commit()
+        uuid = backend._contract.uuid
+        self.assertEqual(
+            json.loads(to_json(backend._contract)), self.stored(backend, uuid)
+        )
+
+        backend = mongo(self.collection)
+        backend.set_contract(uuid)
+        for days in (5, 30, 100):
+            self.amend(backend, days)
+            backend.commit()
+        self.assertEqual(
+            json.loads(to_json(backend._contract)), self.stored(backend, uuid)
+        )
+
+        # Nothing changed, nothing is sent.
+        version = backend._versions[uuid]
+        backend.commit()
+        self.assertEqual(version, backend._versions[uuid])
+        self.stored(backend, uuid)
+
+    def test_commit_conflict(self):
+        from pcontract.backends.mongo import ConflictError, mongo
+
+        backend = mongo(self.collection)
+        backend.init(start_at=self.start, end_at=self.end, data={"key": 0})
+        backend.commit()
+        uuid = backend._contract.uuid
+
+        first, second = mongo(self.collection), mongo(self.collection)
+        first.set_contract(uuid)
+        second.set_contract(uuid)
+        self.amend(first, 10)
+        first.commit()
+        self.amend(second, 20)
+        with self.assertRaisesRegex(ConflictError, uuid):
+            second.commit()
+
+        second.set_contract(uuid)
+        self.amend(second, 20)
+        second.commit()
+        self.assertEqual(
+            json.loads(to_json(second._contract)), self.stored(second, uuid)
+        )
+
+    def test_commit_unversioned(self):
+        from pcontract.backends.mongo import mongo
+
+        contract = Contract.init(start_at=self.start, end_at=self.end, data={"key": 0})
+        self.collection.insert_one(json.loads(to_json(contract)))
+
+        backend = mongo(self.collection)
+        backend.set_contract(contract.uuid)
+        self.assertIsNone(backend._versions[contract.uuid])
+        self.amend(backend, 10)
+        backend.commit()
+        self.assertEqual(
+            json.loads(to_json(backend._contract)), self.stored(backend, contract.uuid)
+        )
+
+    def test_commit_failed(self):
+        from pcontract.backends.mongo import mongo
+
+        backend = mongo(self.collection)
+        backend.init(start_at=self.start, end_at=self.end, data={"key": 0})
+        backend.commit()
+        uuid = backend._contract.uuid
+
+        # Changes are kept when the write fails, and sent on the next one.
+        self.amend(backend, 10)
+        with mock.patch.object(
+            self.collection, "bulk_write", side_effect=OSError("network")
+        ):
+            with self.assertRaises(OSError):
+                backend.commit()
+        self.amend(backend, 20)
+        backend.commit()
+        self.assertEqual(
+            json.loads(to_json(backend._contract)), self.stored(backend, uuid)
+        )
+
+    def test_commit_existing(self):
+        from pcontract.backends.mongo import ConflictError, mongo
+
+        # A contract stored by another writer, but not loaded, is not
+        # stored twice nor overwritten.
+        contract = Contract.init(start_at=self.start, end_at=self.end, data={"key": 0})
+        mongo(self.collection).commit_many([contract])
+        copy = from_json(to_json(contract))
+        copy.branch(
+            start_at=self.start + datetime.timedelta(days=10),
+            end_at=self.start + datetime.timedelta(days=20),
+            data={"key": 10},
+        )
+        backend = mongo(self.collection)
+        with self.assertRaisesRegex(ConflictError, contract.uuid):
+            backend.commit_many([copy])
+        self.assertEqual(1, self.collection.count_documents({"uuid": contract.uuid}))
+        document = self.collection.find_one({"uuid": contract.uuid}, {"_id": False})
+        document.pop("version")
+        self.assertEqual(json.loads(to_json(contract)), document)
+
+    def test_many(self):
+        from pcontract.backends.mongo import ConflictError, mongo
+
+        backend = mongo(self.collection)
+        contracts = [
+            Contract.init(start_at=self.start, end_at=self.end, data={"key": key})
+            for key in range(5)
+        ]
+        backend.commit_many(contracts)
+        uuids = [contract.uuid for contract in contracts]
+
+        loaded = {
+            contract.uuid: contract
+            for contract in backend.load_many(uuids + ["unknown"], batch_size=2)
+        }
+        self.assertEqual(set(uuids), set(loaded))
+        for contract in contracts:
+            self.assertEqual(
+                json.loads(to_json(contract)),
+                json.loads(to_json(loaded[contract.uuid])),
+            )
+
+        # Another writer changes the second contract meanwhile.
+        other = mongo(self.collection)
+        other.set_contract(uuids[1])
+        self.amend(other, 30)
+        other.commit()
+
+        for contract in loaded.values():
+            contract.branch(
+                start_at=self.start + datetime.timedelta(days=10),
+                end_at=self.start + datetime.timedelta(days=20),
+                data={"key": 10},
+            )
+        with self.assertRaisesRegex(ConflictError, uuids[1]):
+            backend.commit_many(loaded.values())
+
+        for uid in uuids:
+            writer = other if uid == uuids[1] else backend
+            contract = other._contract if uid == uuids[1] else loaded[uid]
+            self.assertEqual(json.loads(to_json(contract)), self.stored(writer, uid))
+
+    def test_compact(self):
+        from pcontract.backends.mongo import mongo
+
+        timeline = self.collection.database.timeline
+        backend = mongo(self.collection, timeline)
+        backend.init(start_at=self.start, end_at=self.end, data={"key": 0})
+        for days in (10, 15, 100):
+            self.amend(backend, days)
+        backend.commit()
+        uuid = backend._contract.uuid
+
+        backend = mongo(self.collection, timeline)
+        backend.set_contract(uuid)
+        self.amend(backend, 12)
+        backend._contract.compact()
+        backend.commit()
+        self.assertEqual(
+            json.loads(to_json(backend._contract)), self.stored(backend, uuid)
+        )
+
+        for day in range(-1, 400, 3):
+            at = self.start + datetime.timedelta(days=day, hours=12)
+            branch = backend._contract.get_branch(at=at)
+            self.assertEqual(
+                backend._contract.resolve(branch) if branch is not None else None,
+                backend.get_data(uuid, at=at),
+            )
+
+    def test_timeline(self):
+        from pcontract.backends.mongo import mongo
+
+        timeline = self.collection.database.timeline
+        backend = mongo(self.collection, timeline)
+        backend.ensure_indexes()
+
+        contracts = [
+            Contract.init(start_at=self.start, end_at=self.end, data={"key": key})
+            for key in range(3)
+        ]
+        backend.commit_many(contracts[:2])
+        for days in (10, 15, 100, 365, 370):
+            backend.set_contract(contracts[0].uuid)
+            self.amend(backend, days)
+            backend.commit()
+        contracts[0] = backend._contract
+
+        # Stored before there was a timeline.
+        self.collection.insert_one(json.loads(to_json(contracts[2])))
+        self.assertNotIn(contracts[2].uuid, backend.get_data_many(at=self.start))
+        backend.reindex(contracts)
+
+        for day in range(-1, 400, 3):
+            at = self.start + datetime.timedelta(days=day, hours=12)
+            expected = {}
+            for contract in contracts:
+                branch = contract.get_branch(at=at)
+                data = contract.resolve(branch) if branch is not None else None
+                self.assertEqual(data, backend.get_data(contract.uuid, at=at))
+                if data is not None:
+                    expected[contract.uuid] = data
+
+            self.assertEqual(expected, backend.get_data_many(at=at))
+            self.assertEqual(
+                {
+                    uuid: data
+                    for uuid, data in expected.items()
+                    if uuid != contracts[1].uuid
+                },
+                backend.get_data_many(
+                    at=at, uuids=[contracts[0].uuid, contracts[2].uuid]
+                ),
+            )
+
+
+@unittest.skipUnless(importlib.util.find_spec("matplotlib"), "requires matplotlib")
+class TestGantt(unittest.TestCase):
+    def setUp(self) -> None:
+        self.start = datetime.datetime(2022, 10, 10, tzinfo=utc)
+        self.contract = Contract.init(
+            start_at=self.start,
+            end_at=self.start + datetime.timedelta(days=365),
+            data={"n": 0},
+        )
+        for days in range(0, 300, 10):
+            self.contract.branch(
+                {"n": days},
+                start_at=self.start + datetime.timedelta(days=days + 5),
+                end_at=self.start + datetime.timedelta(days=days + 8),
+            )
+
+    def test_select(self):
+        from pcontract.gantt import select
+
+        contract = self.contract
+        active = [b for b in contract if not b.replaced_by]
+        self.assertEqual(list(contract), select(contract))
+        self.assertEqual(active, select(contract, active_only=True))
+
+        # Active branches are kept, history sampled to fill the rest.
+        picked = select(contract, limit=len(active) + 5)
+        self.assertEqual(len(active) + 5, len(picked))
+        self.assertEqual(active, [b for b in picked if not b.replaced_by])
+        self.assertEqual(contract[0], picked[0])
+        self.assertEqual(10, len(select(contract, active_only=True, limit=10)))
+
+        contract.pack()
+        self.assertEqual(list(contract), select(contract))
+
+    def test_render(self):
+        from pcontract.gantt import figure
+
+        fig = figure(self.contract)
+        (ax,) = fig.axes
+        self.assertEqual(1, len(ax.collections))
+        self.assertEqual(len(self.contract), len(ax.collections[0].get_paths()))
+
+        png, svg = io.BytesIO(), io.BytesIO()
+        self.contract.gantt(png, format="png", limit=20)
+        self.contract.gantt(svg, format="svg", active_only=True)
+        self.assertTrue(png.getvalue().startswith(b"\x89PNG"))
+        self.assertIn(b"<svg", svg.getvalue())
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "chart.svg")
+            self.contract.gantt(filename)
+            with open(filename, "rb") as f:
+                self.assertIn(b"<svg", f.read())
+
+
+class AsyncCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def batch_size(self, size):
+        self.cursor.batch_size(size)
+        return self
+
+    async def __aiter__(self):
+        for document in self.cursor:
+            await asyncio.sleep(0)
+            yield document
+
+
+class AsyncCollection:
+    # Motor style wrapper around a mongomock collection.
+    def __init__(self, collection):
+        self.collection = collection
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self.collection.find(*args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self.collection, name)
+
+        async def call(*args, **kwargs):
+            await asyncio.sleep(0)
+            return method(*args, **kwargs)
+
+        return call
+
+
+@unittest.skipUnless(importlib.util.find_spec("mongomock"), "requires mongomock")
+class TestAsyncMongoBackend(unittest.TestCase):
+    def setUp(self) -> None:
+        import mongomock
+
+        self.start = datetime.datetime(2022, 10, 10, tzinfo=utc)
+        self.end = self.start + datetime.timedelta(days=365)
+        self.database = mongomock.MongoClient().db
+
+    def test_async_mongo(self):
+        from pcontract.backends.mongo import ConflictError, amongo, mongo
+
+        collection = AsyncCollection(self.database.contracts)
+        timeline = AsyncCollection(self.database.timeline)
+        at = self.start + datetime.timedelta(days=15)
+
+        async def amend(uuid, key):
+            async with amongo(collection, timeline) as backend:
+                await backend.set_contract(uuid)
+                backend.branch(
+                    start_at=self.start + datetime.timedelta(days=10),
+                    end_at=self.start + datetime.timedelta(days=20),
+                    data={"key": key},
+                )
+
+        async def run():
+            backend = amongo(collection, timeline)
+            await backend.ensure_indexes()
+            contracts = [
+                Contract.init(start_at=self.start, end_at=self.end, data={"key": key})
+                for key in range(10)
+            ]
+            await backend.commit_many(contracts)
+            uuids = [contract.uuid for contract in contracts]
+
+            loaded = await asyncio.gather(*(backend.load(uuid) for uuid in uuids))
+            self.assertEqual(uuids, [contract.uuid for contract in loaded])
+            self.assertEqual(
+                set(uuids),
+                {contract.uuid async for contract in backend.load_many(uuids)},
+            )
+
+            await asyncio.gather(*(amend(uuid, 100) for uuid in uuids))
+            self.assertEqual(
+                {uuid: {"key": 100} for uuid in uuids},
+                await backend.get_data_many(at=at),
+            )
+            self.assertEqual(
+                {"key": 0}, await backend.get_data(uuids[0], at=self.start)
+            )
+
+            # Contracts were modified since they were loaded above.
+            for contract in loaded:
+                contract.branch(start_at=self.start, end_at=self.end, data={"key": 200})
+            with self.assertRaises(ConflictError):
+                await backend.commit_many(loaded)
+
+            blocking = mongo(self.database.contracts, self.database.timeline)
+            self.assertEqual({"key": 100}, blocking.get_data(uuids[0], at=at))
+
+        asyncio.run(run())